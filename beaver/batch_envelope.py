@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Envelopes of the batch format
+
+The batch format sends one envelope per batch instead of one event per
+line. An envelope holds the event fields shared by every line of the
+batch once, and the messages and timestamps of its lines:
+
+    {
+        "envelope": "beaver-batch",
+        "version": 1,
+        "message_field": "message",
+        "event": {"host": "...", "file": "...", "type": "...", ...},
+        "messages": ["first line", "second line"],
+        "timestamps": ["2016-10-10T13:55:36.123Z", "2016-10-10T13:55:36.123Z"]
+    }
+
+Envelopes are encoded as json or msgpack. Receivers expand them back
+into events with expand, or from the command line, turning envelopes
+read one per line on stdin into json events written one per line,
+which logstash reads with the json_lines codec:
+
+    python -m beaver.batch_envelope < envelopes.json
+"""
+import sys
+
+# priority: ujson > simplejson > jsonlib2 > json
+priority = ['ujson', 'simplejson', 'jsonlib2', 'json']
+for mod in priority:
+    try:
+        json = __import__(mod)
+    except ImportError:
+        pass
+    else:
+        break
+
+try:
+    import msgpack
+except ImportError:
+    import msgpack_pure as msgpack
+
+ENVELOPE = 'beaver-batch'
+VERSION = 1
+
+
+def encode(event, messages, timestamps, message_field='message', encoding='json'):
+    """Returns the envelope of a batch, encoded as json or msgpack"""
+    envelope = {
+        'envelope': ENVELOPE,
+        'version': VERSION,
+        'message_field': message_field,
+        'event': event,
+        'messages': messages,
+        'timestamps': timestamps,
+    }
+
+    if encoding == 'msgpack':
+        return msgpack.packb(envelope)
+    return json.dumps(envelope)
+
+
+def decode(payload):
+    """Returns the envelope of an encoded batch, guessing its encoding"""
+    if payload.lstrip()[:1] == '{':
+        envelope = json.loads(payload)
+    else:
+        envelope = msgpack.unpackb(payload)
+
+    if not isinstance(envelope, dict) or envelope.get('envelope') != ENVELOPE:
+        raise ValueError('Not a batch envelope')
+    if envelope.get('version') != VERSION:
+        raise ValueError('Unsupported batch envelope version {0}'.format(envelope.get('version')))
+
+    return envelope
+
+
+def expand(payload):
+    """Returns the events of an encoded batch"""
+    envelope = decode(payload)
+    message_field = envelope['message_field']
+
+    events = []
+    for message, timestamp in zip(envelope['messages'], envelope['timestamps']):
+        event = dict(envelope['event'])
+        event[message_field] = message
+        event['@timestamp'] = timestamp
+        events.append(event)
+
+    return events
+
+
+def main(stdin=sys.stdin, stdout=sys.stdout):
+    for line in stdin:
+        if not line.strip():
+            continue
+
+        for event in expand(line):
+            stdout.write(json.dumps(event) + '\n')
+
+
+if __name__ == '__main__':
+    main()
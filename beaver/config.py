@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import copy
 import logging
 import os
 import re
@@ -49,7 +50,10 @@ class BeaverConfig():
             'tail_lines': '0',
             'type': '',
             # Redis specific namespace
-            'redis_namespace': ''
+            'redis_namespace': '',
+
+            # transport for the files of a section, instead of the main one
+            'transport': ''
         }
 
         self._main_defaults = {
@@ -71,6 +75,8 @@ class BeaverConfig():
             'kafka_batch_n': os.environ.get('KAFKA_BATCH_N', 10),
             'kafka_batch_t': os.environ.get('KAFKA_BATCH_T', 10),
             'kafka_round_robin': os.environ.get('KAFKA_ROUND_ROBIN', False),
+            'kafka_key_by': os.environ.get('KAFKA_KEY_BY', ''),
+            'kafka_batch_max_bytes': os.environ.get('KAFKA_BATCH_MAX_BYTES', 1000000),
             'mqtt_clientid': 'paho',
             'mqtt_host': 'localhost',
             'mqtt_port': '1883',
@@ -99,6 +105,12 @@ class BeaverConfig():
             'redis_namespace': os.environ.get('REDIS_NAMESPACE', 'logstash:beaver'),
             'redis_data_type': os.environ.get('REDIS_DATA_TYPE', 'list'),
             'redis_password': '',
+            'redis_rpush_max_values': '1000',
+            'redis_rpush_max_bytes': '1048576',
+            'redis_split_lines': '1000',
+            'redis_stream_field': 'message',
+            'redis_stream_entry': 'line',
+            'redis_stream_maxlen': '0',
             'sns_aws_access_key': '',
             'sns_aws_secret_key': '',
             'sns_aws_profile_name': '',
@@ -116,13 +128,35 @@ class BeaverConfig():
             'kinesis_aws_region': 'us-east-1', 
             'kinesis_aws_stream': '', 
             'kinesis_aws_batch_size_max': '512000',
+            'elasticsearch_url': 'http://localhost:9200',
+            'elasticsearch_index': 'logstash-%Y.%m.%d',
+            'elasticsearch_doc_type': '',
+            'elasticsearch_max_body_bytes': '5242880',
+            'elasticsearch_timeout': '30',
+            'http_url': '',
+            'http_bulk': '0',
+            'http_max_body_bytes': '5242880',
+            'http_timeout': '30',
+            'http_max_in_flight': '1',
+            'lumberjack_host': '127.0.0.1',
+            'lumberjack_port': '5044',
+            'lumberjack_window_size': '1024',
+            'lumberjack_max_windows': '2',
+            'lumberjack_compression_level': '6',
+            'lumberjack_timeout': '30',
+            'lumberjack_ssl_enabled': '0',
+            'lumberjack_ssl_cacert': '',
+            'lumberjack_ssl_cert': '',
+            'lumberjack_ssl_key': '',
             'tcp_host': '127.0.0.1',
             'tcp_port': '9999',
+            'tcp_balance': 'round_robin',
             'tcp_ssl_enabled': '0',
             'tcp_ssl_verify': '0',
             'tcp_ssl_cacert': '',
             'tcp_ssl_cert': '',
             'tcp_ssl_key':'',
+            'tcp_sndbuf': '0',
             'udp_host': os.environ.get('UDP_HOST', '127.0.0.1'),
             'udp_port': os.environ.get('UDP_PORT', '9999'),
             'zeromq_address': os.environ.get('ZEROMQ_ADDRESS', 'tcp://localhost:2120'),
@@ -134,13 +168,50 @@ class BeaverConfig():
             'stomp_password' : None,
             'stomp_queue' : 'queue/logstash',
 
+            # max number of batches being sent at the same time by a queue consumer
+            'transport_max_in_flight': '1',
+
+            # ordered transports tried by the chain transport
+            'transport_chain': '',
+
+            # max number of batches queued for each transport of a transport list
+            'fanout_queue_size': '100',
+
+            # codec batches are compressed with by stream transports, and its level
+            'compression': '',
+            'compression_level': '',
+
+            # encoding of the envelopes of the batch format, json or msgpack
+            'batch_encoding': 'json',
+
+            # send rawjson messages as they are, adding the missing event fields
+            'rawjson_passthrough': '0',
+
+            # seconds between transport counter log lines, 0 to disable
+            'stats_interval': '60',
+
             # exponential backoff
             'respawn_delay': '3',
             'max_failure': '7',
 
+            # directory batches are stored in while the transport is reconnecting
+            'spool_path': '',
+            'spool_max_bytes': '0',
+
+            # run tailing and queue consumers as separate processes or as
+            # threads of a single process
+            'pipeline_mode': 'processes',
+
             # consumer processes
             'number_of_consumer_processes': '1',
 
+            # batch field used to pick the consumer of a batch, keeping batches
+            # with the same key in order
+            'consumer_partition_key': 'filename',
+
+            # let idle consumers take batches from other consumer partitions
+            'consumer_work_stealing': '0',
+
             # interprocess queue max size before puts block
             'max_queue_size': '100',
 
@@ -157,6 +228,11 @@ class BeaverConfig():
             # time in seconds to wait on queue.get() block before raising Queue.Empty exception
             'wait_timeout': '5',
 
+            # max number of batches and bytes of lines a queue consumer takes
+            # from the queue per wakeup
+            'queue_drain_batches': '64',
+            'queue_drain_bytes': '1048576',
+
             # path to sincedb sqlite db
             'sincedb_path': '',
 
@@ -221,6 +297,42 @@ class BeaverConfig():
     def get_field(self, field, filename):
         return self._files.get(os.path.realpath(filename), self._section_defaults)[field]
 
+    def get_transports(self):
+        """Returns the main transport, followed by the other transports
+        set in file sections"""
+        main = self.get('transport')
+        transports = set()
+        for config in self._file_config.values():
+            if config.get('transport') and config.get('transport') != main:
+                transports.add(config.get('transport'))
+
+        return [main] + sorted(transports)
+
+    def get_formats(self, transport):
+        """Returns the formats of the lines a transport sends: the main
+        format when the main transport uses it, and the formats of the
+        file sections sending to it"""
+        main = self.get('transport') or ''
+        used = [name.strip() for name in (main + ',' + (self.get('transport_chain') or '')).split(',')]
+
+        formats = set()
+        if transport in used:
+            formats.add(self.get('format'))
+        for config in self._file_config.values():
+            section = config.get('transport')
+            if section == transport or (not section and transport in used):
+                formats.add(config.get('format') or self.get('format'))
+
+        return sorted(formats)
+
+    def copy(self):
+        """Returns a copy whose glob updates leave this config unchanged"""
+        config = copy.copy(self)
+        config._beaver_config = dict(self._beaver_config)
+        config._files = dict(self._files)
+        config._globbed = list(self._globbed)
+        return config
+
     def addglob(self, globname, globbed):
         if globname not in self._globbed:
             self._logger.debug('Adding glob {0}'.format(globname))
@@ -233,7 +345,16 @@ class BeaverConfig():
 
         for filename in globbed:
             self._files[filename] = config
-        self._globbed.append(globname)
+
+        if globname not in self._globbed:
+            self._globbed.append(globname)
+
+    def delglob(self, globname, globbed):
+        config = self._file_config.get(globname)
+        for filename in globbed:
+            # the file may still be matched by another glob
+            if self._files.get(filename) is config:
+                del self._files[filename]
 
     def getfilepaths(self):
         return self._files.keys()
@@ -320,7 +441,9 @@ class BeaverConfig():
                     config[key] = None
 
             require_bool = ['debug', 'daemonize', 'fqdn', 'rabbitmq_exchange_durable', 'rabbitmq_queue_durable',
-                            'rabbitmq_ha_queue', 'rabbitmq_ssl', 'tcp_ssl_enabled', 'tcp_ssl_verify']
+                            'rabbitmq_ha_queue', 'rabbitmq_ssl', 'tcp_ssl_enabled', 'tcp_ssl_verify',
+                            'lumberjack_ssl_enabled', 'http_bulk', 'consumer_work_stealing',
+                            'rawjson_passthrough']
 
             for key in require_bool:
                 config[key] = bool(int(config[key]))
@@ -332,16 +455,39 @@ class BeaverConfig():
                 'rabbitmq_port',
                 'rabbitmq_timeout',
                 'rabbitmq_delivery_mode',
+                'redis_rpush_max_values',
+                'redis_rpush_max_bytes',
+                'redis_split_lines',
+                'redis_stream_maxlen',
                 'respawn_delay',
                 'subprocess_poll_sleep',
                 'refresh_worker_process',
                 'tcp_port',
+                'tcp_sndbuf',
+                'elasticsearch_max_body_bytes',
+                'elasticsearch_timeout',
+                'http_max_body_bytes',
+                'http_timeout',
+                'http_max_in_flight',
+                'lumberjack_port',
+                'lumberjack_window_size',
+                'lumberjack_max_windows',
+                'lumberjack_compression_level',
+                'lumberjack_timeout',
                 'udp_port',
                 'wait_timeout',
+                'queue_drain_batches',
+                'queue_drain_bytes',
+                'transport_max_in_flight',
+                'spool_max_bytes',
+                'stats_interval',
+                'fanout_queue_size',
+                'compression_level',
                 'zeromq_hwm',
                 'logstash_version',
                 'kafka_batch_n',
                 'kafka_batch_t',
+                'kafka_batch_max_bytes',
                 'kafka_ack_timeout',
                 'number_of_consumer_processes',
                 'ignore_old_files',
@@ -366,6 +512,18 @@ class BeaverConfig():
             if config.get('format') == 'null':
                 config['format'] = 'raw'
 
+            if config.get('compression') not in [None, '', 'zlib', 'gzip', 'lz4', 'zstd']:
+                raise LookupError('Invalid compression {0}'.format(config.get('compression')))
+
+            if config.get('batch_encoding') not in ['json', 'msgpack']:
+                raise LookupError('Invalid batch_encoding {0}'.format(config.get('batch_encoding')))
+
+            if config.get('tcp_balance') not in ['round_robin', 'least_in_flight']:
+                raise LookupError('Invalid tcp_balance {0}'.format(config.get('tcp_balance')))
+
+            if config.get('pipeline_mode') not in ['processes', 'threads']:
+                raise LookupError('Invalid pipeline_mode {0}'.format(config.get('pipeline_mode')))
+
             if config['files'] is not None and type(config['files']) == str:
                 config['files'] = config['files'].split(',')
 
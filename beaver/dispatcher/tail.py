@@ -3,9 +3,11 @@ import multiprocessing
 import Queue
 import signal
 import os
+import threading
 import time
 
 from beaver.config import BeaverConfig
+from beaver.partitioned_queue import PartitionedQueue, TransportRouter
 from beaver.run_queue import run_queue
 from beaver.ssh_tunnel import create_ssh_tunnel
 from beaver.utils import REOPEN_FILES, setup_custom_logger
@@ -22,7 +24,18 @@ def run(args=None):
     if beaver_config.get('logstash_version') not in [0, 1]:
         raise LookupError("Invalid logstash_version")
 
-    queue = multiprocessing.JoinableQueue(beaver_config.get('max_queue_size'))
+    # every transport gets number_of_consumer_processes consumers
+    transports = beaver_config.get_transports()
+    threaded = beaver_config.get('pipeline_mode') == 'threads'
+    queue = PartitionedQueue(
+        beaver_config.get('number_of_consumer_processes') * len(transports),
+        maxsize=beaver_config.get('max_queue_size'),
+        key=beaver_config.get('consumer_partition_key'),
+        work_stealing=beaver_config.get('consumer_work_stealing'),
+        threaded=threaded,
+        groups=len(transports),
+        router=TransportRouter(beaver_config, transports)
+    )
 
     manager_proc = None
     ssh_tunnel = create_ssh_tunnel(beaver_config, logger=logger)
@@ -65,11 +78,21 @@ def run(args=None):
     signal.signal(signal.SIGINT, cleanup)
     signal.signal(signal.SIGQUIT, cleanup)
 
-    def create_queue_consumer():
-        process_args = (queue, beaver_config, logger)
-        proc = multiprocessing.Process(target=run_queue, args=process_args)
+    def create_queue_consumer(index=0):
+        consumer_config = beaver_config
+        if threaded:
+            # the tail manager updates its config as soon as globs change,
+            # consumers apply the updates in order with their batches
+            consumer_config = beaver_config.copy()
+
+        process_args = (queue.consumer(index), consumer_config, logger, transports[queue.group(index)])
+        if threaded:
+            proc = threading.Thread(target=run_queue, args=process_args)
+            proc.daemon = True
+        else:
+            proc = multiprocessing.Process(target=run_queue, args=process_args)
 
-        logger.info("Starting queue consumer")
+        logger.info("Starting queue consumer for the {0} transport".format(transports[queue.group(index)]))
         proc.start()
         return proc
 
@@ -77,17 +100,31 @@ def run(args=None):
         manager = TailManager(
             beaver_config=beaver_config,
             queue_consumer_function=create_queue_consumer,
+            number_of_consumers=len(queue),
             callback=queue_put,
             logger=logger
         )
         manager.run()
 
-    while 1:
+    if REOPEN_FILES:
+        logger.debug("Detected non-linux platform. Files will be reopened for tailing")
+
+    if threaded:
+        if beaver_config.get('refresh_worker_process'):
+            logger.warning('refresh_worker_process is not supported when pipeline_mode is threads')
 
+        # tailing runs in this process, until TailManager catches a SIGTERM
+        logger.info('Working...')
         try:
+            create_queue_producer()
+        except KeyboardInterrupt:
+            pass
 
-            if REOPEN_FILES:
-                logger.debug("Detected non-linux platform. Files will be reopened for tailing")
+        return cleanup(signal.SIGTERM, None)
+
+    while 1:
+
+        try:
 
             t = time.time()
             while True:
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import Queue
+import threading
+import time
+import zlib
+
+# control commands that must be applied in order with the batches
+SEQUENCED_COMMANDS = ('addglob', 'delglob')
+
+
+class PartitionedQueue(object):
+    """Splits the interprocess queue into one partition per queue consumer
+
+    Batches are routed to a partition by hashing a key taken from the
+    batch (the filename by default), so every batch read from a given
+    file is handled by the same consumer, in the order it was read.
+
+    Control commands (glob updates, exit) travel on a separate unbounded
+    channel per consumer and are broadcast to every consumer. Glob updates
+    are numbered, and each batch carries the number of the last update
+    sent before it, so consumers apply them in order with the batches.
+
+    Partitions can be split into groups of consumers, each sending to its
+    own transport. router picks the group of a batch, and consumers only
+    ever take batches from partitions of their own group.
+    """
+
+    def __init__(self, partitions, maxsize=0, key='filename', work_stealing=False, threaded=False, groups=1, router=None):
+        if partitions % groups:
+            raise ValueError('{0} partitions cannot be split into {1} groups'.format(partitions, groups))
+
+        self._group_size = partitions // groups
+        self._key = key
+        self._router = router
+
+        # consumer threads share the producer's memory, so batches
+        # can be handed over in-process without pickling
+        if threaded:
+            queue_class, control_class, lock_class = Queue.Queue, Queue.Queue, threading.Lock
+        else:
+            queue_class, control_class, lock_class = multiprocessing.JoinableQueue, multiprocessing.Queue, multiprocessing.Lock
+
+        self._partitions = [queue_class(maxsize) for n in range(partitions)]
+        self._control = [control_class() for n in range(partitions)]
+
+        # shared, so that a restarted producer process numbers its glob
+        # updates after the ones of the previous one
+        self._sequence = multiprocessing.RawValue('L', 0)
+
+        # one lock per partition, held by whichever consumer is
+        # currently processing a batch from that partition
+        self._locks = None
+        if work_stealing:
+            self._locks = [lock_class() for n in range(partitions)]
+
+    def __len__(self):
+        return len(self._partitions)
+
+    def consumer(self, index):
+        """Returns the queue a given consumer should read from"""
+        start = index - index % self._group_size
+        end = start + self._group_size
+
+        locks = None
+        if self._locks is not None:
+            locks = self._locks[start:end]
+
+        return ConsumerQueue(self._partitions[start:end], self._control[index], index - start, locks=locks,
+                             sequence=self._sequence.value, partition=index)
+
+    def group(self, index):
+        """Returns the group of a given consumer"""
+        return index // self._group_size
+
+    def partition(self, data):
+        """Returns the partition index for a batch"""
+        start = 0
+        if self._router is not None:
+            start = self._router(data) * self._group_size
+
+        if self._group_size == 1:
+            return start
+
+        key = data.get(self._key)
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+
+        return start + (zlib.crc32(str(key)) & 0xffffffff) % self._group_size
+
+    def broadcast(self, item):
+        """Sends a control command to every consumer"""
+        sequence = None
+        if item[0] in SEQUENCED_COMMANDS:
+            self._sequence.value += 1
+            sequence = self._sequence.value
+
+        for control in self._control:
+            control.put((sequence, item))
+
+    def put(self, item, block=True, timeout=None):
+        command, data = item
+        if command != 'callback':
+            return self.broadcast(item)
+
+        return self._partitions[self.partition(data)].put((command, data, self._sequence.value), block, timeout)
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+
+class ConsumerQueue(object):
+    """Queue-like view of a PartitionedQueue for a single consumer
+
+    When work stealing is enabled, a consumer whose own partition is
+    idle takes batches from other partitions. Partition locks are held
+    from the moment a batch is taken until the consumer asks for the
+    next one, or for as long as hold keeps them, so batches from one
+    partition are never processed concurrently and per-file ordering is
+    kept.
+
+    Glob updates are returned by get and drain_nowait, right before the
+    first batch sent after them. The control channel is read up to the
+    update a batch was sent after, waiting at most control_timeout
+    seconds for it, as it may arrive after the batch.
+    """
+
+    def __init__(self, partitions, control, index, locks=None, steal_interval=0.1, sequence=0, control_timeout=10,
+                 partition=None):
+        self._commands = []
+        self._control = control
+        self._control_timeout = control_timeout
+        self._due = []
+        self._held = None
+        self._index = index
+        self._last = None
+        self._locks = locks
+        self._owned = set()
+        self._partitions = partitions
+        self._pins = [0] * len(partitions)
+        self._queue = partitions[index]
+        self._received = sequence
+        self._steal_interval = steal_interval
+        self._updates = []
+
+        # index of the consumer's own partition in the PartitionedQueue
+        self.partition = partition
+
+    def close(self):
+        """Releases the partition lock held for the last batch, unless
+        batches taken from it are still held"""
+        self._held = None
+        for n in list(self._owned):
+            self._unlock(n)
+
+    def hold(self):
+        """Keeps the partition of the last batch locked until the returned
+        function is called, for batches sent in the background"""
+        n = self._held
+        if n is None:
+            return lambda: None
+
+        self._pins[n] += 1
+
+        def release():
+            self._pins[n] -= 1
+            if n != self._held:
+                self._unlock(n)
+
+        return release
+
+    def _lock(self, n, block=True):
+        if n not in self._owned:
+            if not self._locks[n].acquire(block):
+                return False
+            self._owned.add(n)
+
+        return True
+
+    def _unlock(self, n):
+        if n in self._owned and not self._pins[n]:
+            self._owned.remove(n)
+            self._locks[n].release()
+
+    def empty(self):
+        return self._queue.empty()
+
+    def full(self):
+        return self._queue.full()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def get_control(self):
+        """Returns the pending control commands other than glob updates,
+        without blocking"""
+        while True:
+            try:
+                self._read_control(block=False)
+            except Queue.Empty:
+                break
+
+        commands, self._commands = self._commands, []
+        return commands
+
+    def _read_control(self, block=True, timeout=None):
+        sequence, item = self._control.get(block, timeout)
+        if sequence is None:
+            self._commands.append(item)
+        else:
+            self._received = max(self._received, sequence)
+            self._updates.append((sequence, item))
+
+    def _order(self, item):
+        """Returns the glob updates sent before a batch, if any are left
+        to apply, keeping the batch for the next call"""
+        command, data, sequence = item
+
+        deadline = time.time() + self._control_timeout
+        while True:
+            try:
+                self._read_control(block=self._received < sequence, timeout=max(0, deadline - time.time()))
+            except Queue.Empty:
+                if self._received >= sequence or time.time() >= deadline:
+                    break
+
+        due = [update for n, update in self._updates if n <= sequence]
+        if not due:
+            return command, data
+
+        self._updates = [(n, update) for n, update in self._updates if n > sequence]
+        self._due = due[1:] + [(command, data)]
+        return due[0]
+
+    def drain_nowait(self):
+        """Returns another item from the partition the last item was taken
+        from, without blocking and without giving up that partition"""
+        if self._due:
+            return self._due.pop(0)
+
+        if self._last is None:
+            raise Queue.Empty
+
+        return self._order(self._last.get_nowait())
+
+    def get(self, block=True, timeout=None):
+        if self._due:
+            return self._due.pop(0)
+
+        if self._locks is None:
+            self._last = self._queue
+            return self._order(self._queue.get(block, timeout))
+
+        self.close()
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            wait = self._steal_interval
+            if deadline is not None:
+                wait = max(0, min(wait, deadline - time.time()))
+
+            # a consumer stealing from this partition keeps it locked while
+            # its batch is in flight, which must not outlast the timeout
+            owned = self._lock(self._index, block=False)
+            if owned:
+                try:
+                    item = self._queue.get(block and wait > 0, wait)
+                except Queue.Empty:
+                    self._unlock(self._index)
+                else:
+                    self._held = self._index
+                    self._last = self._queue
+                    return self._order(item)
+
+            item = self._steal()
+            if item is not None:
+                return self._order(item)
+
+            if not block or (deadline is not None and time.time() >= deadline):
+                raise Queue.Empty
+
+            if not owned:
+                time.sleep(wait)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def _steal(self):
+        """Takes a batch from the first other partition not being processed"""
+        for offset in range(1, len(self._partitions)):
+            n = (self._index + offset) % len(self._partitions)
+            if not self._lock(n, block=False):
+                continue
+
+            try:
+                item = self._partitions[n].get_nowait()
+            except Queue.Empty:
+                self._unlock(n)
+            else:
+                self._held = n
+                self._last = self._partitions[n]
+                return item
+
+        return None
+
+
+class TransportRouter(object):
+    """Routes batches to the group of consumers of the transport set for
+    their file, resolving each filename once"""
+
+    def __init__(self, beaver_config, transports):
+        self._beaver_config = beaver_config
+        self._groups = dict((transport, n) for n, transport in enumerate(transports))
+        self._routes = {}
+
+    def __call__(self, data):
+        filename = data.get('filename')
+        group = self._routes.get(filename)
+        if group is None:
+            transport = self._beaver_config.get_field('transport', filename)
+            group = self._groups.get(transport, 0)
+            self._routes[filename] = group
+
+        return group
@@ -1,48 +1,67 @@
 # -*- coding: utf-8 -*-
 import Queue
 import signal
-import sys
+import threading
 import time
 
+from beaver.spool import Spool
 from beaver.transports import create_transport
+from beaver.transports.circuit_breaker import CircuitBreaker
+from beaver.transports.concurrent_sender import ConcurrentSender
 from beaver.transports.exception import TransportException
 from unicode_dammit import unicode_dammit
 
+# batch fields that must match for two batches to be sent as one, their
+# timestamps being kept per line
+MERGE_FIELDS = ['filename', 'format', 'type', 'tags', 'fields', 'ignore_empty']
 
-def run_queue(queue, beaver_config, logger=None):
-    signal.signal(signal.SIGTERM, signal.SIG_DFL)
-    signal.signal(signal.SIGINT, signal.SIG_DFL)
-    signal.signal(signal.SIGQUIT, signal.SIG_DFL)
+
+def run_queue(queue, beaver_config, logger=None, transport_name=None):
+    # signal handlers can only be set from the main thread, which is not
+    # where queue consumers run when pipeline_mode is threads
+    if isinstance(threading.current_thread(), threading._MainThread):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGQUIT, signal.SIG_DFL)
 
     last_update_time = int(time.time())
     queue_timeout = beaver_config.get('queue_timeout')
     wait_timeout = beaver_config.get('wait_timeout')
+    drain_batches = beaver_config.get('queue_drain_batches')
+    drain_bytes = beaver_config.get('queue_drain_bytes')
     count = 0
 
+    spool = None
     transport = None
     try:
-        logger.debug('Logging using the {0} transport'.format(beaver_config.get('transport')))
-        transport = create_transport(beaver_config, logger=logger)
+        transport_name = transport_name or beaver_config.get('transport')
+        logger.debug('Logging using the {0} transport'.format(transport_name))
+        # transports that spool batches keep a spool per partition too
+        beaver_config.set('consumer_partition', queue.partition)
+        transport = create_transport(beaver_config, logger=logger, transport=transport_name)
 
-        failure_count = 0
-        while True:
-            if not transport.valid():
-                logger.info('Transport connection issues, stopping queue')
-                break
+        send = transport.callback
+        sender = None
+        if beaver_config.get('transport_max_in_flight') > 1:
+            # partitions stay locked while their batches are in flight
+            sender = ConcurrentSender(transport, beaver_config.get('transport_max_in_flight'), logger=logger, hold=queue.hold)
+            send = sender.send
 
-            command = None
-            try:
-                if queue.full():
-                    logger.error("Queue is full")
+        if beaver_config.get('spool_path'):
+            # replayed by whichever consumer reads this partition next
+            spool = Spool(beaver_config.get('spool_path'), max_bytes=beaver_config.get('spool_max_bytes'), logger=logger,
+                          name='consumer{0}'.format(queue.partition))
 
-                else:
-                    if count == 1000:
-                        logger.debug("Main consumer queue Size is: " + str(queue.qsize()))
-                        count = 0
-                command, data = queue.get(block=True, timeout=wait_timeout)
-                if command == "callback":
-                    last_update_time = int(time.time())
-                    logger.debug('Last update time now {0}'.format(last_update_time))
+        breaker = CircuitBreaker(transport, beaver_config.get('respawn_delay'), beaver_config.get('max_failure'), logger=logger)
+        if not transport.valid():
+            breaker.failure('Transport connection issues')
+
+        while True:
+            items = []
+            try:
+                items = drain_queue(queue, wait_timeout, drain_batches, drain_bytes)
+                last_update_time = int(time.time())
+                logger.debug('Last update time now {0}'.format(last_update_time))
             except Queue.Empty:
                 if not queue.empty():
                     logger.error('Recieved timeout from main consumer queue - stopping queue')
@@ -50,11 +69,18 @@ def run_queue(queue, beaver_config, logger=None):
                 else:
                     logger.debug('No data')
 
+            if not _run_control(queue.get_control(), beaver_config, transport, logger):
+                break
+
             if int(time.time()) - last_update_time > queue_timeout:
                 logger.info('Queue timeout of "{0}" seconds exceeded, stopping queue'.format(queue_timeout))
                 break
 
-            if command == 'callback':
+            batches = [data for command, data in items if command == 'callback']
+            if not batches and spool is not None and spool.pending():
+                _replay(send, breaker, spool)
+
+            for data in batches:
                 if data.get('ignore_empty', False):
                     logger.debug('removing empty lines')
                     lines = data['lines']
@@ -66,44 +92,162 @@ def run_queue(queue, beaver_config, logger=None):
                         new_lines.append(message)
                     data['lines'] = new_lines
 
+            for data in merge_batches(batches):
                 if len(data['lines']) == 0:
                     logger.debug('0 active lines sent from worker')
                     continue
 
-                while True:
-                    try:
-                        transport.callback(**data)
-                        count += 1
-                        logger.debug("Number of transports: " + str(count))
-                        break
-                    except TransportException as e:
-                        failure_count = failure_count + 1
-                        if failure_count > beaver_config.get('max_failure'):
-                            failure_count = beaver_config.get('max_failure')
-
-                        sleep_time = beaver_config.get('respawn_delay') ** failure_count
-                        logger.info('Caught transport exception: %s', e)
-                        logger.info('Reconnecting in %d seconds' % sleep_time)
-
-                        try:
-                            transport.invalidate()
-                            time.sleep(sleep_time)
-                            transport.reconnect()
-                            if transport.valid():
-                                failure_count = 0
-                                logger.info('Reconnected successfully')
-                        except KeyboardInterrupt:
-                            logger.info('User cancelled respawn.')
-                            transport.interrupt()
-                            sys.exit(0)
-            elif command == 'addglob':
-                beaver_config.addglob(*data)
-                transport.addglob(*data)
-            elif command == 'exit':
-                break
+                _deliver(send, data, breaker, spool, sender, wait_timeout)
+                count += 1
+                if count % 1000 == 0:
+                    logger.debug('Main consumer queue Size is: {0}'.format(queue.qsize()))
+
+            # glob updates end a drain, they apply to the batches after them
+            _run_control([item for item in items if item[0] != 'callback'], beaver_config, transport, logger)
+
+        if sender is not None:
+            logger.debug('Waiting for in-flight batches')
+            _flush(sender, breaker, spool, wait_timeout)
+
+        transport.flush(wait_timeout)
     except KeyboardInterrupt:
         logger.debug('Queue Interruped')
         if transport is not None:
             transport.interrupt()
 
         logger.debug('Queue Shutdown')
+    finally:
+        queue.close()
+        if spool is not None:
+            spool.close()
+
+
+def _deliver(send, data, breaker, spool, sender, wait_timeout):
+    """Sends a batch through the transport, replaying spooled batches first
+
+    While the transport is being reconnected, batches go to the spool if
+    there is one with room left. Otherwise this blocks until the
+    transport is back.
+    """
+    while True:
+        if breaker.allow():
+            try:
+                if spool is not None and spool.pending():
+                    spool.replay(send)
+                send(**data)
+                breaker.success()
+                return
+            except TransportException as e:
+                breaker.failure(e)
+
+        if spool is not None and spool.has_room():
+            # batches that failed in flight are older than this one
+            if sender is not None:
+                for failed in sender.take_failed():
+                    spool.append(failed)
+            spool.append(data)
+            return
+
+        breaker.wait(wait_timeout)
+
+
+def _flush(sender, breaker, spool, wait_timeout):
+    """Waits for in-flight batches, spooling the ones that failed if the
+    transport is not back by then"""
+    while True:
+        if breaker.allow():
+            try:
+                sender.flush()
+                breaker.success()
+                return
+            except TransportException as e:
+                breaker.failure(e)
+
+        if spool is not None:
+            for failed in sender.take_failed():
+                spool.append(failed)
+            return
+
+        breaker.wait(wait_timeout)
+
+
+def _replay(send, breaker, spool):
+    """Replays spooled batches while there is nothing else to send"""
+    if not breaker.allow():
+        return
+
+    try:
+        spool.replay(send)
+        breaker.success()
+    except TransportException as e:
+        breaker.failure(e)
+
+
+def drain_queue(queue, wait_timeout, max_batches, max_bytes):
+    """Blocks for the first item, then takes up to max_batches batches
+    or max_bytes bytes of lines that are already queued, without blocking.
+    Returns (command, data) items, the last one being the glob update the
+    drain stopped at, if any
+    """
+    items = [queue.get(block=True, timeout=wait_timeout)]
+    size = 0
+
+    while items[-1][0] == 'callback':
+        size += sum(len(line) for line in items[-1][1]['lines'])
+        if len(items) >= max_batches or size >= max_bytes:
+            break
+
+        try:
+            items.append(queue.drain_nowait())
+        except Queue.Empty:
+            break
+
+    return items
+
+
+def merge_batches(batches):
+    """Merges batches whose lines can be sent in a single transport callback,
+    keeping the order of lines within each file
+
+    Batches read at different times are merged too. The merged batch then
+    keeps the timestamp of each batch it was made of in timestamps, as
+    [timestamp, line count] pairs, which formatters stamp its lines with
+    """
+    merged = []
+    indexes = {}
+    for data in batches:
+        filename = data.get('filename')
+        index = indexes.get(filename)
+        if index is not None:
+            previous = merged[index]
+            if all(previous.get(field) == data.get(field) for field in MERGE_FIELDS):
+                runs = previous.setdefault('timestamps', [[previous.get('timestamp'), len(previous['lines'])]])
+                if runs[-1][0] == data.get('timestamp'):
+                    runs[-1][1] += len(data['lines'])
+                else:
+                    runs.append([data.get('timestamp'), len(data['lines'])])
+                previous['lines'] = list(previous['lines']) + list(data['lines'])
+                continue
+
+        indexes[filename] = len(merged)
+        merged.append(data)
+
+    return merged
+
+
+def _run_control(commands, beaver_config, transport, logger):
+    """Applies control commands
+    Returns False once the queue has been asked to exit
+    """
+    for command, data in commands:
+        if command == 'addglob':
+            beaver_config.addglob(*data)
+            transport.addglob(*data)
+        elif command == 'delglob':
+            beaver_config.delglob(*data)
+            transport.delglob(*data)
+        elif command == 'exit':
+            logger.debug('Exit requested')
+            return False
+
+    return True
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+import errno
+import fcntl
+import glob
+import itertools
+import json
+import os
+import time
+
+# size at which the spool starts writing to a new segment file
+SEGMENT_BYTES = 1024 * 1024
+
+# ids of the spools open in this process
+_open_spools = set()
+_spool_ids = itertools.count(1)
+
+
+class Spool(object):
+    """Stores batches on disk while a transport is unavailable
+
+    Batches are appended as json lines to segment files named after the
+    spool name, the time the segment was created and the spool writing
+    it. Segments are replayed in the order of their names, oldest first,
+    and a segment is claimed by renaming it before being replayed, so
+    several spools can share a spool directory.
+
+    Each spool holds a lock on a file of its own while it is open.
+    Segments whose writer's lock can be taken were left behind by a spool
+    that is gone, and are replayed by the next spool of the same name.
+    Queue consumers name their spool after their partition, so that
+    batches are replayed by the consumer that reads the same files.
+    """
+
+    def __init__(self, path, max_bytes=0, logger=None, name='default'):
+        self._file = None
+        self._logger = logger
+        self._max_bytes = max_bytes
+        self._name = str(name)
+        self._path = path
+        self._stamp = 0
+
+        # consumer threads share a pid, so segments are named after the
+        # pid and a per-process spool id, and the start time so that a
+        # reused pid gets another id
+        self._id = '{0}.{1}.{2}'.format(os.getpid(), next(_spool_ids), int(time.time()))
+        _open_spools.add(self._id)
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._lock = open(os.path.join(path, 'lock-' + self._id), 'a')
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+
+        self._size = self._spooled_bytes()
+
+    def close(self):
+        """Closes the spool, leaving its segments to be replayed by others"""
+        self._close()
+        _open_spools.discard(self._id)
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    def has_room(self):
+        """Returns whether more batches can be spooled"""
+        return not self._max_bytes or self._size < self._max_bytes
+
+    def pending(self):
+        """Returns whether there are spooled batches"""
+        return self._size > 0
+
+    def append(self, data):
+        if self._file is None or self._file.tell() >= SEGMENT_BYTES:
+            self._rotate()
+
+        data = dict(data)
+        data['lines'] = list(data['lines'])
+        line = json.dumps(data) + '\n'
+        self._file.write(line)
+        self._file.flush()
+        self._size += len(line)
+
+    def replay(self, send):
+        """Sends every spooled batch, oldest first
+
+        If send raises, the batches not sent yet are kept for the next replay
+        """
+        if not self.pending():
+            return
+
+        self._close()
+        for name in self._segments():
+            claimed = '{0}.replaying-{1}'.format(name, self._id)
+            try:
+                os.rename(name, claimed)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    # replayed by another consumer
+                    continue
+                raise
+
+            with open(claimed) as f:
+                batches = f.readlines()
+
+            for n, line in enumerate(batches):
+                try:
+                    send(**self._decode(line))
+                except Exception:
+                    # the segment keeps its name, and so its place
+                    stat = os.stat(claimed)
+                    with open(name, 'w') as f:
+                        f.writelines(batches[n:])
+                    os.utime(name, (stat.st_atime, stat.st_mtime))
+                    os.unlink(claimed)
+                    self._size = self._spooled_bytes()
+                    raise
+
+            os.unlink(claimed)
+            self._logger.info('Replayed {0} spooled batches from {1}'.format(len(batches), name))
+
+        self._size = self._spooled_bytes()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _decode(self, line):
+        data = json.loads(line)
+        # json gives back unicode keys, which cannot be used as **kwargs
+        return dict((str(key), value) for key, value in data.items())
+
+    def _spooled_bytes(self):
+        size = 0
+        for name in self._segments():
+            try:
+                size += os.path.getsize(name)
+            except OSError:
+                pass
+        return size
+
+    def _rotate(self):
+        self._close()
+        # microseconds, fixed width so that names sort by age
+        self._stamp = max(self._stamp + 1, int(time.time() * 1000000))
+        name = os.path.join(self._path, 'spool-{0}-{1:020d}-{2}'.format(self._name, self._stamp, self._id))
+        self._file = open(name, 'a')
+
+    def _segments(self):
+        """Returns the segment files of this spool name this process may
+        replay, oldest first: its own, and those of spools that are gone"""
+        segments = []
+        for name in glob.glob(os.path.join(self._path, 'spool-{0}-*'.format(self._name))):
+            if '.replaying-' in name:
+                segment, owner = name.rsplit('.replaying-', 1)
+                if owner == self._id or _is_running(self._path, owner):
+                    continue
+                try:
+                    os.rename(name, segment)
+                except OSError:
+                    continue
+                name = segment
+
+            writer = name.rsplit('-', 1)[1]
+            if writer != self._id and _is_running(self._path, writer):
+                continue
+
+            segments.append(name)
+
+        return sorted(segments)
+
+
+def _is_running(path, owner):
+    """Returns whether the spool of a segment owner id is still open, that
+    is whether it still holds the lock on its lock file"""
+    if owner in _open_spools:
+        return True
+
+    try:
+        lock = open(os.path.join(path, 'lock-' + owner), 'r')
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            return False
+        raise
+
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError as e:
+        if e.errno in (errno.EAGAIN, errno.EACCES):
+            return True
+        raise
+    else:
+        # gone, its segments are taken over from now on
+        os.unlink(lock.name)
+        return False
+    finally:
+        lock.close()
@@ -1,4 +1,5 @@
 import logging
+import mock
 import os, sys, tarfile
 import os.path
 import shutil
@@ -17,9 +18,18 @@ except ImportError:
     from urllib import urlencode
     from urllib2 import urlopen, Request, HTTPError
 
+from beaver.config import BeaverConfig
 from service import ExternalService, SpawnedService
 
 
+def get_beaver_config(config, **args):
+    """Returns the BeaverConfig of a config file with the given contents,
+    args standing for the command line arguments"""
+    config_file = tempfile.NamedTemporaryFile()
+    config_file.write(config)
+    config_file.flush()
+    return BeaverConfig(mock.Mock(config=config_file.name, **args))
+
 def get_open_port():
     sock = socket.socket()
     sock.bind(("", 0))
@@ -274,3 +284,43 @@ class KafkaFixture(Fixture):
         self.out("Done!")
         shutil.rmtree(self.tmp_dir)
         self.running = False
+
+
+class RedisFixture(Fixture):
+    @classmethod
+    def instance(cls):
+        if "REDIS_URI" in os.environ:
+            parse = urlparse(os.environ["REDIS_URI"])
+            (host, port) = (parse.hostname, parse.port)
+            fixture = ExternalService(host, port)
+        else:
+            (host, port) = ("127.0.0.1", get_open_port())
+            fixture = cls(host, port)
+
+        fixture.open()
+        return fixture
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+        self.child = None
+
+    def out(self, message):
+        logging.info("*** Redis [%s:%d]: %s", self.host, self.port, message)
+
+    def open(self):
+        self.out("Running local instance...")
+        args = ['redis-server', '--port', str(self.port), '--bind', self.host, '--save', '', '--appendonly', 'no']
+        self.child = SpawnedService(args)
+
+        self.out("Starting...")
+        self.child.start()
+        self.child.wait_for(r"ready to accept connections")
+        self.out("Done!")
+
+    def close(self):
+        self.out("Stopping...")
+        self.child.stop()
+        self.child = None
+        self.out("Done!")
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import json
+import logging
+import mock
+import threading
+
+from beaver.tests.fixtures import get_beaver_config
+from beaver.transports.base_transport import BaseTransport
+
+
+class BaseTransportFormatTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+
+    def _get_transport(self, version=1, fmt='json', passthrough=0):
+        config = '[beaver]\nlogstash_version: {0}\nformat: {1}\nhostname: host\nrawjson_passthrough: {2}\n'.format(version, fmt, passthrough)
+        beaver_config = get_beaver_config(config, fqdn=False)
+        return BaseTransport(beaver_config, logger=self.logger)
+
+    def test_json(self):
+        transport = self._get_transport()
+        event = json.loads(transport.format('/tmp/a.log', 'line', 'now', type='t', tags=['x'], fields={'app': 'a'}))
+        self.assertEqual({
+            'type': 't',
+            'tags': ['x'],
+            '@timestamp': 'now',
+            '@version': 1,
+            'host': 'host',
+            'file': '/tmp/a.log',
+            'message': 'line',
+            'app': 'a',
+        }, event)
+
+    def test_logstash_version_0(self):
+        transport = self._get_transport(version=0)
+        event = json.loads(transport.format('/tmp/a.log', 'line', 'now', type='t', tags=[], fields={'app': 'a'}))
+        self.assertEqual('file:///tmp/a.log', event['@source'])
+        self.assertEqual({'app': 'a'}, event['@fields'])
+        self.assertEqual('line', event['@message'])
+
+    def test_cache_follows_batch_fields(self):
+        transport = self._get_transport()
+        with mock.patch.object(transport._beaver_config, 'get_field', wraps=transport._beaver_config.get_field) as get_field:
+            for line in ['one', 'two', 'three']:
+                transport.format('/tmp/a.log', line, 'now', type='t', tags=[], fields={})
+            self.assertEqual(1, get_field.call_count)
+
+            event = json.loads(transport.format('/tmp/a.log', 'four', 'now', type='other', tags=[], fields={}))
+            self.assertEqual(2, get_field.call_count)
+            self.assertEqual('other', event['type'])
+
+    def test_fields_override_message(self):
+        transport = self._get_transport()
+        event = json.loads(transport.format('/tmp/a.log', 'line', 'now', type='t', tags=[], fields={'message': 'fixed'}))
+        self.assertEqual('fixed', event['message'])
+
+    def test_format_batch_matches_format(self):
+        lines = ['plain', 'quote " and \\ slash /', u'unicode é中', 'tab\tnew\nline', '\x00nul', '']
+        for version in [0, 1]:
+            for fmt in ['json', 'rawjson']:
+                transport = self._get_transport(version=version, fmt=fmt)
+                kwargs = {'type': 't', 'tags': ['x'], 'fields': {'app': 'a'}}
+                expected = [transport.format('/tmp/a.log', line, 'now', **kwargs) for line in lines]
+                self.assertEqual(expected, transport.format_batch('/tmp/a.log', lines, 'now', **kwargs))
+
+    def test_format_batch_keeps_merged_timestamps(self):
+        kwargs = {'type': 't', 'tags': [], 'fields': {}}
+        for fmt in ['json', 'rawjson', 'string']:
+            transport = self._get_transport(fmt=fmt)
+            expected = [transport.format('/tmp/a.log', 'one', 'then', **kwargs),
+                        transport.format('/tmp/a.log', 'two', 'now', **kwargs),
+                        transport.format('/tmp/a.log', 'three', 'now', **kwargs)]
+            self.assertEqual(expected, transport.format_batch('/tmp/a.log', ['one', 'two', 'three'], 'then',
+                                                              timestamps=[['then', 1], ['now', 2]], **kwargs))
+
+    def test_format_batch_with_message_field(self):
+        transport = self._get_transport()
+        kwargs = {'type': 't', 'tags': [], 'fields': {'message': 'fixed'}}
+        self.assertEqual([transport.format('/tmp/a.log', 'line', 'now', **kwargs)],
+                         transport.format_batch('/tmp/a.log', ['line'], 'now', **kwargs))
+
+    def test_rawjson_passthrough(self):
+        messages = [
+            '{"msg": "hello", "status": 200}',
+            '{"message": "mine", "type": "app", "tags": ["a"]}',
+            '{ "msg" : "type", "list": [1, 2] }',
+            '{"nested": {"host": "inner"}, "msg": "x"}',
+            '{"msg": "a \\"host\\": b"}',
+            u'{"msg": "unicode \u00e9"}',
+            '{}',
+            'not json',
+        ]
+        kwargs = {'type': 't', 'tags': ['x'], 'fields': {'app': 'a'}}
+        for version in [0, 1]:
+            parsed = self._get_transport(version=version, fmt='rawjson')
+            transport = self._get_transport(version=version, fmt='rawjson', passthrough=1)
+            batch = transport.format_batch('/tmp/a.log', messages, 'now', **kwargs)
+            for message, batched in zip(messages, batch):
+                expected = parsed.format('/tmp/a.log', message, 'now', **kwargs)
+                formatted = transport.format('/tmp/a.log', message, 'now', **kwargs)
+                self.assertEqual(json.loads(expected), json.loads(formatted))
+                self.assertEqual(json.loads(expected), json.loads(batched))
+
+    def test_rawjson_passthrough_keeps_message(self):
+        message = '{"msg": "hello",  "status": 200}'
+        transport = self._get_transport(fmt='rawjson', passthrough=1)
+        formatted = transport.format('/tmp/a.log', message, 'now', type='t', tags=[], fields={})
+        self.assertTrue(formatted.startswith(message[:-1] + ','))
+
+    def test_stats_counted_from_several_threads(self):
+        transport = self._get_transport()
+        transport._stats_interval = 0.000001
+
+        def count():
+            for n in range(10000):
+                transport._incr('lines')
+                transport._incr('bytes', 2)
+                if n % 1000 == 0:
+                    transport._log_stats()
+
+        threads = [threading.Thread(target=count) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({'lines': 40000, 'bytes': 80000}, transport.stats())
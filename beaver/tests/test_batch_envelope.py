@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import json
+import logging
+import StringIO
+
+from beaver import batch_envelope
+from beaver.tests.fixtures import get_beaver_config
+from beaver.transports.base_transport import BaseTransport
+
+
+class BatchEnvelopeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+
+    def _get_transport(self, fmt='batch', encoding='json'):
+        config = '[beaver]\nlogstash_version: 1\nformat: {0}\nbatch_encoding: {1}\nhostname: host\n'.format(fmt, encoding)
+        beaver_config = get_beaver_config(config, fqdn=False)
+        return BaseTransport(beaver_config, logger=self.logger)
+
+    def test_expands_to_json_events(self):
+        lines = ['one', u'two é', 'three "quoted"']
+        kwargs = {'type': 't', 'tags': ['x'], 'fields': {'app': 'a'}}
+        expected = [json.loads(event) for event in self._get_transport(fmt='json').format_batch('/tmp/a.log', lines, 'now', **kwargs)]
+
+        for encoding in ['json', 'msgpack']:
+            envelopes = self._get_transport(encoding=encoding).format_batch('/tmp/a.log', lines, 'now', **kwargs)
+            self.assertEqual(1, len(envelopes))
+            events = batch_envelope.expand(envelopes[0])
+            self.assertEqual(expected, json.loads(json.dumps(events)))
+
+    def test_keeps_merged_timestamps(self):
+        transport = self._get_transport()
+        envelopes = transport.format_batch('/tmp/a.log', ['one', 'two', 'three'], 'then',
+                                           timestamps=[['then', 1], ['now', 2]], type='t', tags=[], fields={})
+        events = batch_envelope.expand(envelopes[0])
+        self.assertEqual(['then', 'now', 'now'], [event['@timestamp'] for event in events])
+
+    def test_single_line(self):
+        transport = self._get_transport()
+        envelope = transport.format('/tmp/a.log', 'one', 'now', type='t', tags=[], fields={})
+        self.assertEqual(['one'], [event['message'] for event in batch_envelope.expand(envelope)])
+
+    def test_command_line(self):
+        transport = self._get_transport()
+        envelopes = transport.format_batch('/tmp/a.log', ['one', 'two'], 'now', type='t', tags=[], fields={})
+        stdout = StringIO.StringIO()
+        batch_envelope.main(StringIO.StringIO(envelopes[0] + '\n\n'), stdout)
+        self.assertEqual(['one', 'two'], [json.loads(line)['message'] for line in stdout.getvalue().splitlines()])
+
+    def test_rejects_other_payloads(self):
+        self.assertRaises(ValueError, batch_envelope.expand, '{"message": "one"}')
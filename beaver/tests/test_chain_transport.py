@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import logging
+import shutil
+import tempfile
+
+from beaver.tests.fixtures import get_beaver_config
+from beaver.transports import create_transport
+from beaver.transports.base_transport import BaseTransport
+from beaver.transports.chain_transport import ChainTransport
+from beaver.transports.exception import TransportException
+
+
+class PrimaryTransport(BaseTransport):
+    down = False
+    sent = []
+
+    def callback(self, filename, lines, **kwargs):
+        if PrimaryTransport.down:
+            raise TransportException('primary is down')
+        PrimaryTransport.sent.extend(lines)
+
+
+class ChainTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.spool_path = tempfile.mkdtemp()
+        PrimaryTransport.down = False
+        PrimaryTransport.sent = []
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_path)
+
+    def _get_config(self, chain):
+        config = '[beaver]\ntransport_chain: {0}\nspool_path: {1}\nrespawn_delay: 1\n'.format(chain, self.spool_path)
+        return get_beaver_config(config, transport='chain')
+
+    def test_builtin_chain(self):
+        beaver_config = self._get_config('stdout, spool')
+        transport = create_transport(beaver_config, logger=self.logger)
+        self.assertIsInstance(transport, ChainTransport)
+        transport.interrupt()
+
+    def test_fails_over_and_recovers(self):
+        beaver_config = self._get_config('beaver.tests.test_chain_transport.PrimaryTransport,spool')
+        primary = 'beaver.tests.test_chain_transport.PrimaryTransport'
+        transport = create_transport(beaver_config, logger=self.logger)
+
+        transport.callback('/tmp/a.log', ['one'])
+        PrimaryTransport.down = True
+        transport.callback('/tmp/a.log', ['two'])
+        transport.callback('/tmp/a.log', ['three'])
+        self.assertEqual(['one'], PrimaryTransport.sent)
+
+        # the primary is not tried again until it has reconnected
+        PrimaryTransport.down = False
+        transport.callback('/tmp/a.log', ['four'])
+        self.assertEqual(['one'], PrimaryTransport.sent)
+
+        name, member, breaker = transport._chain[0]
+        self.assertTrue(breaker.wait(5))
+        transport.callback('/tmp/a.log', ['five'])
+        self.assertEqual(['one', 'two', 'three', 'four', 'five'], PrimaryTransport.sent)
+
+        stats = transport.stats()
+        self.assertEqual(2, stats[primary + '.batches'])
+        self.assertEqual(1, stats[primary + '.failures'])
+        self.assertEqual(3, stats['spool.lines'])
+        transport.interrupt()
+
+    def test_raises_when_every_transport_fails(self):
+        beaver_config = self._get_config('beaver.tests.test_chain_transport.PrimaryTransport')
+        transport = create_transport(beaver_config, logger=self.logger)
+        self.assertTrue(transport.valid())
+
+        PrimaryTransport.down = True
+        self.assertRaises(TransportException, transport.callback, '/tmp/a.log', ['one'])
+        self.assertFalse(transport.valid())
+        self.assertRaises(TransportException, transport.reconnect)
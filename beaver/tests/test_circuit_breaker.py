@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import fcntl
+import logging
+import mock
+import os
+import shutil
+import tempfile
+
+from beaver.spool import Spool
+from beaver.transports.circuit_breaker import CircuitBreaker
+from beaver.transports.exception import TransportException
+
+
+class FlakyTransport(object):
+
+    def __init__(self, reconnect_failures=0):
+        self.invalidated = 0
+        self.reconnects = 0
+        self.reconnect_failures = reconnect_failures
+
+    def invalidate(self):
+        self.invalidated += 1
+
+    def reconnect(self):
+        self.reconnects += 1
+        if self.reconnect_failures > 0:
+            self.reconnect_failures -= 1
+            raise TransportException('still down')
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+
+    def test_reconnects_in_background(self):
+        transport = FlakyTransport(reconnect_failures=1)
+        breaker = CircuitBreaker(transport, 0.1, 2, logger=self.logger)
+        self.assertTrue(breaker.allow())
+
+        breaker.failure(TransportException('down'))
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(1, transport.invalidated)
+
+        self.assertTrue(breaker.wait(5))
+        self.assertEqual(CircuitBreaker.HALF_OPEN, breaker.state)
+        self.assertEqual(2, transport.reconnects)
+
+        breaker.success()
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+
+    def test_failed_trial_opens_again(self):
+        transport = FlakyTransport()
+        breaker = CircuitBreaker(transport, 0.1, 2, logger=self.logger)
+        breaker.failure()
+        self.assertTrue(breaker.wait(5))
+        breaker.failure()
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+        self.assertTrue(breaker.wait(5))
+
+
+class SpoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_replay(self):
+        spool = Spool(self.path, logger=self.logger)
+        self.assertFalse(spool.pending())
+        for n in range(3):
+            spool.append({'filename': 'a.log', 'lines': [str(n)]})
+        self.assertTrue(spool.pending())
+
+        sent = []
+        spool.replay(lambda filename, lines: sent.extend(lines))
+        self.assertEqual(['0', '1', '2'], sent)
+        self.assertFalse(spool.pending())
+
+    def test_replay_keeps_unsent_batches(self):
+        spool = Spool(self.path, logger=self.logger)
+        for n in range(3):
+            spool.append({'filename': 'a.log', 'lines': [str(n)]})
+
+        sent = []
+
+        def send(filename, lines):
+            if lines == ['1']:
+                raise TransportException('down')
+            sent.extend(lines)
+
+        self.assertRaises(TransportException, spool.replay, send)
+        self.assertEqual(['0'], sent)
+        self.assertTrue(spool.pending())
+
+        # a new consumer picks up what the previous one left
+        spool.close()
+        spool = Spool(self.path, logger=self.logger)
+        spool.replay(lambda filename, lines: sent.extend(lines))
+        self.assertEqual(['0', '1', '2'], sent)
+
+    def test_max_bytes(self):
+        spool = Spool(self.path, max_bytes=10, logger=self.logger)
+        self.assertTrue(spool.has_room())
+        spool.append({'filename': 'a.log', 'lines': ['0123456789']})
+        self.assertFalse(spool.has_room())
+
+    def test_rewritten_segment_keeps_its_place(self):
+        spool = Spool(self.path, logger=self.logger)
+        with mock.patch('beaver.spool.SEGMENT_BYTES', 1):
+            for n in range(3):
+                spool.append({'filename': 'a.log', 'lines': [str(n)]})
+
+        sent = []
+
+        def send(filename, lines):
+            if lines == ['0'] and not sent:
+                sent.append(None)
+                raise TransportException('down')
+            sent.extend(lines)
+
+        self.assertRaises(TransportException, spool.replay, send)
+        spool.replay(send)
+        self.assertEqual([None, '0', '1', '2'], sent)
+
+    def test_segments_are_replayed_by_spools_of_the_same_name(self):
+        spool = Spool(self.path, logger=self.logger, name='consumer0')
+        spool.append({'filename': 'a.log', 'lines': ['0']})
+        spool.close()
+
+        self.assertFalse(Spool(self.path, logger=self.logger, name='consumer1').pending())
+        self.assertTrue(Spool(self.path, logger=self.logger, name='consumer0').pending())
+
+    def test_segments_of_a_locked_spool_are_not_replayed(self):
+        spool = Spool(self.path, logger=self.logger)
+        spool.append({'filename': 'a.log', 'lines': ['0']})
+        spool.close()
+
+        # as if the writer was still running in another process
+        writer = os.listdir(self.path)
+        writer = [name for name in writer if name.startswith('spool-')][0].rsplit('-', 1)[1]
+        lock = open(os.path.join(self.path, 'lock-' + writer), 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        self.assertFalse(Spool(self.path, logger=self.logger).pending())
+
+        lock.close()
+        self.assertTrue(Spool(self.path, logger=self.logger).pending())
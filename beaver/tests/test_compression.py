@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import logging
+import mock
+import socket
+
+from beaver.tests.fixtures import get_beaver_config
+from beaver.transports import compression
+from beaver.transports.exception import TransportException
+from beaver.transports.udp_transport import UdpTransport
+
+
+class CompressionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+
+    def test_frames_round_trip(self):
+        data = 'line one\nline two\n' * 100
+        for name in compression.CODECS:
+            codec = compression.get_codec(name, 1)
+            framed = compression.frame(codec, data) + compression.frame(codec, 'last\n')
+
+            payloads, left = compression.unframe(framed + framed[:3])
+            self.assertEqual([data, 'last\n'], payloads)
+            self.assertEqual(framed[:3], left)
+
+    def test_unknown_codec(self):
+        self.assertRaises(LookupError, compression.get_codec, 'snappy')
+
+    def _get_udp_transport(self, port):
+        config = '[beaver]\nlogstash_version: 1\nformat: raw\ncompression: zlib\nudp_host: 127.0.0.1\nudp_port: {0}\n'.format(port)
+        beaver_config = get_beaver_config(config, transport='udp')
+        return UdpTransport(beaver_config, logger=self.logger)
+
+    def test_udp_sends_compressed_datagrams(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+
+        transport = self._get_udp_transport(server.getsockname()[1])
+        lines = ['x' * 1000] * 100
+        transport.callback('/tmp/a.log', lines, type='t', tags=[], fields={})
+
+        received = []
+        while len(received) < len(lines):
+            payloads, left = compression.unframe(server.recv(65535))
+            self.assertEqual('', left)
+            received.extend(payloads[0].splitlines())
+
+        self.assertEqual(lines, received)
+        server.close()
+
+    def test_udp_drops_lines_too_long_for_a_datagram(self):
+        transport = self._get_udp_transport(9)
+        lines = ['a', u'\u00e9' * 40000, 'b' * 70000, 'c']
+        self.assertEqual([['a', 'c']], list(transport._chunks('/tmp/a.log', lines)))
+
+    def test_udp_socket_errors(self):
+        transport = self._get_udp_transport(9)
+        transport._sock = mock.Mock()
+        transport._sock.sendto.side_effect = socket.error('Message too long')
+        self.assertRaises(TransportException, transport.callback, '/tmp/a.log', ['line'], type='t', tags=[], fields={})
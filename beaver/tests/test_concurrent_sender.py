@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import threading
+import time
+
+from beaver.transports.concurrent_sender import ConcurrentSender
+from beaver.transports.exception import TransportException
+
+
+class FlakyTransport(object):
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.lock = threading.Lock()
+        self.sent = []
+
+    def send_batch(self, filename, lines, **kwargs):
+        with self.lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise TransportException('down')
+            self.sent.extend(lines)
+
+
+class SlowTransport(object):
+    """Takes longer to send the earlier batches"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = []
+
+    def send_batch(self, filename, lines, **kwargs):
+        time.sleep(0.01 * (4 - lines[0]))
+        with self.lock:
+            self.sent.append((filename, lines[0]))
+
+
+class FailingTransport(object):
+    """Fails every batch, once released"""
+
+    def __init__(self):
+        self.released = threading.Event()
+
+    def send_batch(self, filename, lines, **kwargs):
+        self.released.wait()
+        raise TransportException('down')
+
+
+class ConcurrentSenderTests(unittest.TestCase):
+
+    def test_sends_everything(self):
+        transport = FlakyTransport()
+        sender = ConcurrentSender(transport, 4)
+        for n in range(20):
+            sender.send(filename='a.log', lines=[n])
+        sender.flush()
+        self.assertEqual(range(20), sorted(transport.sent))
+
+    def test_failed_batches_are_sent_again(self):
+        transport = FlakyTransport(failures=1)
+        sender = ConcurrentSender(transport, 2)
+        sender.send(filename='a.log', lines=[0])
+        self.assertRaises(TransportException, sender.flush)
+        self.assertEqual([], transport.sent)
+
+        sender.send(filename='a.log', lines=[1])
+        sender.flush()
+        self.assertEqual([0, 1], sorted(transport.sent))
+
+    def test_batches_of_a_file_are_sent_in_order(self):
+        transport = SlowTransport()
+        sender = ConcurrentSender(transport, 4)
+        for n in range(4):
+            sender.send(filename='a.log', lines=[n])
+            sender.send(filename='b.log', lines=[n])
+        sender.flush()
+
+        self.assertEqual(range(4), [line for filename, line in transport.sent if filename == 'a.log'])
+        self.assertEqual(range(4), [line for filename, line in transport.sent if filename == 'b.log'])
+
+    def test_failed_batch_is_sent_before_the_next_of_its_file(self):
+        transport = FlakyTransport(failures=1)
+        sender = ConcurrentSender(transport, 4)
+        sender.send(filename='a.log', lines=[0])
+        self.assertRaises(TransportException, sender.send, filename='a.log', lines=[1])
+
+        sender.send(filename='a.log', lines=[1])
+        sender.flush()
+        self.assertEqual([0, 1], transport.sent)
+
+    def test_holds_until_sent(self):
+        transport = FlakyTransport(failures=1)
+        released = []
+        sender = ConcurrentSender(transport, 2, hold=lambda: lambda: released.append(True))
+        sender.send(filename='a.log', lines=[0])
+        self.assertRaises(TransportException, sender.flush)
+        self.assertEqual([], released)
+
+        sender.flush()
+        self.assertEqual([True], released)
+
+    def test_transports_can_opt_out_of_concurrent_sends(self):
+        transport = FlakyTransport()
+        transport.concurrent_sends = False
+        transport.callback = transport.send_batch
+        sender = ConcurrentSender(transport, 4)
+        self.assertEqual(transport.callback, sender._method)
+
+    def test_hold_is_released_when_the_previous_batch_failed(self):
+        holds = []
+
+        def hold():
+            holds.append(1)
+            return holds.pop
+
+        transport = FailingTransport()
+        sender = ConcurrentSender(transport, 2, hold=hold)
+        sender.send(filename='a.log', lines=[0])
+
+        threading.Timer(0.05, transport.released.set).start()
+        self.assertRaises(TransportException, sender.send, filename='a.log', lines=[1])
+        self.assertEqual(1, len(holds))
+
+        sender.take_failed()
+        self.assertEqual([], holds)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import BaseHTTPServer
+import errno
+import gzip
+import json
+import logging
+import socket
+import SocketServer
+import StringIO
+import tempfile
+import threading
+
+from beaver.tests.fixtures import get_beaver_config
+from beaver.timestamps import Timestamp
+from beaver.transports import create_transport
+from beaver.transports.exception import TransportException
+
+
+class BulkHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Stand-in for the elasticsearch _bulk api, answering each document
+    with the status server.statuses has for its message, or 201. Requests
+    holding a message of server.failing fail with a 503. With
+    server.not_json set, requests get a 200 response that is not json"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond(200, {})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO.StringIO(body)).read()
+        self.server.bodies.append(body)
+
+        if self.server.not_json:
+            return self._respond(200, 'ok', encode=False)
+
+        lines = body.splitlines()
+        if any(json.loads(document)['message'] in self.server.failing for document in lines[1::2]):
+            return self._respond(503, {})
+
+        if self.server.request_status != 200:
+            return self._respond(self.server.request_status, {})
+
+        items = []
+        for action, document in zip(lines[::2], lines[1::2]):
+            index = json.loads(action)['index']['_index']
+            message = json.loads(document)['message']
+            status = self.server.statuses.get(message, 201)
+            if status == 201:
+                self.server.indexed.append((index, message))
+            items.append({'index': {'_index': index, 'status': status, 'error': {'type': 'error'}}})
+
+        self._respond(200, {'errors': any(item['index']['status'] != 201 for item in items), 'items': items})
+
+    def _respond(self, status, data, encode=True):
+        if encode:
+            data = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class BulkServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        # connections are shut down and their threads joined when a test
+        # ends, so that no handler is left running at interpreter exit
+        thread = threading.Thread(target=self.process_request_thread, args=(request, client_address))
+        thread.daemon = True
+        self.handlers.append((thread, request))
+        thread.start()
+
+    def handle_error(self, request, client_address):
+        # connections reset by the transport are not errors
+        error = sys.exc_info()[1]
+        if isinstance(error, socket.error) and error.errno in (errno.ECONNRESET, errno.EPIPE):
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+
+class ElasticsearchTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.server = BulkServer(('127.0.0.1', 0), BulkHandler)
+        self.server.handlers = []
+        self.server.bodies = []
+        self.server.failing = set()
+        self.server.indexed = []
+        self.server.not_json = False
+        self.server.request_status = 200
+        self.server.statuses = {}
+
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for thread, request in self.server.handlers:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            thread.join(1)
+
+    def _get_transport(self, options=''):
+        config = '[beaver]\nlogstash_version: 1\nformat: json\nelasticsearch_url: http://127.0.0.1:{0}/\n'.format(self.server.server_port)
+        beaver_config = get_beaver_config(config + options, transport='elasticsearch')
+        transport = create_transport(beaver_config, logger=self.logger)
+        self.addCleanup(transport._session.close)
+        return transport
+
+    def _send(self, transport, lines, timestamp=Timestamp.from_epoch(1500000000)):
+        transport.callback('/tmp/a.log', lines, type='app', tags=[], fields={}, timestamp=timestamp)
+
+    def test_indexes_batch_in_daily_index(self):
+        transport = self._get_transport()
+        self._send(transport, ['a', 'b'])
+
+        self.assertEqual([('logstash-2017.07.14', 'a'), ('logstash-2017.07.14', 'b')], self.server.indexed)
+        self.assertEqual(1, len(self.server.bodies))
+        self.assertEqual(2, transport.stats()['documents'])
+
+    def test_templated_index(self):
+        transport = self._get_transport('elasticsearch_index: logs-{type}-%Y.%m\n')
+        self._send(transport, ['a'])
+        self.assertEqual([('logs-app-2017.07', 'a')], self.server.indexed)
+
+    def test_splits_large_batches_and_compresses(self):
+        transport = self._get_transport('elasticsearch_max_body_bytes: 300\ncompression: gzip\n')
+        self._send(transport, [str(n) for n in range(6)])
+
+        self.assertTrue(len(self.server.bodies) > 1)
+        self.assertEqual([str(n) for n in range(6)], [message for index, message in self.server.indexed])
+
+    def test_only_failed_documents_are_retried(self):
+        transport = self._get_transport()
+        self.server.statuses = {'b': 429, 'c': 400}
+        self._send(transport, ['a', 'b', 'c'])
+
+        self.assertEqual(['a'], [message for index, message in self.server.indexed])
+        self.assertEqual(1, transport.stats()['rejected'])
+
+        # rejected for capacity, so indexed again before the next batch
+        self.server.statuses = {}
+        self._send(transport, ['d'])
+        self.assertEqual(['a', 'b', 'd'], [message for index, message in self.server.indexed])
+        self.assertTrue(transport.flush())
+
+    def test_failed_request_raises(self):
+        transport = self._get_transport()
+        self.server.request_status = 503
+        self.assertRaises(TransportException, self._send, transport, ['a'])
+
+    def test_retried_documents_block_the_next_batch(self):
+        transport = self._get_transport()
+        self.server.statuses = {'a': 503}
+        self._send(transport, ['a'])
+
+        self.server.request_status = 503
+        self.assertRaises(TransportException, self._send, transport, ['b'])
+
+        self.server.request_status = 200
+        self.server.statuses = {}
+        self._send(transport, ['b'])
+        self.assertEqual(['a', 'b'], [message for index, message in self.server.indexed])
+
+    def test_still_rejected_documents_raise(self):
+        transport = self._get_transport()
+        self.server.statuses = {'a': 429}
+        self._send(transport, ['a'])
+        self.assertRaises(TransportException, self._send, transport, ['b'])
+        self.assertEqual([], self.server.indexed)
+
+        self.server.statuses = {}
+        self._send(transport, ['b'])
+        self.assertEqual(['a', 'b'], [message for index, message in self.server.indexed])
+
+    def test_only_unsent_bodies_are_sent_again(self):
+        transport = self._get_transport('elasticsearch_max_body_bytes: 100\n')
+        self.server.failing = set(['1'])
+        self._send(transport, ['0', '1', '2'])
+        self.assertEqual(['0'], [message for index, message in self.server.indexed])
+
+        self.server.failing = set()
+        self._send(transport, ['3'])
+        self.assertEqual(['0', '1', '2', '3'], [message for index, message in self.server.indexed])
+
+    def test_index_template_with_missing_field(self):
+        transport = self._get_transport('elasticsearch_index: logs-{missing}-%Y.%m\n')
+        self._send(transport, ['a'])
+        self.assertEqual([('logstash-2017.07.14', 'a')], self.server.indexed)
+
+    def test_response_that_is_not_json_raises(self):
+        transport = self._get_transport()
+        self.server.not_json = True
+        self.assertRaises(TransportException, self._send, transport, ['a'])
+
+    def test_rejects_formats_other_than_json(self):
+        self.assertRaises(TransportException, self._get_transport, 'format: msgpack\n')
+
+        logfile = tempfile.NamedTemporaryFile()
+        self.assertRaises(TransportException, self._get_transport, '\n[{0}]\nformat: raw\n'.format(logfile.name))
+
+        # file sections sent with another transport do not matter
+        self._get_transport('\n[{0}]\nformat: raw\ntransport: tcp\n'.format(logfile.name))
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import glob
+import logging
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from beaver.tests.fixtures import get_beaver_config
+from beaver.transports import create_transport
+from beaver.transports.base_transport import BaseTransport
+from beaver.transports.exception import TransportException
+from beaver.transports.fanout_transport import FanoutTransport
+
+
+class RecordingTransport(BaseTransport):
+    sent = []
+
+    def callback(self, filename, lines, **kwargs):
+        timestamp = self.get_timestamp(**kwargs)
+        if kwargs.get('timestamp', False):
+            del kwargs['timestamp']
+
+        for line in lines:
+            RecordingTransport.sent.append(self.format(filename, line, timestamp, **kwargs))
+
+
+class BlockedTransport(BaseTransport):
+    unblocked = threading.Event()
+    sent = []
+
+    def callback(self, filename, lines, **kwargs):
+        BlockedTransport.unblocked.wait()
+        BlockedTransport.sent.extend(lines)
+
+
+class DownTransport(BaseTransport):
+    up = False
+    sent = []
+
+    def callback(self, filename, lines, **kwargs):
+        if not DownTransport.up:
+            raise TransportException('down')
+        DownTransport.sent.extend(lines)
+
+
+class FanoutTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        RecordingTransport.sent = []
+        BlockedTransport.sent = []
+        BlockedTransport.unblocked.clear()
+        DownTransport.up = False
+        DownTransport.sent = []
+
+    def _get_config(self, transport, options=''):
+        config = '[beaver]\nlogstash_version: 1\nfanout_queue_size: 2\n'
+        return get_beaver_config(config + options, transport=transport, format='raw')
+
+    def test_transport_list(self):
+        beaver_config = self._get_config('stdout,stdout')
+        transport = create_transport(beaver_config, logger=self.logger)
+        self.assertIsInstance(transport, FanoutTransport)
+
+    def test_formats_once(self):
+        recording = 'beaver.tests.test_fanout_transport.RecordingTransport'
+        beaver_config = self._get_config(recording + ',' + recording)
+        transport = create_transport(beaver_config, logger=self.logger)
+
+        with mock.patch.object(FanoutTransport, 'format', return_value='formatted') as format:
+            transport.callback('/tmp/a.log', ['one', 'two'], type='file', tags=[], fields={})
+            transport.flush()
+
+        self.assertEqual(2, format.call_count)
+        self.assertEqual(['formatted'] * 4, RecordingTransport.sent)
+        self.assertEqual(4, transport.stats()[recording + '.lines'])
+
+    def test_slow_transport_does_not_stall_others(self):
+        beaver_config = self._get_config('beaver.tests.test_fanout_transport.BlockedTransport,beaver.tests.test_fanout_transport.RecordingTransport')
+        transport = create_transport(beaver_config, logger=self.logger)
+
+        for n in range(3):
+            transport.callback('/tmp/a.log', [str(n)], type='file', tags=[], fields={})
+
+        transport.flush(timeout=0.2)
+        self.assertEqual(['0', '1', '2'], RecordingTransport.sent)
+        self.assertEqual([], BlockedTransport.sent)
+
+        BlockedTransport.unblocked.set()
+        transport.flush()
+        self.assertEqual(['0', '1', '2'], BlockedTransport.sent)
+
+    def test_down_transport_spools_its_batches(self):
+        spool_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_path)
+        beaver_config = self._get_config('beaver.tests.test_fanout_transport.DownTransport,beaver.tests.test_fanout_transport.RecordingTransport',
+                                         'spool_path: {0}\nrespawn_delay: 1\nwait_timeout: 1\n'.format(spool_path))
+        beaver_config.set('consumer_partition', 2)
+        transport = create_transport(beaver_config, logger=self.logger)
+        self.addCleanup(transport.interrupt)
+
+        for n in range(3):
+            transport.callback('/tmp/a.log', [str(n)], type='file', tags=[], fields={})
+        self.assertTrue(transport.flush(timeout=1))
+        # one spool per consumer partition and transport
+        self.assertTrue(glob.glob(os.path.join(spool_path, 'spool-fanout2-0-*')))
+        self.assertEqual(['0', '1', '2'], RecordingTransport.sent)
+        self.assertEqual(3, transport.stats()['beaver.tests.test_fanout_transport.DownTransport.spooled'])
+
+        # replayed in order once the transport is back
+        DownTransport.up = True
+        deadline = time.time() + 5
+        while len(DownTransport.sent) < 3 and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(['0', '1', '2'], DownTransport.sent)
+
+    def test_flush_reports_unsent_batches(self):
+        beaver_config = self._get_config('beaver.tests.test_fanout_transport.BlockedTransport,beaver.tests.test_fanout_transport.RecordingTransport')
+        transport = create_transport(beaver_config, logger=self.logger)
+        transport.callback('/tmp/a.log', ['0'], type='file', tags=[], fields={})
+
+        self.assertFalse(transport.flush(timeout=0.1))
+        BlockedTransport.unblocked.set()
+        self.assertTrue(transport.flush())
+
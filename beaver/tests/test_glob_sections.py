@@ -22,5 +22,24 @@ class ConfigTests(unittest.TestCase):
         for file in self.beaver_config.getfilepaths():
             self.assertTrue(file in files)
 
+    def test_delglob(self):
+        files = self.beaver_config.getfilepaths()
+        self.assertTrue(len(files) > 0)
+
+        globname = './tests/logs/0x[0-9]*.log'
+        self.beaver_config.delglob(globname, files[:1])
+        self.assertFalse(files[0] in self.beaver_config.getfilepaths())
+
+        self.beaver_config.addglob(globname, files[:1])
+        self.assertTrue(files[0] in self.beaver_config.getfilepaths())
+
+    def test_copy_is_updated_separately(self):
+        files = self.beaver_config.getfilepaths()
+        copy = self.beaver_config.copy()
+
+        copy.delglob('./tests/logs/0x[0-9]*.log', files[:1])
+        self.assertFalse(files[0] in copy.getfilepaths())
+        self.assertTrue(files[0] in self.beaver_config.getfilepaths())
+
 if __name__ == '__main__':
     unittest.main()
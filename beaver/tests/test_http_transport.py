@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import BaseHTTPServer
+import errno
+import gzip
+import logging
+import socket
+import SocketServer
+import StringIO
+import threading
+import time
+
+from beaver.tests.fixtures import get_beaver_config
+from beaver.transports.exception import TransportException
+from beaver.transports.http_transport import HttpTransport
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Records posts, answering with the next queued status or 200"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond(200)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO.StringIO(body)).read()
+        self.server.posts.append((self.client_address, dict(self.headers), body))
+
+        with self.server.lock:
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.active -= 1
+
+        status = 200
+        if body in self.server.failing:
+            status = 503
+        elif self.server.statuses:
+            status = self.server.statuses.pop(0)
+        self._respond(status)
+
+    def _respond(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        # connections are shut down and their threads joined when a test
+        # ends, so that no handler is left running at interpreter exit
+        thread = threading.Thread(target=self.process_request_thread, args=(request, client_address))
+        thread.daemon = True
+        self.handlers.append((thread, request))
+        thread.start()
+
+    def handle_error(self, request, client_address):
+        # connections reset by the transport are not errors
+        error = sys.exc_info()[1]
+        if isinstance(error, socket.error) and error.errno in (errno.ECONNRESET, errno.EPIPE):
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+
+class HttpTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.server = StubServer(('127.0.0.1', 0), StubHandler)
+        self.server.handlers = []
+        self.server.posts = []
+        self.server.statuses = []
+        self.server.failing = set()
+        self.server.delay = 0
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.lock = threading.Lock()
+
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for thread, request in self.server.handlers:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            thread.join(1)
+
+    def _get_transport(self, options=''):
+        config = '[beaver]\nlogstash_version: 1\nformat: raw\nhttp_url: http://127.0.0.1:{0}/\n'.format(self.server.server_port)
+        beaver_config = get_beaver_config(config + options, transport='http')
+        transport = HttpTransport(beaver_config, logger=self.logger)
+        self.addCleanup(transport._session.close)
+        return transport
+
+    def _send(self, transport, lines):
+        transport.callback('/tmp/a.log', lines, type='t', tags=[], fields={})
+
+    def test_posts_each_line(self):
+        transport = self._get_transport()
+        self._send(transport, ['a', 'b'])
+        self.assertEqual(['a', 'b'], [body for address, headers, body in self.server.posts])
+
+    def test_bulk_posts_batch_over_one_connection(self):
+        transport = self._get_transport('http_bulk: 1\n')
+        self._send(transport, ['a', 'b\tc'])
+        self._send(transport, ['d'])
+
+        self.assertEqual(['a\nb\\tc\n', 'd\n'], [body for address, headers, body in self.server.posts])
+        self.assertEqual(1, len(set(address for address, headers, body in self.server.posts)))
+        self.assertEqual('application/x-ndjson', self.server.posts[0][1]['content-type'])
+        self.assertEqual(2, transport.stats()['requests'])
+
+    def test_bulk_splits_large_batches(self):
+        transport = self._get_transport('http_bulk: 1\nhttp_max_body_bytes: 10\ncompression: gzip\n')
+        self._send(transport, ['1234', '5678', '9', 'a long line'])
+
+        self.assertEqual(['1234\n5678\n', '9\n', 'a long line\n'], [body for address, headers, body in self.server.posts])
+        self.assertEqual('gzip', self.server.posts[0][1]['content-encoding'])
+
+    def test_non_2xx_responses_raise(self):
+        transport = self._get_transport('http_bulk: 1\n')
+
+        for status in [503, 429, 400, 401, 403, 404, 408]:
+            self.server.statuses = [status]
+            self.assertRaises(TransportException, self._send, transport, ['a'])
+
+    def test_too_large_bodies_are_split(self):
+        transport = self._get_transport('http_bulk: 1\n')
+        self.server.statuses = [413, 200, 413, 413]
+        self._send(transport, ['a', 'b', 'c'])
+
+        # the single line still too large is dropped
+        self.assertEqual(['a\nb\nc\n', 'a\n', 'b\nc\n', 'b\n', 'c\n'], [body for address, headers, body in self.server.posts])
+        self.assertEqual(1, transport.stats()['rejected'])
+
+    def test_connection_error_raises(self):
+        transport = self._get_transport('http_bulk: 1\n')
+        self.server.shutdown()
+        self.server.server_close()
+        transport._session.close()
+
+        self.assertRaises(TransportException, self._send, transport, ['a'])
+
+    def test_posts_concurrently(self):
+        transport = self._get_transport('http_max_in_flight: 3\n')
+        self.server.delay = 0.05
+        self._send(transport, [str(n) for n in range(9)])
+
+        self.assertEqual(set(str(n) for n in range(9)), set(body for address, headers, body in self.server.posts))
+        self.assertTrue(1 < self.server.max_active <= 3)
+
+    def test_only_failed_concurrent_posts_are_sent_again(self):
+        transport = self._get_transport('http_max_in_flight: 3\n')
+        self.server.failing = set(['b'])
+        self._send(transport, ['a', 'b', 'c', 'd'])
+        self.assertEqual(4, len(self.server.posts))
+
+        # still failing, so the next batch is not posted
+        self.assertRaises(TransportException, self._send, transport, ['e'])
+        self.assertFalse(transport.flush())
+
+        self.server.failing = set()
+        self._send(transport, ['e'])
+        self.assertEqual(['a', 'b', 'b', 'b', 'b', 'c', 'd', 'e'], sorted(body for address, headers, body in self.server.posts))
+        self.assertTrue(transport.flush())
+
+    def test_batch_raises_when_no_post_went_through(self):
+        transport = self._get_transport('http_max_in_flight: 3\n')
+        self.server.failing = set(['a', 'b'])
+        self.assertRaises(TransportException, self._send, transport, ['a', 'b'])
+        self.assertTrue(transport.flush(0))
@@ -17,7 +17,7 @@ from beaver.transports import create_transport
 
 from beaver.unicode_dammit import unicode_dammit
 
-from fixtures import Fixture, ZookeeperFixture, KafkaFixture
+from fixtures import Fixture, ZookeeperFixture, KafkaFixture, get_beaver_config
 
 try:
     from beaver.transports.kafka_transport import KafkaTransport
@@ -87,3 +87,54 @@ class KafkaTests(unittest.TestCase):
         consumer = MultiProcessConsumer(kafka, None, cls.beaver_config.get('kafka_topic'), num_procs=5)
         return consumer.get_messages(count=100, block=True, timeout=5)
 
+
+
+@unittest.skipIf(skip, 'kafka not installed')
+class KafkaBatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        for name in ['KafkaClient', 'SimpleProducer', 'KeyedProducer']:
+            patcher = mock.patch('beaver.transports.kafka_transport.' + name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def _get_transport(self, options=''):
+        config = '[beaver]\nlogstash_version: 1\nformat: raw\nhostname: web1\nkafka_topic: logs\n'
+        beaver_config = get_beaver_config(config + options, transport='kafka')
+        return create_transport(beaver_config, logger=self.logger)
+
+    def test_batch_sent_in_few_calls(self):
+        transport = self._get_transport('kafka_batch_n: 3\n')
+        transport.callback('/tmp/a.log', [u'l{0}'.format(n) for n in range(7)], type='t', tags=[], fields={})
+
+        producer = self.SimpleProducer.return_value
+        self.assertEqual([
+            mock.call('logs', 'l0', 'l1', 'l2'),
+            mock.call('logs', 'l3', 'l4', 'l5'),
+            mock.call('logs', 'l6'),
+        ], producer.send_messages.call_args_list)
+        self.assertEqual({'requests': 3, 'messages': 7, 'bytes': 14}, transport.stats())
+
+    def test_batch_split_by_bytes(self):
+        transport = self._get_transport('kafka_batch_max_bytes: 5\n')
+        transport.callback('/tmp/a.log', ['123', '45', '6', 'a long line'], type='t', tags=[], fields={})
+
+        producer = self.SimpleProducer.return_value
+        self.assertEqual([
+            mock.call('logs', '123', '45'),
+            mock.call('logs', '6'),
+            mock.call('logs', 'a long line'),
+        ], producer.send_messages.call_args_list)
+
+    def test_key_by_file(self):
+        transport = self._get_transport('kafka_key_by: file\nkafka_round_robin: 1\n')
+        transport.callback('/tmp/a.log', ['1', '2'], type='t', tags=[], fields={})
+
+        self.assertIsNone(self.KeyedProducer.call_args[1]['partitioner'])
+        self.assertEqual([mock.call('logs', '/tmp/a.log', '1', '2')], self.KeyedProducer.return_value.send_messages.call_args_list)
+
+    def test_key_by_host(self):
+        transport = self._get_transport('kafka_key_by: host\n')
+        transport.callback('/tmp/a.log', ['1'], type='t', tags=[], fields={})
+        self.assertEqual([mock.call('logs', 'web1', '1')], self.KeyedProducer.return_value.send_messages.call_args_list)
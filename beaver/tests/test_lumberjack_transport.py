@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import json
+import logging
+import socket
+import StringIO
+import threading
+import zlib
+
+from beaver.tests.fixtures import get_beaver_config
+from beaver.transports import create_transport
+from beaver.transports.exception import TransportException
+from beaver.transports.lumberjack_transport import ACK_FRAME, COMPRESSED_FRAME, JSON_FRAME, WINDOW_FRAME
+
+
+class Receiver(object):
+    """In-process stand-in for a logstash beats input
+
+    Decodes the windows sent on each connection, and acknowledges them
+    by calling on_window, which acks the whole window by default. The
+    sequence numbers of the events of each window are kept in sequences
+    """
+
+    def __init__(self):
+        self.connections = []
+        self.sequences = []
+        self.windows = []
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.server.close()
+
+    def events(self, connection=None):
+        events = []
+        for n, window in self.windows:
+            if connection is None or n == connection:
+                events.extend(json.loads(event)['message'] for event in window)
+        return events
+
+    def on_window(self, connection, last):
+        connection.sendall(ACK_FRAME.pack('2', 'A', last))
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except socket.error:
+                return
+
+            self.connections.append(connection)
+            thread = threading.Thread(target=self._receive, args=(connection, len(self.connections) - 1))
+            thread.daemon = True
+            thread.start()
+
+    def _receive(self, connection, n):
+        stream = connection.makefile('rb')
+        while True:
+            header = stream.read(WINDOW_FRAME.size)
+            if not header:
+                return
+
+            version, frame_type, count = WINDOW_FRAME.unpack(header)
+            assert (version, frame_type) == ('2', 'W')
+
+            events = []
+            sequences = []
+            while len(events) < count:
+                version, frame_type = stream.read(2)
+                if frame_type == 'C':
+                    size = COMPRESSED_FRAME.unpack(version + frame_type + stream.read(4))[2]
+                    frames = StringIO.StringIO(zlib.decompress(stream.read(size)))
+                    while len(events) < count:
+                        self._read_event(frames, frames.read(2), events, sequences)
+                else:
+                    self._read_event(stream, version + frame_type, events, sequences)
+
+            self.sequences.append(sequences)
+            self.windows.append((n, events))
+            self.on_window(connection, sequences[-1])
+
+    def _read_event(self, stream, header, events, sequences):
+        version, frame_type, sequence, size = JSON_FRAME.unpack(header + stream.read(8))
+        assert (version, frame_type) == ('2', 'J')
+        events.append(stream.read(size))
+        sequences.append(sequence)
+
+
+class LumberjackTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.receiver = Receiver()
+
+    def tearDown(self):
+        self.receiver.close()
+
+    def _get_transport(self, **options):
+        config = {
+            'logstash_version': '1',
+            'format': 'json',
+            'lumberjack_port': self.receiver.port,
+            'lumberjack_timeout': '5',
+        }
+        config.update(options)
+
+        config = '[beaver]\n' + ''.join('{0}: {1}\n'.format(key, value) for key, value in config.items())
+        beaver_config = get_beaver_config(config, transport='lumberjack')
+        return create_transport(beaver_config, logger=self.logger)
+
+    def _send(self, transport, lines):
+        transport.callback('/tmp/a.log', lines, type='t', tags=[], fields={})
+
+    def test_windows_are_acked(self):
+        transport = self._get_transport(lumberjack_window_size=2)
+        self._send(transport, ['a', 'b', 'c'])
+        self._send(transport, ['d', 'e'])
+
+        self.assertTrue(transport.flush(5))
+        self.assertEqual(['a', 'b', 'c', 'd', 'e'], self.receiver.events())
+        self.assertEqual([[1, 2], [1], [1, 2]], self.receiver.sequences)
+        self.assertEqual(5, transport.stats()['acked'])
+        self.assertEqual(3, transport.stats()['windows'])
+
+    def test_windows_are_pipelined(self):
+        # acks nothing until two windows have been received
+        received = []
+
+        def on_window(connection, last):
+            received.append(last)
+            if len(received) == 2:
+                for sequence in received:
+                    connection.sendall(ACK_FRAME.pack('2', 'A', sequence))
+
+        self.receiver.on_window = on_window
+        transport = self._get_transport(lumberjack_window_size=2, lumberjack_max_windows=2, lumberjack_compression_level=0)
+        self._send(transport, ['a', 'b', 'c', 'd'])
+
+        self.assertTrue(transport.flush(5))
+        self.assertEqual(['a', 'b', 'c', 'd'], self.receiver.events())
+
+    def test_unacked_events_are_sent_again(self):
+        def on_window(connection, last):
+            # acks the first event of the window, then goes away
+            if len(self.receiver.connections) == 1:
+                connection.sendall(ACK_FRAME.pack('2', 'A', 1))
+                connection.shutdown(socket.SHUT_RDWR)
+            else:
+                connection.sendall(ACK_FRAME.pack('2', 'A', last))
+
+        self.receiver.on_window = on_window
+        transport = self._get_transport()
+        self._send(transport, ['a', 'b', 'c'])
+
+        self.assertFalse(transport.flush(5))
+        self.assertFalse(transport.valid())
+        self.assertRaises(TransportException, self._send, transport, ['d'])
+
+        transport.reconnect()
+        self._send(transport, ['d'])
+        self.assertTrue(transport.flush(5))
+        self.assertEqual(['b', 'c', 'd'], self.receiver.events(1))
+        self.assertEqual([[1, 2, 3], [1, 2], [1]], self.receiver.sequences)
+        self.assertEqual(2, transport.stats()['retried'])
+
+    def test_rejects_formats_other_than_json(self):
+        self.assertRaises(TransportException, self._get_transport, format='msgpack')
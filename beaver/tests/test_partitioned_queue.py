@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import glob
+import os
+import Queue
+import threading
+import time
+
+from beaver.partitioned_queue import PartitionedQueue, TransportRouter
+from beaver.tests.fixtures import get_beaver_config
+
+
+def batch(filename, n):
+    return ('callback', {'filename': filename, 'lines': [str(n)]})
+
+
+class PartitionedQueueTests(unittest.TestCase):
+
+    def test_same_file_same_partition(self):
+        queue = PartitionedQueue(4)
+        for n in range(10):
+            queue.put(batch('/var/log/a.log', n))
+
+        partition = queue.partition({'filename': '/var/log/a.log'})
+        consumer = queue.consumer(partition)
+        lines = [consumer.get(timeout=1)[1]['lines'][0] for n in range(10)]
+        self.assertEqual([str(n) for n in range(10)], lines)
+
+        for n in range(4):
+            if n != partition:
+                self.assertRaises(Queue.Empty, queue.consumer(n).get, True, 0.1)
+
+    def test_control_commands_reach_every_consumer(self):
+        queue = PartitionedQueue(3)
+        queue.put(('addglob', ('/var/log/*.log', ['/var/log/a.log'])))
+        queue.put(('exit', ()))
+        time.sleep(0.1)
+        for n in range(3):
+            consumer = queue.consumer(n)
+            self.assertEqual([('exit', ())], consumer.get_control())
+            self.assertRaises(Queue.Empty, consumer.get, True, 0.1)
+
+    def test_glob_updates_are_ordered_with_batches(self):
+        queue = PartitionedQueue(2)
+        filename = '/var/log/a.log'
+        queue.put(batch(filename, 0))
+        queue.put(('addglob', ('/var/log/*.log', [filename])))
+        queue.put(batch(filename, 1))
+        queue.put(('delglob', ('/var/log/*.log', [filename])))
+        queue.put(batch(filename, 2))
+
+        partition = queue.partition({'filename': filename})
+        consumer = queue.consumer(partition)
+        self.assertEqual(['callback', 'addglob', 'callback', 'delglob', 'callback'],
+                         [consumer.get(timeout=1)[0] for n in range(5)])
+
+        # updates only come with batches
+        other = queue.consumer(1 - partition)
+        self.assertEqual([], other.get_control())
+        self.assertRaises(Queue.Empty, other.get, True, 0.1)
+
+    def test_waits_for_glob_updates_sent_before_a_batch(self):
+        queue = PartitionedQueue(1, threaded=True)
+        consumer = queue.consumer(0)
+        queue.put(batch('/var/log/a.log', 0))
+        queue.put(('addglob', ('/var/log/*.log', ['/var/log/a.log'])))
+        queue.put(batch('/var/log/a.log', 1))
+
+        # the update has not arrived yet when the second batch is taken
+        update = consumer._control.get()
+        timer = threading.Timer(0.1, consumer._control.put, [update])
+        timer.start()
+        self.addCleanup(timer.join)
+
+        self.assertEqual(['callback', 'addglob', 'callback'], [consumer.get(timeout=1)[0] for n in range(3)])
+
+    def test_work_stealing_keeps_partition_locked(self):
+        queue = PartitionedQueue(2, work_stealing=True)
+        filename = '/var/log/a.log'
+        partition = queue.partition({'filename': filename})
+        owner = queue.consumer(partition)
+        thief = queue.consumer(1 - partition)
+
+        queue.put(batch(filename, 0))
+        queue.put(batch(filename, 1))
+
+        self.assertEqual(['0'], thief.get(timeout=1)[1]['lines'])
+
+        # the owner cannot take the next batch before the thief is done
+        self.assertFalse(queue._locks[partition].acquire(False))
+        thief.close()
+        self.assertEqual(['1'], owner.get(timeout=1)[1]['lines'])
+
+    def test_owner_times_out_while_a_thief_holds_its_partition(self):
+        queue = PartitionedQueue(2, work_stealing=True)
+        filename = '/var/log/a.log'
+        partition = queue.partition({'filename': filename})
+        owner = queue.consumer(partition)
+        thief = queue.consumer(1 - partition)
+
+        queue.put(batch(filename, 0))
+        queue.put(batch(filename, 1))
+        self.assertEqual(['0'], thief.get(timeout=1)[1]['lines'])
+        release = thief.hold()
+
+        started = time.time()
+        self.assertRaises(Queue.Empty, owner.get, True, 0.2)
+        self.assertTrue(time.time() - started < 1)
+        self.assertRaises(Queue.Empty, owner.get_nowait)
+
+        release()
+        thief.close()
+        self.assertEqual(['1'], owner.get(timeout=1)[1]['lines'])
+
+    def test_drain_stays_on_partition(self):
+        queue = PartitionedQueue(2, work_stealing=True)
+        filename = '/var/log/a.log'
+        partition = queue.partition({'filename': filename})
+        thief = queue.consumer(1 - partition)
+
+        for n in range(3):
+            queue.put(batch(filename, n))
+        time.sleep(0.1)
+
+        self.assertEqual(['0'], thief.get(timeout=1)[1]['lines'])
+        self.assertEqual(['1'], thief.drain_nowait()[1]['lines'])
+        self.assertEqual(['2'], thief.drain_nowait()[1]['lines'])
+        self.assertRaises(Queue.Empty, thief.drain_nowait)
+        self.assertFalse(queue._locks[partition].acquire(False))
+
+    def test_threaded(self):
+        queue = PartitionedQueue(2, threaded=True)
+        data = {'filename': '/var/log/a.log', 'lines': ['0']}
+        queue.put(('callback', data))
+        queue.put(('exit', ()))
+
+        consumer = queue.consumer(queue.partition(data))
+        self.assertTrue(consumer.get(timeout=1)[1] is data)
+        self.assertEqual([('exit', ())], consumer.get_control())
+
+    def test_transport_groups(self):
+        beaver_config = get_beaver_config('[beaver]\ntransport: redis\n\n[./tests/logs/0x[0-9]*.log]\ntransport: tcp\n', mode='bind')
+
+        transports = beaver_config.get_transports()
+        self.assertEqual(['redis', 'tcp'], transports)
+
+        queue = PartitionedQueue(4, groups=2, work_stealing=True, router=TransportRouter(beaver_config, transports), threaded=True)
+        self.assertEqual([0, 0, 1, 1], [queue.group(n) for n in range(4)])
+
+        routed = {'filename': os.path.realpath(glob.glob('tests/logs/0x[0-9]*.log')[0]), 'lines': ['0']}
+        self.assertTrue(queue.partition(routed) in (2, 3))
+        self.assertTrue(queue.partition({'filename': '/var/log/a.log'}) in (0, 1))
+
+        # consumers of the main transport never steal batches of another transport
+        queue.put(('callback', routed))
+        self.assertRaises(Queue.Empty, queue.consumer(0).get, True, 0.2)
+        self.assertTrue(queue.consumer(2).get(timeout=1)[1] is routed)
+
+    def test_held_partition_stays_locked(self):
+        queue = PartitionedQueue(2, work_stealing=True)
+        filename = '/var/log/a.log'
+        partition = queue.partition({'filename': filename})
+        owner = queue.consumer(partition)
+        thief = queue.consumer(1 - partition)
+
+        queue.put(batch(filename, 0))
+        self.assertEqual(['0'], thief.get(timeout=1)[1]['lines'])
+        release = thief.hold()
+
+        # still in flight once the thief asked for the next batch
+        self.assertRaises(Queue.Empty, thief.get, True, 0.1)
+        self.assertFalse(queue._locks[partition].acquire(False))
+
+        release()
+        queue.put(batch(filename, 1))
+        self.assertEqual(['1'], owner.get(timeout=1)[1]['lines'])
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import distutils.spawn
+import logging
+import mock
+import os
+import redis
+
+from beaver.tests.fixtures import RedisFixture, get_beaver_config
+from beaver.transports.exception import TransportException
+from beaver.transports.redis_transport import RedisTransport
+
+skip = 'REDIS_URI' not in os.environ and distutils.spawn.find_executable('redis-server') is None
+
+
+class RedisTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        patcher = mock.patch('redis.StrictRedis.from_url')
+        self.from_url = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_transport(self, options=''):
+        config = '[beaver]\nlogstash_version: 1\nformat: raw\nredis_namespace: a,b\nrespawn_delay: 30\n'
+        beaver_config = get_beaver_config(config + options, transport='redis')
+        return RedisTransport(beaver_config, logger=self.logger)
+
+    def _commands(self):
+        pipeline = self.from_url.return_value.pipeline.return_value
+        return [(name, args) for name, args, kwargs in pipeline.method_calls if name != 'execute']
+
+    def test_rpush_many_values(self):
+        transport = self._get_transport('redis_rpush_max_values: 2\n')
+        transport.callback('/tmp/a.log', ['1', '2', '3'], type='t', tags=[], fields={})
+
+        self.assertEqual([
+            ('rpush', ('a', '1', '2')),
+            ('rpush', ('a', '3')),
+            ('rpush', ('b', '1', '2')),
+            ('rpush', ('b', '3')),
+        ], self._commands())
+
+    def test_rpush_max_bytes(self):
+        transport = self._get_transport('redis_namespace: a\nredis_rpush_max_bytes: 5\n')
+        transport.callback('/tmp/a.log', ['123', '45', '6', 'a long line'], type='t', tags=[], fields={})
+
+        self.assertEqual([
+            ('rpush', ('a', '123', '45')),
+            ('rpush', ('a', '6')),
+            ('rpush', ('a', 'a long line')),
+        ], self._commands())
+
+    def test_publish_each_line(self):
+        transport = self._get_transport('redis_data_type: channel\n')
+        transport.callback('/tmp/a.log', ['1', '2'], type='t', tags=[], fields={})
+
+        self.assertEqual([
+            ('publish', ('a', '1')),
+            ('publish', ('a', '2')),
+            ('publish', ('b', '1')),
+            ('publish', ('b', '2')),
+        ], self._commands())
+
+    def test_stream_entry_per_line(self):
+        transport = self._get_transport('redis_data_type: stream\nredis_namespace: a\nredis_stream_maxlen: 100\n')
+        transport.callback('/tmp/a.log', ['1', '2'], type='t', tags=[], fields={})
+
+        pipeline = self.from_url.return_value.pipeline.return_value
+        self.assertEqual([
+            mock.call('a', {'message': '1'}, maxlen=100, approximate=True),
+            mock.call('a', {'message': '2'}, maxlen=100, approximate=True),
+        ], pipeline.xadd.call_args_list)
+
+    def test_stream_entry_per_batch(self):
+        transport = self._get_transport('redis_data_type: stream\nredis_namespace: a\nredis_stream_entry: batch\nredis_stream_field: lines_text\n')
+        transport.callback('/tmp/a.log', ['1', '2'], type='t', tags=[], fields={})
+
+        pipeline = self.from_url.return_value.pipeline.return_value
+        self.assertEqual([
+            mock.call('a', {'lines_text': '1\n2\n', 'lines': 2}, maxlen=None, approximate=True),
+        ], pipeline.xadd.call_args_list)
+
+    def _get_servers(self, count):
+        servers = [mock.MagicMock() for n in range(count)]
+        self.from_url.side_effect = servers
+        return servers
+
+    def _pushed(self, server):
+        pipeline = server.pipeline.return_value
+        return [value for name, args, kwargs in pipeline.method_calls if name == 'rpush' for value in args[1:]]
+
+    def test_split_across_servers(self):
+        servers = self._get_servers(2)
+        transport = self._get_transport('redis_url: redis://one,redis://two\nredis_namespace: a\nredis_split_lines: 2\n')
+        lines = [str(n) for n in range(6)]
+        transport.callback('/tmp/a.log', lines, type='t', tags=[], fields={})
+
+        self.assertEqual(3, len(self._pushed(servers[0])))
+        self.assertEqual(sorted(lines), sorted(self._pushed(servers[0]) + self._pushed(servers[1])))
+
+    def test_split_weighted_by_latency(self):
+        servers = self._get_servers(2)
+        transport = self._get_transport('redis_url: redis://one,redis://two\nredis_namespace: a\nredis_split_lines: 2\n')
+        transport._servers[0].latency = 0.003
+        transport._servers[1].latency = 0.001
+        transport.callback('/tmp/a.log', [str(n) for n in range(8)], type='t', tags=[], fields={})
+
+        self.assertEqual(2, len(self._pushed(servers[0])))
+        self.assertEqual(6, len(self._pushed(servers[1])))
+
+    def test_failed_server_is_left_out(self):
+        servers = self._get_servers(2)
+        transport = self._get_transport('redis_url: redis://one,redis://two\nredis_namespace: a\nredis_split_lines: 2\n')
+        servers[0].pipeline.return_value.execute.side_effect = redis.exceptions.ConnectionError('down')
+        lines = [str(n) for n in range(4)]
+        transport.callback('/tmp/a.log', lines, type='t', tags=[], fields={})
+
+        self.assertEqual(sorted(lines), sorted(self._pushed(servers[1])))
+        self.assertFalse(transport._servers[0].breaker.allow())
+        self.assertTrue(transport.valid())
+        # health checks are left to the background
+        self.assertEqual(1, servers[0].ping.call_count)
+
+        servers[1].pipeline.return_value.execute.side_effect = redis.exceptions.ConnectionError('down')
+        self.assertRaises(TransportException, transport.callback, '/tmp/a.log', lines, type='t', tags=[], fields={})
+        self.assertFalse(transport.valid())
+
+    def test_other_errors_fail_the_batch(self):
+        servers = self._get_servers(2)
+        transport = self._get_transport('redis_url: redis://one,redis://two\nredis_namespace: a\nredis_split_lines: 2\n')
+        self.addCleanup(transport.flush)
+        servers[0].pipeline.return_value.execute.side_effect = redis.exceptions.ResponseError('WRONGTYPE')
+
+        lines = [str(n) for n in range(4)]
+        self.assertRaises(TransportException, transport.callback, '/tmp/a.log', lines, type='t', tags=[], fields={})
+        self.assertTrue(transport._servers[0].breaker.allow())
+        self.assertEqual(2, len(self._pushed(servers[1])))
+
+    def test_flush_stops_workers(self):
+        servers = self._get_servers(2)
+        transport = self._get_transport('redis_url: redis://one,redis://two\nredis_namespace: a\nredis_split_lines: 2\n')
+        lines = [str(n) for n in range(4)]
+        transport.callback('/tmp/a.log', lines, type='t', tags=[], fields={})
+        workers = list(transport._workers)
+
+        self.assertTrue(transport.flush(1))
+        self.assertEqual([], transport._workers)
+        self.assertFalse(any(worker.is_alive() for worker in workers))
+
+        # started again by the next split batch
+        transport.callback('/tmp/a.log', lines, type='t', tags=[], fields={})
+        self.assertEqual(2, len(transport._workers))
+        self.assertTrue(transport.flush(1))
+
+    def test_unreachable_server(self):
+        servers = self._get_servers(2)
+        servers[1].ping.side_effect = redis.exceptions.ConnectionError('down')
+        transport = self._get_transport('redis_url: redis://one,redis://two\nredis_namespace: a\n')
+
+        self.assertEqual([transport._servers[0]], transport._get_servers())
+
+
+class RedisStreamTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # raised here, as nose runs setUpClass of skipped classes
+        if skip:
+            raise unittest.SkipTest('redis-server not installed')
+        cls.server = RedisFixture.instance()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def test_xadd_with_maxlen(self):
+        config = '[beaver]\nlogstash_version: 1\nformat: raw\nredis_data_type: stream\n'
+        config += 'redis_url: redis://{0}:{1}/0\nredis_namespace: beaver:stream\nredis_stream_maxlen: 10\n'.format(self.server.host, self.server.port)
+        beaver_config = get_beaver_config(config, transport='redis')
+        transport = RedisTransport(beaver_config, logger=logging.getLogger(__name__))
+
+        client = redis.StrictRedis(host=self.server.host, port=self.server.port)
+        client.delete('beaver:stream')
+        for n in range(50):
+            transport.callback('/tmp/a.log', [str(n * 10 + m) for m in range(10)], type='t', tags=[], fields={})
+
+        entries = client.xrange('beaver:stream')
+        # trimming is approximate, whole nodes of the stream are dropped
+        self.assertTrue(10 <= len(entries) < 500)
+        self.assertEqual({'message': '499'}, entries[-1][1])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import time
+
+from beaver.partitioned_queue import PartitionedQueue
+from beaver.run_queue import drain_queue, merge_batches
+
+
+def batch(filename, lines, timestamp='2016-01-01T00:00:00.000Z'):
+    return {
+        'fields': {},
+        'filename': filename,
+        'format': None,
+        'ignore_empty': False,
+        'lines': lines,
+        'tags': [],
+        'timestamp': timestamp,
+        'type': 'file',
+    }
+
+
+class RunQueueTests(unittest.TestCase):
+
+    def test_merge_batches(self):
+        merged = merge_batches([
+            batch('a.log', ['1']),
+            batch('b.log', ['x']),
+            batch('a.log', ['2', '3']),
+        ])
+
+        self.assertEqual(2, len(merged))
+        self.assertEqual(['1', '2', '3'], merged[0]['lines'])
+        self.assertEqual(['x'], merged[1]['lines'])
+        self.assertEqual([['2016-01-01T00:00:00.000Z', 3]], merged[0]['timestamps'])
+
+    def test_merge_batches_read_at_different_times(self):
+        merged = merge_batches([
+            batch('a.log', ['1'], timestamp='2016-01-01T00:00:00.000Z'),
+            batch('a.log', ['2', '3'], timestamp='2016-01-01T00:00:00.004Z'),
+            batch('a.log', ['4'], timestamp='2016-01-01T00:00:00.004Z'),
+            batch('a.log', ['5'], timestamp='2016-01-01T00:00:00.009Z'),
+        ])
+
+        self.assertEqual(1, len(merged))
+        self.assertEqual(['1', '2', '3', '4', '5'], merged[0]['lines'])
+        self.assertEqual('2016-01-01T00:00:00.000Z', merged[0]['timestamp'])
+        self.assertEqual([
+            ['2016-01-01T00:00:00.000Z', 1],
+            ['2016-01-01T00:00:00.004Z', 3],
+            ['2016-01-01T00:00:00.009Z', 1],
+        ], merged[0]['timestamps'])
+
+    def test_merge_batches_keeps_different_types(self):
+        other = batch('a.log', ['2'])
+        other['type'] = 'syslog'
+        merged = merge_batches([batch('a.log', ['1']), other])
+        self.assertEqual(2, len(merged))
+
+    def test_drain_queue_limits(self):
+        queue = PartitionedQueue(1)
+        for n in range(5):
+            queue.put(('callback', batch('a.log', ['x' * 10])))
+        time.sleep(0.1)
+
+        consumer = queue.consumer(0)
+        self.assertEqual(2, len(drain_queue(consumer, 1, 2, 1024)))
+        self.assertEqual(2, len(drain_queue(consumer, 1, 10, 15)))
+        self.assertEqual(1, len(drain_queue(consumer, 1, 10, 1024)))
+
+    def test_drain_queue_stops_at_glob_updates(self):
+        queue = PartitionedQueue(1)
+        queue.put(('callback', batch('a.log', ['1'])))
+        queue.put(('delglob', ('*.log', ['a.log'])))
+        queue.put(('callback', batch('a.log', ['2'])))
+        time.sleep(0.1)
+
+        consumer = queue.consumer(0)
+        self.assertEqual(['callback', 'delglob'], [command for command, data in drain_queue(consumer, 1, 10, 1024)])
+        self.assertEqual(['callback'], [command for command, data in drain_queue(consumer, 1, 10, 1024)])
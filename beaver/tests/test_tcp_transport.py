@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import logging
+import socket
+
+from beaver.tests.fixtures import get_beaver_config
+from beaver.transports.exception import TransportException
+from beaver.transports.tcp_transport import TcpTransport
+
+
+class ShortWriteSocket(object):
+    """Socket accepting at most a few bytes per send"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.received = ''
+
+    def send(self, data):
+        data = str(data[:self.limit])
+        self.received += data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class TcpTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+
+    def tearDown(self):
+        self.server.close()
+
+    def _get_transport(self, tcp_host='127.0.0.1', tcp_balance='round_robin'):
+        config = '[beaver]\nlogstash_version: 1\nformat: raw\ntcp_port: {0}\ntcp_sndbuf: 65536\n'.format(self.server.getsockname()[1])
+        config += 'tcp_host: {0}\ntcp_balance: {1}\nrespawn_delay: 30\n'.format(tcp_host, tcp_balance)
+        beaver_config = get_beaver_config(config, transport='tcp')
+        return TcpTransport(beaver_config, logger=self.logger)
+
+    def test_sends_batch_in_one_write(self):
+        transport = self._get_transport()
+        self.assertFalse(transport.concurrent_sends)
+        connection, address = self.server.accept()
+        self.assertEqual(1, transport._endpoints[0].sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
+        lines = ['line {0}'.format(n) for n in range(100)]
+        transport.callback('/tmp/a.log', lines, type='t', tags=[], fields={})
+
+        expected = ''.join(line + '\n' for line in lines)
+        received = ''
+        while len(received) < len(expected):
+            received += connection.recv(65536)
+        self.assertEqual(expected, received)
+        self.assertEqual({'batches': 1, 'bytes': len(expected), 'syscalls': 1}, transport.stats())
+        connection.close()
+
+    def test_resumes_short_writes(self):
+        transport = self._get_transport()
+        transport._endpoints[0].sock = ShortWriteSocket(7)
+
+        lines = ['line {0}'.format(n) for n in range(10)]
+        transport.callback('/tmp/a.log', lines, type='t', tags=[], fields={})
+        self.assertEqual(''.join(line + '\n' for line in lines), transport._endpoints[0].sock.received)
+        self.assertEqual((len(transport._endpoints[0].sock.received) + 6) // 7, transport.stats()['syscalls'])
+
+    def test_closed_connection(self):
+        transport = self._get_transport()
+        transport._endpoints[0].sock = ShortWriteSocket(0)
+        self.assertRaises(TransportException, transport.callback, '/tmp/a.log', ['line'], type='t', tags=[], fields={})
+        self.assertFalse(transport.valid())
+
+    def _listen(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+        return server
+
+    def _receive(self, connection, size):
+        received = ''
+        while len(received) < size:
+            received += connection.recv(65536)
+        return received
+
+    def test_round_robin_across_hosts(self):
+        other = self._listen()
+        transport = self._get_transport('127.0.0.1,127.0.0.1:{0}'.format(other.getsockname()[1]))
+        connections = [self.server.accept()[0], other.accept()[0]]
+
+        for n in range(4):
+            transport.callback('/tmp/a.log', ['line {0}'.format(n)], type='t', tags=[], fields={})
+
+        self.assertEqual('line 0\nline 2\n', self._receive(connections[0], 14))
+        self.assertEqual('line 1\nline 3\n', self._receive(connections[1], 14))
+        self.assertEqual(2, transport.stats()['127.0.0.1:{0}.batches'.format(other.getsockname()[1])])
+        self.assertTrue(transport.concurrent_sends)
+
+    def test_least_in_flight(self):
+        other = self._listen()
+        transport = self._get_transport('127.0.0.1,127.0.0.1:{0}'.format(other.getsockname()[1]), 'least_in_flight')
+        transport._endpoints[0].sending = 1
+
+        self.assertEqual(transport._endpoints[1:] + transport._endpoints[:1], transport._balance())
+
+    def test_failed_host_is_ejected(self):
+        other = self._listen()
+        transport = self._get_transport('127.0.0.1,127.0.0.1:{0}'.format(other.getsockname()[1]))
+        connection = other.accept()[0]
+        transport._endpoints[0].sock = ShortWriteSocket(0)
+
+        for n in range(3):
+            transport.callback('/tmp/a.log', ['line {0}'.format(n)], type='t', tags=[], fields={})
+
+        self.assertEqual('line 0\nline 1\nline 2\n', self._receive(connection, 21))
+        self.assertFalse(transport._endpoints[0].breaker.allow())
+        self.assertTrue(transport.valid())
+
+    def test_unreachable_host(self):
+        port = self.server.getsockname()[1]
+        other = self._listen()
+        other_port = other.getsockname()[1]
+        other.close()
+
+        transport = self._get_transport('127.0.0.1:{0},127.0.0.1:{1}'.format(other_port, port))
+        self.assertTrue(transport.valid())
+        self.assertEqual([transport._endpoints[1]], transport._balance())
+
+        transport._endpoints[1].sock = ShortWriteSocket(0)
+        self.assertRaises(TransportException, transport.callback, '/tmp/a.log', ['line'], type='t', tags=[], fields={})
+        self.assertFalse(transport.valid())
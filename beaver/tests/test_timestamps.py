@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import datetime
+import mock
+import pickle
+
+from beaver import timestamps
+
+
+class TimestampTests(unittest.TestCase):
+
+    def test_matches_strftime(self):
+        with mock.patch('time.time', return_value=1476107736.123987):
+            timestamp = timestamps.now()
+
+        now = datetime.datetime.utcfromtimestamp(1476107736.123987)
+        self.assertEqual(now.strftime("%Y-%m-%dT%H:%M:%S") + ".%03d" % (now.microsecond / 1000) + "Z", timestamp)
+        self.assertEqual(1476107736.123, timestamp.epoch)
+
+    def test_cached_per_millisecond(self):
+        with mock.patch('time.time', return_value=1476107736.1231):
+            first = timestamps.now()
+        with mock.patch('time.time', return_value=1476107736.1239):
+            self.assertTrue(timestamps.now() is first)
+        with mock.patch('time.time', return_value=1476107736.124):
+            self.assertFalse(timestamps.now() is first)
+
+    def test_epoch_of_strings(self):
+        value = '2016-10-10T13:55:36.123Z'
+        delta = datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ") - datetime.datetime.utcfromtimestamp(0)
+        self.assertEqual(delta.days * 86400 + delta.seconds + delta.microseconds / 1e6, timestamps.epoch(value))
+        self.assertEqual(timestamps.Timestamp.from_epoch(timestamps.epoch(value)), value)
+
+    def test_pickles_with_epoch(self):
+        timestamp = timestamps.now()
+        copy = pickle.loads(pickle.dumps(timestamp, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(timestamp, copy)
+        self.assertEqual(timestamp.epoch, copy.epoch)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import calendar
+import threading
+import time
+
+FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+_cache = threading.local()
+
+
+class Timestamp(str):
+    """An ISO 8601 UTC timestamp, with millisecond precision, that also
+    carries its epoch seconds
+
+    It is the string events have always been stamped with, so it can be
+    used anywhere such a string is, while formatters needing a number
+    read epoch instead of parsing the string back.
+    """
+
+    def __new__(cls, value, epoch=None):
+        self = str.__new__(cls, value)
+        self.epoch = epoch
+        return self
+
+    @classmethod
+    def from_epoch(cls, seconds):
+        """Returns the Timestamp of epoch seconds, truncated to the millisecond"""
+        seconds, milliseconds = divmod(int(seconds * 1000), 1000)
+        value = time.strftime(FORMAT, time.gmtime(seconds)) + '.%03dZ' % milliseconds
+        return cls(value, seconds + milliseconds / 1000.0)
+
+
+def now():
+    """Returns the current Timestamp, created once per millisecond"""
+    milliseconds = int(time.time() * 1000)
+    cached = getattr(_cache, 'now', None)
+    if cached is None or cached[0] != milliseconds:
+        cached = _cache.now = (milliseconds, Timestamp.from_epoch(milliseconds / 1000.0))
+
+    return cached[1]
+
+
+def epoch(timestamp):
+    """Returns the epoch seconds of a timestamp, parsing it only if it is
+    a plain string, such as one read back from a spool"""
+    seconds = getattr(timestamp, 'epoch', None)
+    if seconds is not None:
+        return seconds
+
+    cached = getattr(_cache, 'parsed', None)
+    if cached is not None and cached[0] == timestamp:
+        return cached[1]
+
+    whole, fraction = timestamp.rstrip('Z').split('.')
+    seconds = calendar.timegm(time.strptime(whole, FORMAT)) + int(fraction.ljust(6, '0')[:6]) / 1e6
+    _cache.parsed = (timestamp, seconds)
+    return seconds
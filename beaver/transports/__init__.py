@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
 
 
-def create_transport(beaver_config, logger):
-    """Creates and returns a transport object"""
-    transport_str = beaver_config.get('transport')
+def create_transport(beaver_config, logger, transport=None):
+    """Creates and returns a transport object
+
+    transport overrides the transport set in beaver_config, so transports
+    made of other transports can create them
+    """
+    transport_str = transport or beaver_config.get('transport')
+    if ',' in transport_str:
+        # a list of transports gets every batch delivered to each of them
+        from beaver.transports.fanout_transport import FanoutTransport
+        return FanoutTransport(beaver_config=beaver_config, logger=logger, transports=transport_str.split(','))
+
     if '.' not in transport_str:
         # allow simple names like 'redis' to load a beaver built-in transport
         module_path = 'beaver.transports.%s_transport' % transport_str.lower()
@@ -13,7 +22,7 @@ def create_transport(beaver_config, logger):
         try:
             module_path, class_name = transport_str.rsplit('.', 1)
         except ValueError:
-            raise Exception('Invalid transport {0}'.format(beaver_config.get('transport')))
+            raise Exception('Invalid transport {0}'.format(transport_str))
 
     _module = __import__(module_path, globals(), locals(), class_name, -1)
     transport_class = getattr(_module, class_name)
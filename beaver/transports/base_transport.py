@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
-import datetime
+import threading
+import time
+
+from beaver import batch_envelope
+from beaver import timestamps
+from beaver.transports import compression
 
 # priority: ujson > simplejson > jsonlib2 > json
 priority = ['ujson', 'simplejson', 'jsonlib2', 'json']
@@ -16,6 +21,9 @@ try:
 except ImportError:
     import msgpack_pure as msgpack
 
+# message serialized in place of the real ones when building json templates
+MESSAGE_PLACEHOLDER = u'\x00beaver-message\x00'
+
 
 class BaseTransport(object):
 
@@ -28,12 +36,24 @@ class BaseTransport(object):
         self._beaver_config = beaver_config
         self._current_host = beaver_config.get('hostname')
         self._default_formatter = beaver_config.get('format', 'null')
+        self._format_cache = {}
         self._formatters = {}
+        self._rawjson_cache = None
         self._is_valid = True
         self._logger = logger
-        self._epoch = datetime.datetime.utcfromtimestamp(0)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._stats_interval = beaver_config.get('stats_interval')
+        self._stats_last = {}
+        self._stats_logged = time.time()
 
         self._logstash_version = beaver_config.get('logstash_version')
+        self._rawjson_passthrough = beaver_config.get('rawjson_passthrough')
+        self._batch_encoding = beaver_config.get('batch_encoding')
+
+        self._codec = None
+        if beaver_config.get('compression'):
+            self._codec = compression.get_codec(beaver_config.get('compression'), beaver_config.get('compression_level'))
         if self._logstash_version == 0:
             self._fields = {
                 'type': '@type',
@@ -79,10 +99,7 @@ class BaseTransport(object):
             short_message = message.split('\n', 1)[0]
             short_message = short_message[:250]
 
-            timestampDate = datetime.datetime.strptime(data['@timestamp'], "%Y-%m-%dT%H:%M:%S.%fZ")
-
-            delta = timestampDate - self._epoch
-            timestampSeconds = delta.days*86400+delta.seconds+delta.microseconds/1e6
+            timestampSeconds = timestamps.epoch(data['@timestamp'])
 
             gelf_data = {
                 'version': '1.1',
@@ -96,6 +113,11 @@ class BaseTransport(object):
 
             return json.dumps(gelf_data) + '\0'
 
+        def batch_formatter(data):
+            message = data.pop(self._fields.get('message'))
+            timestamp = data.pop('@timestamp')
+            return batch_envelope.encode(data, [message], [timestamp], self._fields.get('message'), self._batch_encoding)
+
         def string_formatter(data):
             return '[{0}] [{1}] {2}'.format(data[self._fields.get('host')], data['@timestamp'], data[self._fields.get('message')])
 
@@ -105,10 +127,17 @@ class BaseTransport(object):
         self._formatters['rawjson'] = rawjson_formatter
         self._formatters['string'] = string_formatter
         self._formatters['gelf'] = gelf_formatter
+        self._formatters['batch'] = batch_formatter
 
     def addglob(self, globname, globbed):
         """Adds a set of globbed files to the attached beaver_config"""
         self._beaver_config.addglob(globname, globbed)
+        self._format_cache = {}
+
+    def delglob(self, globname, globbed):
+        """Removes a set of files from a glob in the attached beaver_config"""
+        self._beaver_config.delglob(globname, globbed)
+        self._format_cache = {}
 
     def callback(self, filename, lines):
         """Processes a set of lines for a filename"""
@@ -116,37 +145,81 @@ class BaseTransport(object):
 
     def format(self, filename, line, timestamp, **kwargs):
         """Returns a formatted log line"""
+        if kwargs.get('preformatted'):
+            # already formatted once for several transports
+            return line
+
         line = unicode(line.encode("utf-8"), "utf-8", errors="ignore")
-        formatter = self._beaver_config.get_field('format', filename)
-        if formatter not in self._formatters:
-            formatter = self._default_formatter
+        formatter, event, overrides = self._get_formatter(filename, **kwargs)
 
-        data = {
-            self._fields.get('type'): kwargs.get('type'),
-            self._fields.get('tags'): kwargs.get('tags'),
-            '@timestamp': timestamp,
-            self._fields.get('host'): self._current_host,
-            self._fields.get('file'): filename,
-            self._fields.get('message'): line
-        }
+        if self._rawjson_passthrough and formatter is self._formatters['rawjson'] and self._fields.get('message') not in overrides:
+            passed = self._splice_rawjson(line, self._get_rawjson_fields(event, overrides, timestamp))
+            if passed is not None:
+                return passed
 
-        if self._logstash_version == 0:
-            data['@source'] = 'file://{0}'.format(filename)
-            data['@fields'] = kwargs.get('fields')
-        else:
-            data['@version'] = self._logstash_version
-            fields = kwargs.get('fields')
-            for key in fields:
-                data[key] = fields.get(key)
+        data = dict(event)
+        data['@timestamp'] = timestamp
+        data[self._fields.get('message')] = line
+        if overrides:
+            data.update(overrides)
+
+        return formatter(data)
 
-        return self._formatters[formatter](data)
+    def format_batch(self, filename, lines, timestamp, **kwargs):
+        """Returns the formatted log lines of a batch
+
+        With the batch format, the batch is a single envelope. With the
+        json format, the event shared by every line is serialized
+        once around a placeholder message, and the JSON-escaped message of
+        each line is spliced in its place, giving the same output as
+        format does for each line
+
+        Batches merged from batches read at different times carry
+        [timestamp, line count] pairs in timestamps, and their lines are
+        stamped with the timestamp of the batch they were read in
+        """
+        if kwargs.get('preformatted'):
+            return list(lines)
+
+        runs = kwargs.pop('timestamps', None)
+        formatter, event, overrides = self._get_formatter(filename, **kwargs)
+
+        if formatter is self._formatters['batch']:
+            return [self._batch_envelope(event, overrides, lines, timestamp, runs)]
+
+        if runs:
+            formatted = []
+            start = 0
+            for run_timestamp, count in runs:
+                formatted.extend(self.format_batch(filename, lines[start:start + count], run_timestamp, **kwargs))
+                start += count
+            return formatted
+
+        template = None
+        if formatter is self._formatters['json']:
+            template = self._json_template(event, overrides, timestamp)
+
+        if template is None:
+            return [self.format(filename, line, timestamp, **kwargs) for line in lines]
+
+        head, tail = template
+        dumps = json.dumps
+        return [head + dumps(unicode(line.encode("utf-8"), "utf-8", errors="ignore")) + tail for line in lines]
+
+    def compress_batch(self, lines):
+        """Returns formatted lines, each followed by a newline, compressed
+        in a single frame with the compression codec"""
+        return compression.frame(self._codec, join_lines(lines))
+
+    def flush(self, timeout=None):
+        """Waits for batches the transport has accepted but not sent yet"""
+        return True
 
     def get_timestamp(self, **kwargs):
         """Retrieves the timestamp for a given set of data"""
         timestamp = kwargs.get('timestamp')
         if not timestamp:
-            now = datetime.datetime.utcnow()
-            timestamp = now.strftime("%Y-%m-%dT%H:%M:%S") + ".%03d" % (now.microsecond / 1000) + "Z"
+            timestamp = timestamps.now()
 
         return timestamp
 
@@ -165,6 +238,11 @@ class BaseTransport(object):
         TransportException is thrown"""
         return True
 
+    def stats(self):
+        """Returns a copy of the counters kept by the transport"""
+        with self._stats_lock:
+            return dict(self._stats)
+
     def unhandled(self):
         """Allows unhandled exceptions to be
         handled properly by the transport
@@ -174,3 +252,153 @@ class BaseTransport(object):
     def valid(self):
         """Returns whether or not the transport can send data"""
         return self._is_valid
+
+    def _get_formatter(self, filename, **kwargs):
+        """Returns the formatter of a file, the event fields shared by all
+        of its lines, and the fields overriding message or @timestamp
+
+        These are cached per filename while type, tags and fields stay the
+        same, which saves a config lookup and a realpath call per line
+        """
+        cache_key = (kwargs.get('type'), kwargs.get('tags'), kwargs.get('fields'))
+        cached = self._format_cache.get(filename)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+
+        formatter = self._beaver_config.get_field('format', filename)
+        if formatter not in self._formatters:
+            formatter = self._default_formatter
+
+        event = {
+            self._fields.get('type'): kwargs.get('type'),
+            self._fields.get('tags'): kwargs.get('tags'),
+            self._fields.get('host'): self._current_host,
+            self._fields.get('file'): filename,
+        }
+        overrides = {}
+
+        if self._logstash_version == 0:
+            event['@source'] = 'file://{0}'.format(filename)
+            event['@fields'] = kwargs.get('fields')
+        else:
+            event['@version'] = self._logstash_version
+            fields = kwargs.get('fields')
+            for key in fields:
+                if key in ('@timestamp', self._fields.get('message')):
+                    overrides[key] = fields.get(key)
+                else:
+                    event[key] = fields.get(key)
+
+        formatter = (self._formatters[formatter], event, overrides)
+        self._format_cache[filename] = (cache_key, formatter)
+        return formatter
+
+    def _batch_envelope(self, event, overrides, lines, timestamp, runs=None):
+        """Returns the envelope sending the lines of a batch in one go"""
+        message_field = self._fields.get('message')
+        if message_field in overrides:
+            messages = [overrides[message_field]] * len(lines)
+        else:
+            messages = [unicode(line.encode("utf-8"), "utf-8", errors="ignore") for line in lines]
+
+        timestamps = []
+        for run_timestamp, count in runs or [(timestamp, len(lines))]:
+            timestamps.extend([overrides.get('@timestamp', run_timestamp)] * count)
+        return batch_envelope.encode(event, messages, timestamps, message_field, self._batch_encoding)
+
+    def _json_template(self, event, overrides, timestamp):
+        """Returns the json serialization of an event split around its
+        message, or None if the message cannot be found in it"""
+        data = dict(event)
+        data['@timestamp'] = timestamp
+        data[self._fields.get('message')] = MESSAGE_PLACEHOLDER
+        if overrides:
+            data.update(overrides)
+
+        template = json.dumps(data).split(json.dumps(MESSAGE_PLACEHOLDER))
+        if len(template) != 2:
+            return None
+
+        return template
+
+    def _get_rawjson_fields(self, event, overrides, timestamp):
+        """Returns the fields a rawjson message gets when it lacks them, as
+        (field, serialized "field": value pair) tuples
+
+        These are kept for the last event and timestamp, which are shared
+        by the lines of a batch
+        """
+        cached = self._rawjson_cache
+        if cached is not None and cached[0] is event and cached[1] == timestamp:
+            return cached[2]
+
+        data = dict(event)
+        data['@timestamp'] = timestamp
+        data.update(overrides)
+
+        fields = {}
+        for field in self._fields.get('raw_json_fields'):
+            fields[field] = ''
+        for field in data:
+            if field != self._fields.get('message'):
+                fields[field] = data[field]
+
+        fields = [(field, json.dumps({field: value})[1:-1]) for field, value in fields.items()]
+        self._rawjson_cache = (event, timestamp, fields)
+        return fields
+
+    def _splice_rawjson(self, message, fields):
+        """Returns a rawjson message with the fields it lacks spliced in
+        before its closing brace, or None when the message has to go
+        through rawjson_formatter instead
+
+        The message is still parsed, to check it is an object and to find
+        its keys
+        """
+        message = message.strip()
+        if not message.startswith('{') or not message.endswith('}') or not message[1:-1].strip():
+            return None
+
+        try:
+            keys = json.loads(message)
+        except ValueError:
+            return None
+        if not isinstance(keys, dict):
+            return None
+
+        missing = [pair for field, pair in fields if field not in keys]
+
+        if not missing:
+            return message.encode('utf-8')
+
+        return message[:-1].rstrip().encode('utf-8') + ',' + ','.join(missing) + '}'
+
+    def _incr(self, name, value=1):
+        """Increments a transport counter, from any thread sending batches"""
+        with self._stats_lock:
+            self._stats[name] = self._stats.get(name, 0) + value
+
+    def _log_stats(self):
+        """Logs the transport counters and their rates since they were last
+        logged, at most once every stats_interval seconds"""
+        with self._stats_lock:
+            if not self._stats_interval or time.time() - self._stats_logged < self._stats_interval:
+                return
+
+            now = time.time()
+            elapsed = now - self._stats_logged
+            self._stats_logged = now
+
+            counters = []
+            for name, value in sorted(self._stats.items()):
+                rate = (value - self._stats_last.get(name, 0)) / elapsed
+                counters.append('{0}={1} ({2:.1f}/s)'.format(name, value, rate))
+            counters = ', '.join(counters)
+            self._stats_last = dict(self._stats)
+
+        self._logger.info('[{0}] {1}'.format(self.__class__.__name__, counters))
+
+
+def join_lines(lines):
+    """Returns lines as utf-8 bytes, each followed by a newline"""
+    return ''.join((line.encode('utf-8') if isinstance(line, unicode) else line) + '\n' for line in lines)
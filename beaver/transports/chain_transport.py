@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from beaver.transports import create_transport
+from beaver.transports.base_transport import BaseTransport
+from beaver.transports.circuit_breaker import CircuitBreaker
+from beaver.transports.exception import TransportException
+
+
+class ChainTransport(BaseTransport):
+    """Sends each batch to the first healthy transport of transport_chain
+
+    Every transport of the chain sits behind its own CircuitBreaker: a
+    failed send opens its circuit and the batch goes to the next
+    transport, while the failed one is reconnected in the background.
+    Health is only ever learnt from sends, there are no pings. Once a
+    transport has reconnected, the next batch is tried on it again, so
+    traffic goes back to the primary as soon as it recovers.
+
+    Batches stored by a spool transport of the chain are replayed into
+    the first transport ahead of it that accepts a batch.
+    """
+
+    def __init__(self, beaver_config, logger=None):
+        super(ChainTransport, self).__init__(beaver_config, logger=logger)
+
+        names = [name.strip() for name in beaver_config.get('transport_chain').split(',') if name.strip()]
+        if not names:
+            raise TransportException('The chain transport requires transport_chain')
+        if 'chain' in names:
+            raise TransportException('transport_chain cannot contain the chain transport')
+
+        self._chain = []
+        for name in names:
+            transport = create_transport(beaver_config, logger=logger, transport=name)
+            breaker = CircuitBreaker(transport, beaver_config.get('respawn_delay'), beaver_config.get('max_failure'), name=name, logger=logger)
+            if not transport.valid():
+                breaker.failure('Transport connection issues')
+
+            self._chain.append((name, transport, breaker))
+
+    def addglob(self, globname, globbed):
+        super(ChainTransport, self).addglob(globname, globbed)
+        for name, transport, breaker in self._chain:
+            transport.addglob(globname, globbed)
+
+    def delglob(self, globname, globbed):
+        super(ChainTransport, self).delglob(globname, globbed)
+        for name, transport, breaker in self._chain:
+            transport.delglob(globname, globbed)
+
+    def callback(self, filename, lines, **kwargs):
+        for position, (name, transport, breaker) in enumerate(self._chain):
+            if not breaker.allow():
+                continue
+
+            try:
+                self._replay(position, transport)
+                transport.callback(filename, lines, **kwargs)
+            except TransportException as e:
+                self._incr('{0}.failures'.format(name))
+                breaker.failure(e)
+                continue
+
+            breaker.success()
+            self._incr('{0}.batches'.format(name))
+            self._incr('{0}.lines'.format(name), len(lines))
+            self._log_stats()
+            return True
+
+        self._log_stats()
+        raise TransportException('No transport of the chain is available')
+
+    def interrupt(self):
+        for name, transport, breaker in self._chain:
+            transport.interrupt()
+
+    def reconnect(self):
+        """The chain is back as soon as one of its transports is"""
+        if not self.valid():
+            raise TransportException('No transport of the chain is available')
+
+    def unhandled(self):
+        for name, transport, breaker in self._chain:
+            transport.unhandled()
+
+    def valid(self):
+        return any(breaker.allow() for name, transport, breaker in self._chain)
+
+    def _replay(self, position, transport):
+        """Replays batches spooled further down the chain into transport"""
+        for name, spool, breaker in self._chain[position + 1:]:
+            if hasattr(spool, 'replay') and spool.pending():
+                self._logger.info('[chain] Replaying batches spooled by {0}'.format(name))
+                spool.replay(transport.callback)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+
+
+class CircuitBreaker(object):
+    """Tracks the health of a transport and reconnects it in the background
+
+    The circuit is closed while sends go through. A failed send opens it:
+    the transport is invalidated and a background thread calls reconnect
+    after a jittered exponential backoff, capped at
+    respawn_delay ** max_failure seconds. Once reconnect succeeds the
+    circuit is half-open, and the next send decides whether it closes or
+    opens again. Senders never sleep, they either send, or go elsewhere
+    while the circuit is open.
+    """
+
+    CLOSED = 'closed'
+    HALF_OPEN = 'half-open'
+    OPEN = 'open'
+
+    def __init__(self, transport, respawn_delay, max_failure, name=None, logger=None):
+        self._changed = threading.Condition()
+        self._failure_count = 0
+        self._logger = logger
+        self._max_failure = max_failure
+        self._name = name or transport.__class__.__name__
+        self._respawn_delay = respawn_delay
+        self._state = self.CLOSED
+        self._transport = transport
+        self._reconnecting = False
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        """Returns whether sends should be tried on the transport"""
+        return self._state != self.OPEN
+
+    def success(self):
+        if self._state == self.CLOSED:
+            return
+
+        with self._changed:
+            if self._state == self.HALF_OPEN:
+                self._logger.info('[{0}] Reconnected successfully'.format(self._name))
+            self._state = self.CLOSED
+            self._failure_count = 0
+            self._changed.notify_all()
+
+    def failure(self, error=None):
+        """Opens the circuit and starts reconnecting in the background"""
+        with self._changed:
+            if self._state == self.OPEN:
+                return
+
+            if error is not None:
+                self._logger.info('[{0}] Caught transport exception: {1}'.format(self._name, error))
+
+            self._failure_count = min(self._failure_count + 1, self._max_failure)
+            self._state = self.OPEN
+            self._changed.notify_all()
+
+            try:
+                self._transport.invalidate()
+            except Exception as e:
+                self._logger.debug('[{0}] Error invalidating transport: {1}'.format(self._name, e))
+
+            if not self._reconnecting:
+                self._reconnecting = True
+                thread = threading.Thread(target=self._reconnect)
+                thread.daemon = True
+                thread.start()
+
+    def wait(self, timeout=None):
+        """Blocks until the circuit is no longer open, or timeout expires"""
+        with self._changed:
+            if self._state == self.OPEN:
+                self._changed.wait(timeout)
+
+        return self.allow()
+
+    def _delay(self):
+        delay = self._respawn_delay ** self._failure_count
+        return random.uniform(delay / 2.0, delay)
+
+    def _reconnect(self):
+        while True:
+            delay = self._delay()
+            self._logger.info('[{0}] Reconnecting in {1:.1f} seconds'.format(self._name, delay))
+
+            time.sleep(delay)
+
+            try:
+                self._transport.reconnect()
+            except Exception as e:
+                self._logger.info('[{0}] Reconnect failed: {1}'.format(self._name, e))
+                with self._changed:
+                    self._failure_count = min(self._failure_count + 1, self._max_failure)
+                continue
+
+            with self._changed:
+                self._reconnecting = False
+                self._state = self.HALF_OPEN
+                self._changed.notify_all()
+                return
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Compression of batches for stream transports
+
+A compressed batch is sent as a frame: a one byte codec id and the four
+byte length of the compressed data, in network byte order, followed by
+the compressed data. Once decompressed, a frame holds the lines of the
+batch, each followed by a newline.
+
+zlib and gzip are always available, lz4 and zstd when the lz4 and
+zstandard modules can be imported.
+"""
+import struct
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FRAME_HEADER = struct.Struct('!BI')
+
+
+class Codec(object):
+    """A compression codec, and the settings it compresses with
+
+    content_encoding is the HTTP Content-Encoding of the codec, if any
+    """
+
+    def __init__(self, name, codec_id, compress, decompress, content_encoding=None):
+        self.codec_id = codec_id
+        self.compress = compress
+        self.content_encoding = content_encoding
+        self.decompress = decompress
+        self.name = name
+
+
+def _zlib(level):
+    if level is None:
+        level = zlib.Z_DEFAULT_COMPRESSION
+    return Codec('zlib', 1, lambda data: zlib.compress(data, level), zlib.decompress, 'deflate')
+
+
+def _gzip(level):
+    if level is None:
+        level = zlib.Z_DEFAULT_COMPRESSION
+
+    def compress(data):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    return Codec('gzip', 2, compress, lambda data: zlib.decompress(data, 16 + zlib.MAX_WBITS), 'gzip')
+
+
+def _lz4(level):
+    return Codec('lz4', 3, lambda data: lz4.frame.compress(data, compression_level=level or 0), lz4.frame.decompress)
+
+
+def _zstd(level):
+    if level is None:
+        level = 3
+
+    # zstandard contexts cannot be shared between sender threads
+    compress = lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+    decompress = lambda data: zstandard.ZstdDecompressor().decompress(data)
+    return Codec('zstd', 4, compress, decompress, 'zstd')
+
+
+CODECS = {
+    'zlib': _zlib,
+    'gzip': _gzip,
+}
+if lz4 is not None:
+    CODECS['lz4'] = _lz4
+if zstandard is not None:
+    CODECS['zstd'] = _zstd
+
+
+def get_codec(name, level=None):
+    """Returns the codec called name, compressing at level, or at the
+    default level of the codec when level is None"""
+    if name not in CODECS:
+        raise LookupError('Compression codec {0} is not available'.format(name))
+    return CODECS[name](level)
+
+
+def frame(codec, data):
+    """Returns data compressed with codec, in a frame"""
+    compressed = codec.compress(data)
+    return FRAME_HEADER.pack(codec.codec_id, len(compressed)) + compressed
+
+
+def unframe(buffer):
+    """Returns the decompressed data of the complete frames at the start
+    of buffer, and what is left of buffer after them"""
+    decompress = dict((factory(None).codec_id, factory(None).decompress) for factory in CODECS.values())
+
+    payloads = []
+    while len(buffer) >= FRAME_HEADER.size:
+        codec_id, length = FRAME_HEADER.unpack_from(buffer)
+        end = FRAME_HEADER.size + length
+        if len(buffer) < end:
+            break
+
+        if codec_id not in decompress:
+            raise ValueError('Unknown compression codec id {0}'.format(codec_id))
+
+        payloads.append(decompress[codec_id](buffer[FRAME_HEADER.size:end]))
+        buffer = buffer[end:]
+
+    return payloads, buffer
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import collections
+import Queue
+import threading
+
+from beaver.transports.exception import TransportException
+
+
+class InFlight(object):
+    """Batch being sent on another thread
+
+    done is set once the send is over, with the exception it raised in
+    error. Transports use it for the parts of a batch they send at once.
+    """
+
+    def __init__(self, data, release=None):
+        self.data = data
+        self.done = threading.Event()
+        self.error = None
+        self.release = release
+
+
+class ConcurrentSender(object):
+    """Keeps up to max_in_flight batches being sent by a transport while
+    the queue consumer goes on reading batches
+
+    Transports opt in to concurrent sends by implementing send_batch,
+    which must be safe to call from several threads at once, unless their
+    concurrent_sends attribute is false. Other transports get a single
+    sender thread calling callback, which still lets the consumer read
+    ahead while a batch is being sent.
+
+    Batches of one file are sent one at a time, the next one waiting for
+    the previous one to be sent, so that files are sent in order. Batches
+    whose send failed are kept and sent again before the next batch, after
+    a TransportException has been raised for them.
+
+    hold is called as each batch is submitted, and the function it
+    returns once the batch has been sent, or handed back by take_failed.
+    The queue consumer uses it to keep the partition a batch came from
+    locked while the batch is in flight.
+    """
+
+    def __init__(self, transport, max_in_flight, logger=None, hold=None):
+        self._failed = collections.deque()
+        self._hold = hold
+        self._in_flight = collections.deque()
+        self._logger = logger
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._tasks = Queue.Queue()
+
+        if hasattr(transport, 'send_batch') and getattr(transport, 'concurrent_sends', True):
+            method, workers = transport.send_batch, max_in_flight
+        else:
+            method, workers = transport.callback, 1
+
+        self._method = method
+        for n in range(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+
+    def send(self, **data):
+        """Submits a batch, blocking while max_in_flight batches are being
+        sent, or while a batch of the same file is"""
+        self._resend()
+
+        release = None
+        if self._hold is not None:
+            release = self._hold()
+        try:
+            self._submit(InFlight(data, release))
+        except Exception:
+            # raised for the previous batch of the file, this one was not
+            # submitted and is sent again by the caller
+            if release is not None:
+                release()
+            raise
+
+    def flush(self):
+        """Blocks until every submitted batch has been sent"""
+        self._resend()
+
+        for sending in list(self._in_flight):
+            sending.done.wait()
+
+        self._reap()
+
+    def take_failed(self):
+        """Returns the batches whose send failed, and forgets about them"""
+        failed = list(self._failed)
+        self._failed.clear()
+        for sending in failed:
+            self._release(sending)
+
+        return [sending.data for sending in failed]
+
+    def _resend(self):
+        self._reap()
+
+        while self._failed:
+            self._submit(self._failed[0])
+            self._failed.popleft()
+
+    def _reap(self):
+        """Drops completed sends, raising for the ones that failed"""
+        error = None
+        in_flight = collections.deque()
+        for sending in self._in_flight:
+            if not sending.done.is_set():
+                in_flight.append(sending)
+            elif sending.error is not None:
+                error = error or sending.error
+                sending.done.clear()
+                sending.error = None
+                self._failed.append(sending)
+            else:
+                self._release(sending)
+
+        self._in_flight = in_flight
+        if error is not None:
+            raise error
+
+    def _release(self, sending):
+        if sending.release is not None:
+            sending.release()
+            sending.release = None
+
+    def _submit(self, sending):
+        # the previous batch of the file must be sent first, and is sent
+        # again first if it failed
+        filename = sending.data.get('filename')
+        for previous in list(self._in_flight):
+            if previous.data.get('filename') == filename:
+                previous.done.wait()
+                self._reap()
+
+        self._slots.acquire()
+        self._in_flight.append(sending)
+        self._tasks.put(sending)
+
+    def _work(self):
+        while True:
+            sending = self._tasks.get()
+            try:
+                self._method(**sending.data)
+            except TransportException as e:
+                sending.error = e
+            except Exception as e:
+                if self._logger:
+                    self._logger.exception('Unhandled exception sending batch')
+                sending.error = TransportException(e)
+            finally:
+                sending.done.set()
+                self._slots.release()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import requests
+
+from beaver import timestamps
+from beaver.transports.base_transport import BaseTransport, json
+from beaver.transports.exception import TransportException
+
+# item statuses worth indexing the document again for
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# index of batches whose fields do not fill the elasticsearch_index template
+FALLBACK_INDEX = 'logstash-%Y.%m.%d'
+
+
+class ElasticsearchTransport(BaseTransport):
+    """Indexes batches with the elasticsearch _bulk api
+
+    Each line is a document, so the format must be json or rawjson. The
+    index name is elasticsearch_index with strftime directives for the
+    batch timestamp, and {field} placeholders for the event fields,
+    rendered once per batch.
+
+    Documents the bulk response reports as rejected for lack of capacity,
+    and those of requests that failed after part of the batch was
+    indexed, are kept and indexed again before the next batch. Other
+    rejected documents would be rejected again, they are logged and
+    dropped.
+    """
+
+    def __init__(self, beaver_config, logger=None):
+        super(ElasticsearchTransport, self).__init__(beaver_config, logger=logger)
+
+        self._url = beaver_config.get('elasticsearch_url').rstrip('/')
+        self._bulk_url = self._url + '/_bulk'
+        self._index = beaver_config.get('elasticsearch_index')
+        self._doc_type = beaver_config.get('elasticsearch_doc_type')
+        self._max_body_bytes = beaver_config.get('elasticsearch_max_body_bytes')
+        self._timeout = beaver_config.get('elasticsearch_timeout')
+        self._is_valid = False
+
+        if self._codec is not None and self._codec.content_encoding is None:
+            raise TransportException('{0} compression has no HTTP Content-Encoding'.format(self._codec.name))
+
+        formats = [fmt for fmt in beaver_config.get_formats('elasticsearch') if fmt not in ['json', 'rawjson']]
+        if formats:
+            raise TransportException('Elasticsearch indexes json documents, not the {0} format'.format(', '.join(formats)))
+
+        self._headers = {'Content-Type': 'application/x-ndjson'}
+        if self._codec is not None:
+            self._headers['Content-Encoding'] = self._codec.content_encoding
+
+        self._lock = threading.Lock()
+        self._retry = []
+
+        pool_size = max(1, beaver_config.get('transport_max_in_flight'))
+        self._session = requests.Session()
+        self._session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        self._connect()
+
+    def _connect(self):
+        """Makes a single connection attempt, retries are left to the caller"""
+        try:
+            self._session.get(self._url, timeout=self._timeout).raise_for_status()
+        except Exception as e:
+            self._logger.error('Exception caught validating elasticsearch connection: {0}'.format(e))
+            return False
+
+        self._logger.info('Connected to {0}'.format(self._url))
+        self._is_valid = True
+        return True
+
+    def reconnect(self):
+        if not self._connect():
+            raise TransportException('Cannot connect to {0}'.format(self._url))
+
+    def callback(self, filename, lines, **kwargs):
+        timestamp = self.get_timestamp(**kwargs)
+        if kwargs.get('timestamp', False):
+            del kwargs['timestamp']
+
+        # documents rejected earlier go first, and this batch is only
+        # sent once they are in
+        with self._lock:
+            retry, self._retry = self._retry, []
+        retry, error = self._index_documents(retry)
+        if retry:
+            with self._lock:
+                self._retry = retry + self._retry
+            raise error or TransportException('{0} rejected documents are still not indexed'.format(len(retry)))
+
+        action = self._action(filename, timestamp, **kwargs)
+        documents = [(action, line) for line in self.format_batch(filename, lines, timestamp, **kwargs)]
+        retry, error = self._index_documents(documents)
+        if error is not None and len(retry) == len(documents):
+            # nothing was indexed, the caller sends the whole batch again
+            raise error
+
+        if error is not None:
+            self._logger.warning('{0}, indexing {1} documents again with the next batch'.format(error, len(retry)))
+        if retry:
+            with self._lock:
+                self._retry.extend(retry)
+
+        self._log_stats()
+
+    def send_batch(self, filename, lines, **kwargs):
+        """Thread-safe callback, used when transport_max_in_flight allows
+        several batches to be indexed at once"""
+        return self.callback(filename, lines, **kwargs)
+
+    def flush(self, timeout=None):
+        """Indexes the documents rejected for lack of capacity once more"""
+        with self._lock:
+            retry, self._retry = self._retry, []
+
+        retry, error = self._index_documents(retry)
+        if error is not None:
+            self._logger.warning('Exception caught indexing rejected documents: {0}'.format(error))
+
+        if retry:
+            with self._lock:
+                self._retry = retry + self._retry
+            self._logger.warning('{0} documents were not indexed'.format(len(retry)))
+            return False
+
+        return True
+
+    def _action(self, filename, timestamp, **kwargs):
+        """Returns the bulk action line of the documents of a batch"""
+        formatter, event, overrides = self._get_formatter(filename, **kwargs)
+        index = time.strftime(self._index, time.gmtime(timestamps.epoch(timestamp)))
+        if '{' in index:
+            try:
+                index = index.format(**event)
+            except (KeyError, IndexError, ValueError) as e:
+                index = time.strftime(FALLBACK_INDEX, time.gmtime(timestamps.epoch(timestamp)))
+                self._logger.error('Cannot render elasticsearch_index {0} for {1}, using {2}: {3!r}'.format(self._index, filename, index, e))
+
+        action = {'_index': index}
+        if self._doc_type:
+            action['_type'] = self._doc_type
+
+        return json.dumps({'index': action})
+
+    def _index_documents(self, documents):
+        """Indexes (action, document) pairs, returning the ones to index
+        again, and the TransportException of the request that failed, if
+        any. The documents of that request and of the ones after it are
+        returned as well, so the documents already indexed are not sent
+        twice"""
+        retry = []
+        for start, end in self._bodies(documents):
+            try:
+                retry.extend(self._bulk(documents[start:end]))
+            except TransportException as e:
+                return retry + documents[start:], e
+
+        return retry, None
+
+    def _bodies(self, documents):
+        """Yields the bounds of the documents fitting in each bulk body of
+        at most elasticsearch_max_body_bytes"""
+        start = 0
+        size = 0
+        for n, (action, document) in enumerate(documents):
+            length = len(action) + len(document) + 2
+            if n > start and self._max_body_bytes and size + length > self._max_body_bytes:
+                yield start, n
+                start = n
+                size = 0
+            size += length
+
+        if start < len(documents):
+            yield start, len(documents)
+
+    def _bulk(self, documents):
+        """Posts one bulk body, returning the documents to index again"""
+        body = []
+        for action, document in documents:
+            body.append(action)
+            body.append('\n')
+            body.append(document.encode('utf-8') if isinstance(document, unicode) else document)
+            body.append('\n')
+        body = ''.join(body)
+        if self._codec is not None:
+            body = self._codec.compress(body)
+
+        try:
+            r = self._session.post(self._bulk_url, data=body, headers=self._headers, timeout=self._timeout)
+        except requests.exceptions.RequestException as e:
+            raise TransportException('Exception caught in bulk request: {0}'.format(e))
+
+        self._incr('requests')
+        self._incr('bytes', len(body))
+        if r.status_code == 429 or r.status_code >= 500:
+            raise TransportException('Bulk request returned http status: {0}/{1}'.format(r.status_code, r.reason))
+
+        if not 200 <= r.status_code < 300:
+            self._incr('rejected', len(documents))
+            self._logger.error('Bulk request returned http status: {0}/{1} {2}'.format(r.status_code, r.reason, r.content[:1024]))
+            return []
+
+        try:
+            result = r.json()
+        except ValueError as e:
+            raise TransportException('Bulk request returned a response that is not json: {0}'.format(e))
+        if not result.get('errors'):
+            self._incr('documents', len(documents))
+            return []
+
+        retry = []
+        for document, item in zip(documents, result.get('items', [])):
+            status = item.values()[0].get('status', 0)
+            if 200 <= status < 300:
+                self._incr('documents')
+            elif status in RETRY_STATUSES:
+                retry.append(document)
+            else:
+                self._incr('rejected')
+                self._logger.error('Document rejected with status {0}: {1}'.format(status, item.values()[0].get('error')))
+
+        if retry:
+            self._incr('retried', len(retry))
+            self._logger.info('{0} documents rejected, indexing them again with the next batch'.format(len(retry)))
+
+        return retry
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+import Queue
+import threading
+import time
+
+from beaver.spool import Spool
+from beaver.transports import create_transport
+from beaver.transports.base_transport import BaseTransport
+from beaver.transports.circuit_breaker import CircuitBreaker
+from beaver.transports.exception import TransportException
+
+
+class _Output(object):
+    """A transport fed by its own bounded queue and sender thread
+
+    With a spool, batches are spooled while the transport is down
+    instead of waiting in the queue, and replayed once it is back.
+    """
+
+    def __init__(self, name, transport, maxsize, beaver_config, stats, logger=None, spool=None):
+        self.name = name
+        self.queue = Queue.Queue(maxsize)
+        self.transport = transport
+        self._breaker = CircuitBreaker(transport, beaver_config.get('respawn_delay'), beaver_config.get('max_failure'), name=name, logger=logger)
+        self._closed = threading.Event()
+        self._logger = logger
+        self._spool = spool
+        self._stats = stats
+        self._wait_timeout = beaver_config.get('wait_timeout')
+
+        if not transport.valid():
+            self._breaker.failure('Transport connection issues')
+
+        thread = threading.Thread(target=self._send_forever)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        """Stops the sender thread once the batch it is sending is done"""
+        self._closed.set()
+        try:
+            self.queue.put_nowait(None)
+        except Queue.Full:
+            pass
+
+    def _send_forever(self):
+        # without a spool there is nothing to do until the next batch
+        timeout = None
+        if self._spool is not None:
+            timeout = self._wait_timeout
+
+        while not self._closed.is_set():
+            try:
+                data = self.queue.get(timeout=timeout)
+            except Queue.Empty:
+                if self._breaker.allow():
+                    self._replay()
+                continue
+
+            try:
+                if data is not None:
+                    self._send(data)
+            finally:
+                self.queue.task_done()
+
+        if self._spool is not None:
+            self._spool.close()
+
+    def _replay(self):
+        """Sends the spooled batches, returning whether they all were"""
+        if self._spool is None or not self._spool.pending():
+            return True
+
+        try:
+            self._spool.replay(self.transport.callback)
+        except TransportException as e:
+            self._stats('{0}.failures'.format(self.name))
+            self._breaker.failure(e)
+            return False
+        except Exception:
+            self._logger.exception('[{0}] Unhandled exception replaying spooled batches'.format(self.name))
+            return False
+
+        self._breaker.success()
+        return True
+
+    def _send(self, data):
+        """Sends a batch after the spooled ones, spooling it while the
+        transport is down, or waiting for it to reconnect"""
+        while True:
+            if self._breaker.allow() and self._replay():
+                try:
+                    self.transport.callback(**data)
+                except TransportException as e:
+                    self._stats('{0}.failures'.format(self.name))
+                    self._breaker.failure(e)
+                except Exception:
+                    self._logger.exception('[{0}] Unhandled exception, dropping batch'.format(self.name))
+                    self._stats('{0}.dropped'.format(self.name))
+                    return
+                else:
+                    self._breaker.success()
+                    self._stats('{0}.batches'.format(self.name))
+                    self._stats('{0}.lines'.format(self.name), len(data['lines']))
+                    return
+
+            if self._spool is not None and self._spool.has_room():
+                self._spool.append(data)
+                self._stats('{0}.spooled'.format(self.name))
+                return
+
+            self._breaker.wait(self._wait_timeout)
+
+
+class FanoutTransport(BaseTransport):
+    """Delivers every batch to several transports
+
+    Selected by giving a comma separated list of transports as the
+    transport. Lines are formatted once and handed to every transport
+    already formatted. Each transport has its own queue of up to
+    fanout_queue_size batches and its own sender thread, and reconnects
+    behind its own circuit breaker, so a slow or broken transport only
+    holds up the others once its queue is full.
+
+    A batch counts as sent once it is queued for every transport, so
+    batches still queued when the consumer stops are lost. When
+    spool_path is set, a transport that is down spools its batches, and
+    only the batches in its queue are at risk.
+    """
+
+    def __init__(self, beaver_config, logger=None, transports=None):
+        super(FanoutTransport, self).__init__(beaver_config, logger=logger)
+
+        names = [name.strip() for name in (transports or []) if name.strip()]
+        if len(names) < 2:
+            raise TransportException('The fanout transport requires at least two transports')
+
+        # spools are replayed by the consumer of the same partition, so
+        # that batches of a file stay in order
+        partition = beaver_config.get('consumer_partition') or 0
+
+        self._lock = threading.Lock()
+        self._outputs = []
+        for n, name in enumerate(names):
+            transport = create_transport(beaver_config, logger=logger, transport=name)
+            spool = None
+            if beaver_config.get('spool_path'):
+                spool = Spool(beaver_config.get('spool_path'), max_bytes=beaver_config.get('spool_max_bytes'), logger=logger,
+                              name='fanout{0}-{1}'.format(partition, n))
+            self._outputs.append(_Output(name, transport, beaver_config.get('fanout_queue_size'), beaver_config, self._incr,
+                                         logger=logger, spool=spool))
+
+    def addglob(self, globname, globbed):
+        super(FanoutTransport, self).addglob(globname, globbed)
+        for output in self._outputs:
+            output.transport.addglob(globname, globbed)
+
+    def delglob(self, globname, globbed):
+        super(FanoutTransport, self).delglob(globname, globbed)
+        for output in self._outputs:
+            output.transport.delglob(globname, globbed)
+
+    def callback(self, filename, lines, **kwargs):
+        timestamp = self.get_timestamp(**kwargs)
+        if kwargs.get('timestamp', False):
+            del kwargs['timestamp']
+
+        formatted = None
+        for output in self._outputs:
+            data = dict(kwargs)
+            data['filename'] = filename
+            data['lines'] = lines
+            data['timestamp'] = timestamp
+
+            if getattr(output.transport, 'formats_lines', True) and not kwargs.get('preformatted'):
+                if formatted is None:
+                    formatted = self.format_batch(filename, lines, timestamp, **kwargs)
+                data['lines'] = formatted
+                data['preformatted'] = True
+
+            output.queue.put(data)
+
+        self._log_stats()
+        return True
+
+    def flush(self, timeout=None):
+        """Waits up to timeout seconds for every queued batch to be sent or
+        spooled, returning whether they all were"""
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        flushed = True
+        for output in self._outputs:
+            while output.queue.unfinished_tasks:
+                if deadline is not None and time.time() >= deadline:
+                    self._logger.warning('[{0}] {1} batches left unsent'.format(output.name, output.queue.unfinished_tasks))
+                    flushed = False
+                    break
+                time.sleep(0.05)
+
+        return flushed
+
+    def interrupt(self):
+        for output in self._outputs:
+            output.close()
+            output.transport.interrupt()
+
+    def unhandled(self):
+        for output in self._outputs:
+            output.close()
+            output.transport.unhandled()
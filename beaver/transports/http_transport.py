@@ -1,13 +1,22 @@
 # -*- coding: utf-8 -*-
-import traceback
-import time
+import Queue
+import threading
+
 import requests
 
-from beaver.transports.base_transport import BaseTransport
+from beaver.transports.base_transport import BaseTransport, join_lines
+from beaver.transports.concurrent_sender import InFlight
 from beaver.transports.exception import TransportException
 
 
 class HttpTransport(BaseTransport):
+    """Posts batches to an http url, one line per post, or in bodies of
+    newline separated lines in bulk mode
+
+    Posts that failed after other posts of their batch went through are
+    kept and posted again before the next batch, rather than raising for
+    the whole batch, so that no post is sent twice.
+    """
 
     def __init__(self, beaver_config, logger=None):
         super(HttpTransport, self).__init__(beaver_config, logger=logger)
@@ -16,33 +25,55 @@ class HttpTransport(BaseTransport):
         self._logger.info('Initializing with url of: {0}'.format(self._url))
         self._is_valid = False
 
-        self._connect()
+        self._bulk = beaver_config.get('http_bulk')
+        self._max_body_bytes = beaver_config.get('http_max_body_bytes')
+        self._timeout = beaver_config.get('http_timeout')
+        self._lock = threading.Lock()
+        self._retry = []
 
-    def _connect(self):
-        wait = -1
-        while True:
-            wait += 1
-            time.sleep(wait)
-            if wait == 20:
-                return False
+        if self._codec is not None and self._codec.content_encoding is None:
+            raise TransportException('{0} compression has no HTTP Content-Encoding'.format(self._codec.name))
 
-            if wait > 0:
-                self._logger.info('Retrying connection, attempt {0}'.format(wait + 1))
+        self._headers = {'Content-Type': 'application/x-ndjson'}
+        if self._codec is not None:
+            self._headers['Content-Encoding'] = self._codec.content_encoding
 
-            try:
-                #check for a 200 on the url
-                self._logger.info('connect: {0}'.format(self._url))
-                r = requests.get(self._url)
-            except Exception as e:
-                self._logger.error('Exception caught validating url connection: ' + str(e))
-            else:
-                self._logger.info('Connection validated')
-                self._is_valid = True
-                return True
+        # posts of a batch are sent by up to http_max_in_flight threads
+        self._max_in_flight = beaver_config.get('http_max_in_flight')
+        if self._max_in_flight > 1:
+            self._slots = threading.BoundedSemaphore(self._max_in_flight)
+            self._tasks = Queue.Queue()
+            for n in range(self._max_in_flight):
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+
+        # keeps connections alive between posts, one per post in flight
+        pool_size = max(1, self._max_in_flight, beaver_config.get('transport_max_in_flight'))
+        self._session = requests.Session()
+        self._session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
 
-    def reconnect(self):
         self._connect()
 
+    def _connect(self):
+        """Makes a single connection attempt, retries are left to the caller"""
+        try:
+            #check for a 200 on the url
+            self._logger.info('connect: {0}'.format(self._url))
+            r = self._session.get(self._url, timeout=self._timeout)
+        except Exception as e:
+            self._logger.error('Exception caught validating url connection: ' + str(e))
+            return False
+        else:
+            self._logger.info('Connection validated')
+            self._is_valid = True
+            return True
+
+    def reconnect(self):
+        if not self._connect():
+            raise TransportException('Cannot connect to {0}'.format(self._url))
+
     def invalidate(self):
         """Invalidates the current transport"""
         super(HttpTransport, self).invalidate()
@@ -53,17 +84,174 @@ class HttpTransport(BaseTransport):
         if kwargs.get('timestamp', False):
             del kwargs['timestamp']
 
+        lines = self.format_batch(filename, lines, timestamp, **kwargs)
+
+        # posts left from an earlier batch go first, and this batch is
+        # only posted once they are in
+        with self._lock:
+            retry, self._retry = self._retry, []
+        retry, error = self._post_all(retry)
+        if retry:
+            with self._lock:
+                self._retry = retry + self._retry
+            raise error
+
+        if self._bulk or self._codec is not None:
+            posts = list(self._chunks(lines))
+        else:
+            posts = [[line] for line in lines]
+
+        retry, error = self._post_all(posts)
+        if error is not None and len(retry) == len(posts):
+            # nothing was posted, the caller sends the whole batch again
+            raise error
+
+        if retry:
+            self._logger.warning('{0}, posting {1} posts again with the next batch'.format(error, len(retry)))
+            with self._lock:
+                self._retry.extend(retry)
+
+    def flush(self, timeout=None):
+        """Posts the posts left from earlier batches once more"""
+        with self._lock:
+            retry, self._retry = self._retry, []
+
+        retry, error = self._post_all(retry)
+        if retry:
+            with self._lock:
+                self._retry = retry + self._retry
+            self._logger.warning('{0} posts were not sent: {1}'.format(len(retry), error))
+            return False
+
+        return True
+
+    def _post_all(self, posts):
+        """Posts the lines of each post, returning the posts to send again
+        and the TransportException of the first that failed, if any"""
+        if self._max_in_flight > 1:
+            return self._post_concurrently(posts)
+
+        for n, post in enumerate(posts):
+            try:
+                self._post_lines(post)
+            except TransportException as e:
+                return posts[n:], e
+
+        return [], None
+
+    def _escape(self, jsonline):
+        #escape any tab in the message field, assuming json payload
+        edata = jsonline.replace('\t', '\\t')
+        self._logger.debug('writing to : {0}'.format(self._url))
+        self._logger.debug('writing data: {0}'.format(edata))
+        return edata
+
+    def _post_concurrently(self, posts):
+        """Hands posts to the worker threads, blocking while
+        http_max_in_flight posts are being sent, then waits for them. Returns
+        the posts that failed, and the error of the first of them"""
+        pending = []
+        for post in posts:
+            self._slots.acquire()
+            sending = InFlight({'lines': post})
+            pending.append(sending)
+            self._tasks.put(sending)
+
+        failed = []
+        error = None
+        for sending in pending:
+            sending.done.wait()
+            if sending.error is not None:
+                failed.append(sending.data['lines'])
+                error = error or sending.error
+
+        return failed, error
+
+    def _work(self):
+        while True:
+            sending = self._tasks.get()
+            try:
+                self._post_lines(**sending.data)
+            except TransportException as e:
+                sending.error = e
+            except Exception as e:
+                self._logger.exception('Unhandled exception posting batch')
+                sending.error = TransportException(e)
+            finally:
+                sending.done.set()
+                self._slots.release()
+
+    def _chunks(self, lines):
+        """Yields the lines of each body of the batch, each body being of
+        at most http_max_body_bytes before compression, unless a single
+        line is longer than that"""
+        chunk = []
+        size = 0
+        for line in lines:
+            line = line.replace('\t', '\\t')
+            if isinstance(line, unicode):
+                line = line.encode('utf-8')
+
+            if chunk and self._max_body_bytes and size + len(line) + 1 > self._max_body_bytes:
+                yield chunk
+                chunk = []
+                size = 0
+
+            chunk.append(line)
+            size += len(line) + 1
+
+        if chunk:
+            yield chunk
+
+    def _body(self, lines):
+        body = join_lines(lines)
+        if self._codec is not None:
+            body = self._codec.compress(body)
+        return body
+
+    def _post_lines(self, lines):
+        """Posts lines as one body, or a single line as it is. Bodies
+        rejected as too large are split in two and posted again, and a
+        single line rejected as too large is logged and dropped"""
+        if self._bulk or self._codec is not None:
+            posted = self._post(self._body(lines), self._headers)
+        else:
+            posted = self._post(self._escape(lines[0]))
+
+        if posted:
+            return
+
+        if len(lines) > 1:
+            half = len(lines) // 2
+            self._post_lines(lines[:half])
+            self._post_lines(lines[half:])
+            return
+
+        self._incr('rejected')
+        self._logger.error('Post of a single line of {0} bytes returned http status 413, dropping it'.format(len(lines[0])))
+
+    def _post(self, data, headers=None):
+        """Posts data, returning False on a 413 response, and raising
+        TransportException on connection errors and other non 2xx
+        responses, so that the batch is posted again"""
         try:
-            for line in lines:
-                #escape any tab in the message field, assuming json payload
-                jsonline = self.format(filename, line, timestamp, **kwargs)
-                edata = jsonline.replace('\t', '\\t')
-                self._logger.debug('writing to : {0}'.format(self._url))
-                self._logger.debug('writing data: {0}'.format(edata))
-                r = requests.post(url=self._url, data=edata)
-                if r.status_code >= 200 and r.status_code < 300:
-                    res = r.content
-                else:
-                    self._logger.error('Post returned non 2xx http status: {0}/{1}'.format(r.status_code, r.reason))
-        except Exception as e:
-            self._logger.error('Exception caught in urlopen connection: ' + str(e))
+            r = self._session.post(url=self._url, data=data, headers=headers, timeout=self._timeout)
+        except requests.exceptions.RequestException as e:
+            raise TransportException('Exception caught in http post: {0}'.format(e))
+
+        self._incr('requests')
+        self._incr('bytes', len(data))
+        if 200 <= r.status_code < 300:
+            self._log_stats()
+            return True
+
+        if r.status_code == 413:
+            self._incr('too_large')
+            return False
+
+        raise TransportException('Post returned http status: {0}/{1}'.format(r.status_code, r.reason))
+
+    def send_batch(self, filename, lines, **kwargs):
+        """Thread-safe callback, used when transport_max_in_flight allows
+        several batches to be posted at once"""
+        return self.callback(filename, lines, **kwargs)
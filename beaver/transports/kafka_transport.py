@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import warnings
+
 from kafka import SimpleProducer, KeyedProducer, KafkaClient, RoundRobinPartitioner
 
 from beaver.transports.base_transport import BaseTransport
@@ -12,18 +14,23 @@ class KafkaTransport(BaseTransport):
         self._kafka_config = {}
         config_to_store = [
             'client_id', 'hosts', 'async', 'topic', 'key',
-            'ack_timeout', 'codec', 'batch_n', 'batch_t', 'round_robin'
+            'ack_timeout', 'codec', 'batch_n', 'batch_t', 'round_robin',
+            'key_by', 'batch_max_bytes'
         ]
 
         for key in config_to_store:
             self._kafka_config[key] = beaver_config.get('kafka_' + key)
 
+        if self._kafka_config['key_by'] not in [None, 'file', 'host']:
+            raise TransportException('Unknown kafka_key_by {0}'.format(self._kafka_config['key_by']))
+
         try:
             self._connect()
             self._client = KafkaClient(self._kafka_config['hosts'], self._kafka_config['client_id'])
             self._client.ensure_topic_exists(self._kafka_config['topic'])
             self._key = self._kafka_config['key']
-            if self._key is None:
+            self._key_by = self._kafka_config['key_by']
+            if self._key is None and self._key_by is None:
                 self._prod = SimpleProducer(self._client, async=self._kafka_config['async'],
                                         req_acks=SimpleProducer.ACK_AFTER_LOCAL_WRITE,
                                         ack_timeout=self._kafka_config['ack_timeout'],
@@ -32,8 +39,10 @@ class KafkaTransport(BaseTransport):
                                         batch_send_every_n=self._kafka_config['batch_n'],
                                         batch_send_every_t=self._kafka_config['batch_t'])
             else:
+                # keyed messages are hashed to a partition by default, which
+                # keeps the lines of a file in order when keyed by file
                 partitioner = None
-                if self._kafka_config['round_robin']:
+                if self._kafka_config['round_robin'] and self._key_by is None:
                     partitioner = RoundRobinPartitioner
                 self._prod = KeyedProducer(self._client, async=self._kafka_config['async'],
                                         partitioner=partitioner,
@@ -50,33 +59,78 @@ class KafkaTransport(BaseTransport):
             raise TransportException(e.message)
 
     def callback(self, filename, lines, **kwargs):
-        """publishes lines one by one to the given topic"""
+        """publishes lines to the given topic, as few messages per produce
+        call as kafka_batch_n and kafka_batch_max_bytes allow"""
         timestamp = self.get_timestamp(**kwargs)
         if kwargs.get('timestamp', False):
             del kwargs['timestamp']
 
-        for line in lines:
-            try:
-                import warnings
-                with warnings.catch_warnings():
-                    warnings.simplefilter('error')
-                    #produce message
-                    if self._key is None:
-                        response = self._prod.send_messages(self._kafka_config['topic'], self.format(filename, line, timestamp, **kwargs))
-                    else:
-                        response = self._prod.send_messages(self._kafka_config['topic'], self._key, self.format(filename, line, timestamp, **kwargs))
+        messages = [line.encode('utf-8') if isinstance(line, unicode) else line
+                    for line in self.format_batch(filename, lines, timestamp, **kwargs)]
+        key = self._message_key(filename)
 
-                    if response:
-                        if response[0].error:
-                            self._logger.info('message error: {0}'.format(response[0].error))
-                            self._logger.info('message offset: {0}'.format(response[0].offset))
-
-            except Exception as e:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            for chunk in self._chunks(messages):
                 try:
-                    self._logger.error('Exception caught sending message/s : ' + str(e))
-                    raise TransportException(e.strerror)
-                except AttributeError:
-                    raise TransportException('Unspecified exception encountered')  # TRAP ALL THE THINGS!
+                    #produce messages
+                    if key is None:
+                        responses = self._prod.send_messages(self._kafka_config['topic'], *chunk)
+                    else:
+                        responses = self._prod.send_messages(self._kafka_config['topic'], key, *chunk)
+                except Exception as e:
+                    self._incr('errors')
+                    try:
+                        self._logger.error('Exception caught sending message/s : ' + str(e))
+                        raise TransportException(e.strerror)
+                    except AttributeError:
+                        raise TransportException('Unspecified exception encountered')  # TRAP ALL THE THINGS!
+
+                self._incr('requests')
+                self._incr('messages', len(chunk))
+                self._incr('bytes', sum(len(message) for message in chunk))
+
+                for response in responses or []:
+                    if response.error:
+                        self._incr('errors')
+                        self._logger.info('message error: {0}'.format(response.error))
+                        self._logger.info('message offset: {0}'.format(response.offset))
+
+        self._log_stats()
+
+    def _message_key(self, filename):
+        """Returns the key of the messages of a file, if they have one"""
+        if self._key_by == 'file':
+            key = filename
+        elif self._key_by == 'host':
+            key = self._current_host
+        else:
+            key = self._key
+
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return key
+
+    def _chunks(self, messages):
+        """Splits messages into produce calls of at most kafka_batch_n
+        messages and kafka_batch_max_bytes bytes, unless a single message
+        is larger"""
+        max_messages = self._kafka_config['batch_n'] or len(messages)
+        max_bytes = self._kafka_config['batch_max_bytes']
+
+        chunk = []
+        size = 0
+        for message in messages:
+            if chunk and (len(chunk) >= max_messages or (max_bytes and size + len(message) > max_bytes)):
+                yield chunk
+                chunk = []
+                size = 0
+
+            chunk.append(message)
+            size += len(message)
+
+        if chunk:
+            yield chunk
 
     def _connect(self):
         try:
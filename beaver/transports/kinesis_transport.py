@@ -47,9 +47,7 @@ class KinesisTransport(BaseTransport):
         message_batch = []
         message_batch_size = 0
 
-        for line in lines:
-
-            m = self.format(filename, line, timestamp, **kwargs)
+        for m in self.format_batch(filename, lines, timestamp, **kwargs):
             message_size = len(m)
 
             if (message_size > self._batch_size_max):
@@ -66,8 +64,7 @@ class KinesisTransport(BaseTransport):
                 message_batch_size = 0
 
             message_batch_size = message_batch_size + message_size
-            message_batch.append({'PartitionKey': uuid.uuid4().hex, 'Data': 
-                self.format(filename, line, timestamp, **kwargs)})
+            message_batch.append({'PartitionKey': uuid.uuid4().hex, 'Data': m})
 
         if len(message_batch) > 0:
             self._logger.debug('Flushing the last {0} messages to Kinesis stream {1} bytes'.format(
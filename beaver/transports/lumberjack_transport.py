@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+import collections
+import errno
+import select
+import socket
+import ssl
+import struct
+import time
+import zlib
+
+from beaver.transports.base_transport import BaseTransport
+from beaver.transports.exception import TransportException
+
+# lumberjack v2 frames: a version byte and a frame type byte, followed by
+# big endian unsigned ints
+VERSION = '2'
+WINDOW_FRAME = struct.Struct('!ccI')      # event count of the next window
+JSON_FRAME = struct.Struct('!ccII')       # sequence number, payload length
+COMPRESSED_FRAME = struct.Struct('!ccI')  # zlib payload length
+ACK_FRAME = struct.Struct('!ccI')         # sequence number
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class _Window(object):
+    """Events sent in one window, with the number the receiver acked"""
+
+    def __init__(self, events):
+        self.acked = 0
+        self.events = events
+
+    @property
+    def unacked(self):
+        return self.events[self.acked:]
+
+
+def encode_window(events, compression_level=0):
+    """Returns the frames of a window of json events, numbered from 1"""
+    frames = ''.join(JSON_FRAME.pack(VERSION, 'J', n + 1, len(event)) + event for n, event in enumerate(events))
+    if compression_level:
+        frames = zlib.compress(frames, compression_level)
+        frames = COMPRESSED_FRAME.pack(VERSION, 'C', len(frames)) + frames
+
+    return WINDOW_FRAME.pack(VERSION, 'W', len(events)) + frames
+
+
+class LumberjackTransport(BaseTransport):
+    """Sends batches to a logstash beats input with the lumberjack v2 protocol
+
+    Lines are sent as json data frames, in windows of at most
+    lumberjack_window_size events, zlib compressed unless
+    lumberjack_compression_level is 0. Up to lumberjack_max_windows
+    windows are written before waiting for the receiver to acknowledge
+    the oldest one.
+
+    Events are numbered from 1 in each window, and acks carry the number
+    of the last event received in the oldest window not fully acked yet.
+    When the connection is lost the events sent but not acknowledged yet
+    are kept, and sent again first once the transport has reconnected.
+    """
+
+    def __init__(self, beaver_config, logger=None):
+        super(LumberjackTransport, self).__init__(beaver_config, logger=logger)
+
+        self._host = beaver_config.get('lumberjack_host')
+        self._port = beaver_config.get('lumberjack_port')
+        self._window_size = max(1, beaver_config.get('lumberjack_window_size'))
+        self._max_windows = max(1, beaver_config.get('lumberjack_max_windows'))
+        self._compression_level = beaver_config.get('lumberjack_compression_level') or 0
+        self._timeout = beaver_config.get('lumberjack_timeout')
+        self._ssl_enabled = beaver_config.get('lumberjack_ssl_enabled')
+        self._ssl_cacert = beaver_config.get('lumberjack_ssl_cacert')
+        self._ssl_cert = beaver_config.get('lumberjack_ssl_cert')
+        self._ssl_key = beaver_config.get('lumberjack_ssl_key')
+
+        if self._default_formatter not in ['json', 'rawjson']:
+            raise TransportException('Lumberjack sends json data frames, not the {0} format'.format(self._default_formatter))
+
+        self._in_flight = collections.deque()
+        self._retry = []
+        self._sock = None
+
+        self._is_valid = self._connect()
+
+    def _connect(self):
+        """Makes a single connection attempt, retries are left to the caller"""
+        try:
+            sock = socket.create_connection((self._host, self._port), self._timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self._ssl_enabled:
+                sock = ssl.wrap_socket(sock,
+                                       keyfile=self._ssl_key,
+                                       certfile=self._ssl_cert,
+                                       cert_reqs=ssl.CERT_REQUIRED if self._ssl_cacert else ssl.CERT_NONE,
+                                       ca_certs=self._ssl_cacert)
+        except Exception as e:
+            self._logger.error('Exception caught in lumberjack connection to {0}:{1}: {2}'.format(self._host, self._port, e))
+            return False
+
+        self._logger.info('Connected to {0}:{1}'.format(self._host, self._port))
+        self._sock = sock
+        self._is_valid = True
+        return True
+
+    def reconnect(self):
+        if not self._connect():
+            raise TransportException('Cannot connect to {0}:{1}'.format(self._host, self._port))
+
+    def invalidate(self):
+        """Invalidates the current transport, keeping the events that were
+        not acknowledged to send them again after reconnecting"""
+        super(LumberjackTransport, self).invalidate()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+        unacked = []
+        for window in self._in_flight:
+            unacked.extend(window.unacked)
+        self._in_flight.clear()
+
+        if unacked:
+            self._logger.info('Sending {0} unacknowledged events again after reconnecting'.format(len(unacked)))
+            self._incr('retried', len(unacked))
+        self._retry = unacked + self._retry
+
+    def interrupt(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def callback(self, filename, lines, **kwargs):
+        timestamp = self.get_timestamp(**kwargs)
+        if kwargs.get('timestamp', False):
+            del kwargs['timestamp']
+
+        events = [line.encode('utf-8') if isinstance(line, unicode) else line
+                  for line in self.format_batch(filename, lines, timestamp, **kwargs)]
+
+        if self._sock is None:
+            raise TransportException('Not connected to {0}:{1}'.format(self._host, self._port))
+
+        sent = []
+        try:
+            while self._retry:
+                window = self._send_window(self._retry[:self._window_size])
+                del self._retry[:len(window.events)]
+
+            for n in range(0, len(events), self._window_size):
+                sent.append(self._send_window(events[n:n + self._window_size]))
+        except (socket.error, ProtocolError) as e:
+            # the caller sends this batch again, only older windows are kept
+            self._in_flight = collections.deque(window for window in self._in_flight if window not in sent)
+            self.invalidate()
+            raise TransportException('Lumberjack error: {0}'.format(e))
+
+        try:
+            self._read_acks(block=False)
+        except (socket.error, ProtocolError) as e:
+            # the batch was sent, and is sent again if it was not acked
+            self._logger.warning('Lumberjack error reading acks: {0}'.format(e))
+            self.invalidate()
+
+        self._log_stats()
+
+    def flush(self, timeout=None):
+        """Waits for the receiver to acknowledge every window sent"""
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        try:
+            while self._in_flight and self._sock is not None:
+                if deadline is not None and time.time() >= deadline:
+                    break
+                self._read_acks(block=True)
+        except (socket.error, ProtocolError) as e:
+            self._logger.warning('Lumberjack error waiting for acks: {0}'.format(e))
+            self.invalidate()
+
+        unacked = sum(len(window.unacked) for window in self._in_flight) + len(self._retry)
+        if unacked:
+            self._logger.warning('{0} lumberjack events were not acknowledged'.format(unacked))
+            return False
+
+        return True
+
+    def _send_window(self, events):
+        """Writes a window once there is room for it, returning it"""
+        while len(self._in_flight) >= self._max_windows:
+            self._read_acks(block=True)
+
+        window = _Window(events)
+        self._sock.sendall(encode_window(events, self._compression_level))
+        self._in_flight.append(window)
+
+        self._incr('windows')
+        self._incr('events', len(events))
+        return window
+
+    def _read_acks(self, block):
+        """Reads one ack, or when not blocking, the acks already received"""
+        while True:
+            if not block and not self._readable():
+                return
+
+            version, frame_type, sequence = ACK_FRAME.unpack(self._recv(ACK_FRAME.size))
+            if version != VERSION or frame_type != 'A':
+                raise ProtocolError('Unexpected frame {0!r}{1!r}'.format(version, frame_type))
+
+            self._ack(sequence)
+            if block:
+                return
+
+    def _ack(self, sequence):
+        """Forgets the events of the oldest window up to sequence, acks
+        being cumulative within a window. Acks repeating the last sequence
+        number are keepalives"""
+        if not self._in_flight:
+            return
+
+        window = self._in_flight[0]
+        sequence = min(sequence, len(window.events))
+        if sequence > window.acked:
+            self._incr('acked', sequence - window.acked)
+            window.acked = sequence
+
+        if window.acked == len(window.events):
+            self._in_flight.popleft()
+
+    def _readable(self):
+        if getattr(self._sock, 'pending', None) and self._sock.pending():
+            return True
+
+        return bool(select.select([self._sock], [], [], 0)[0])
+
+    def _recv(self, size):
+        data = ''
+        while len(data) < size:
+            received = self._sock.recv(size - len(data))
+            if not received:
+                raise socket.error(errno.EPIPE, 'Connection closed')
+            data += received
+
+        return data
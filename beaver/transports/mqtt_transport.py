@@ -36,12 +36,12 @@ class MqttTransport(BaseTransport):
         if kwargs.get('timestamp', False):
             del kwargs['timestamp']
 
-        for line in lines:
+        for line in self.format_batch(filename, lines, timestamp, **kwargs):
             try:
                 import warnings
                 with warnings.catch_warnings():
                     warnings.simplefilter('error')
-                    self._client.publish(self._topic, self.format(filename, line, timestamp, **kwargs), 0)
+                    self._client.publish(self._topic, line, 0)
             except Exception, e:
                 try:
                     raise TransportException(e.strerror)
@@ -13,6 +13,9 @@ from _navi_bss import BssStorage, make_bss_from_response_body
 
 
 class NaviTransport(BaseTransport):
+    # parses the raw lines instead of sending formatted ones
+    formats_lines = False
+
     def __init__(self, beaver_config, logger=None):
         super(NaviTransport, self).__init__(beaver_config, logger=logger)
         self._logger.debug("Navi transport {}, {}".format(beaver_config.get('mongo_connection_string'), beaver_config.get('mongo_db')))
@@ -174,12 +174,11 @@ class RabbitmqTransport(BaseTransport):
         timestamp = self.get_timestamp(**kwargs)
         if kwargs.get('timestamp', False):
             del kwargs['timestamp']
-        for line in lines:
+        for body in self.format_batch(filename, lines, timestamp, **kwargs):
             try:
                 import warnings
                 with warnings.catch_warnings():
                     warnings.simplefilter('error')
-                    body = self.format(filename, line, timestamp, **kwargs)
                     self._lines.put(body)
             except UserWarning:
                 raise TransportException('Connection appears to have been lost')
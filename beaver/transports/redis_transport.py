@@ -1,15 +1,60 @@
 # -*- coding: utf-8 -*-
+import Queue
 import redis
-import traceback
+import threading
 import time
 
-from beaver.transports.base_transport import BaseTransport
+from beaver.transports.base_transport import BaseTransport, join_lines
+from beaver.transports.circuit_breaker import CircuitBreaker
+from beaver.transports.concurrent_sender import InFlight
 from beaver.transports.exception import TransportException
 
+# weight of the latest pipeline in the moving average of a server's latency
+LATENCY_DECAY = 0.2
+
+# errors telling a server is down, other errors leave its health alone
+SERVER_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+
+class _Server(object):
+    """A redis server, which its circuit breaker invalidates and pings
+    in the background while it is down"""
+
+    def __init__(self, url, logger):
+        self.latency = None
+        self.logger = logger
+        self.redis = redis.StrictRedis.from_url(url, socket_timeout=10)
+        self.url = url
+
+    def invalidate(self):
+        self.redis.connection_pool.disconnect()
+
+    def reconnect(self):
+        self.redis.ping()
+
+    def observe(self, seconds, lines):
+        """Updates the moving average of the seconds a line takes"""
+        latency = seconds / max(1, lines)
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_DECAY * (latency - self.latency)
+
 
 class RedisTransport(BaseTransport):
+    """Pushes batches to one or more redis servers
+
+    Batches of more than redis_split_lines lines are split across the
+    servers that are up, each getting a share weighted by how fast it
+    took lines so far, and the pipelines run concurrently. Smaller
+    batches go to the servers in turn. A server failing to connect or
+    answer is left out, and pinged in the background until it is back,
+    while its lines are pushed to the other servers. Other errors fail
+    the batch.
+    """
     LIST_DATA_TYPE = 'list'
     CHANNEL_DATA_TYPE = 'channel'
+    STREAM_DATA_TYPE = 'stream'
 
     def __init__(self, beaver_config, logger=None):
         super(RedisTransport, self).__init__(beaver_config, logger=logger)
@@ -17,56 +62,52 @@ class RedisTransport(BaseTransport):
         urls = beaver_config.get('redis_url')
         self._servers = []
         for url in urls.split(','):
-            self._servers.append(
-                {
-                     'redis': redis.StrictRedis.from_url(url, socket_timeout=10),
-                     'url': url,
-                     'down_until': 0
-                }
-            )
+            server = _Server(url, self._logger)
+            server.breaker = CircuitBreaker(server, beaver_config.get('respawn_delay'),
+                                            beaver_config.get('max_failure'), name=url, logger=self._logger)
+            self._servers.append(server)
 
         self._namespace = beaver_config.get('redis_namespace')
+        self._rpush_max_values = beaver_config.get('redis_rpush_max_values')
+        self._rpush_max_bytes = beaver_config.get('redis_rpush_max_bytes')
+        self._split_lines = max(1, beaver_config.get('redis_split_lines'))
         self._current_server_index = 0
+        self._lock = threading.Lock()
 
         self._data_type = beaver_config.get('redis_data_type')
         if self._data_type not in [self.LIST_DATA_TYPE,
-                                   self.CHANNEL_DATA_TYPE]:
+                                   self.CHANNEL_DATA_TYPE,
+                                   self.STREAM_DATA_TYPE]:
             raise TransportException('Unknown Redis data type')
 
+        self._stream_field = beaver_config.get('redis_stream_field')
+        self._stream_maxlen = beaver_config.get('redis_stream_maxlen') or None
+        self._stream_entry = beaver_config.get('redis_stream_entry')
+        if self._stream_entry not in ['line', 'batch']:
+            raise TransportException('Unknown Redis stream entry {0}'.format(self._stream_entry))
+
+        # one thread per server runs the pipelines of split batches, from
+        # the first split batch until the transport is flushed
+        self._tasks = Queue.Queue()
+        self._workers = []
+
         self._check_connections()
 
     def _check_connections(self):
-        """Checks if all configured redis servers are reachable"""
+        """Checks if all configured redis servers are reachable, leaving
+        the ones that are not to be pinged in the background"""
 
         for server in self._servers:
-            if self._is_reachable(server):
-                server['down_until'] = 0
-            else:
-                server['down_until'] = time.time() + 5
-
-    def _is_reachable(self, server):
-        """Checks if the given redis server is reachable"""
-
-        try:
-            server['redis'].ping()
-            return True
-        except UserWarning:
-            self._logger.warn('Cannot reach redis server: ' + server['url'])
-        except Exception:
-            self._logger.warn('Cannot reach redis server: ' + server['url'])
-
-        return False
+            try:
+                server.reconnect()
+            except Exception as e:
+                self._logger.warn('Cannot reach redis server: ' + server.url)
+                server.breaker.failure(e)
 
     def reconnect(self):
-        self._check_connections()
-
-    def invalidate(self):
-        """Invalidates the current transport and disconnects all redis connections"""
-
-        super(RedisTransport, self).invalidate()
-        for server in self._servers:
-            server['redis'].connection_pool.disconnect()
-        return False
+        # servers reconnect on their own, this only waits for one of them
+        if not self.valid():
+            raise TransportException('Cannot reach any redis server')
 
     def callback(self, filename, lines, **kwargs):
         """Sends log lines to redis servers"""
@@ -80,68 +121,187 @@ class RedisTransport(BaseTransport):
         namespaces = self._beaver_config.get_field('redis_namespace', filename)
         if not namespaces:
             namespaces = self._namespace
-        namespaces = namespaces.split(",")
+        namespaces = [namespace.strip() for namespace in namespaces.split(",")]
 
         self._logger.debug('Got namespaces: '.join(namespaces))
 
-        data_type = self._data_type
-        self._logger.debug('Got data type: ' + data_type)
-
-        server = self._get_next_server()
-        self._logger.debug('Got redis server: ' + server['url'])
+        # lines are formatted once, whatever the number of namespaces
+        lines = self.format_batch(filename, lines, timestamp, **kwargs)
 
-        pipeline = server['redis'].pipeline(transaction=False)
+        servers = self._get_servers()
+        parts = max(1, min(len(servers), len(lines) // self._split_lines))
+        if parts > 1:
+            self._start_workers()
 
-        callback_map = {
-            self.LIST_DATA_TYPE: pipeline.rpush,
-            self.CHANNEL_DATA_TYPE: pipeline.publish,
-        }
-        callback_method = callback_map[data_type]
-
-        for line in lines:
+        pending = []
+        for server, part in zip(servers, self._split(lines, servers[:parts])):
+            sending = InFlight({'server': server, 'lines': part, 'namespaces': namespaces})
+            pending.append(sending)
+            if parts > 1:
+                self._tasks.put(sending)
+            else:
+                self._run(sending)
+
+        # lines of a pipeline whose server went down go to the servers
+        # still up, other errors fail the batch
+        error = None
+        for sending in pending:
+            sending.done.wait()
+            while isinstance(sending.error, SERVER_ERRORS):
+                sending.data['server'] = self._get_servers()[0]
+                sending.error = None
+                self._run(sending)
+            if error is None:
+                error = sending.error
+
+        if error is not None:
+            raise error
+
+    def send_batch(self, filename, lines, **kwargs):
+        """Thread-safe callback, used when transport_max_in_flight allows
+        several batches to be pushed at once. Each call uses its own
+        pipelines on the servers' connection pools"""
+        return self.callback(filename, lines, **kwargs)
+
+    def _push(self, server, lines, namespaces):
+        """Pushes lines to every namespace in a single pipeline"""
+        pipeline = server.redis.pipeline(transaction=False)
+        if self._data_type == self.LIST_DATA_TYPE:
+            chunks = list(self._chunks(lines))
             for namespace in namespaces:
-                callback_method(
-                    namespace.strip(),
-                    self.format(filename, line, timestamp, **kwargs)
-                )
-
-        try:
-            pipeline.execute()
-        except redis.exceptions.RedisError, exception:
-            self._logger.warn('Cannot push lines to redis server: ' + server['url'])
-            raise TransportException(exception)
+                for chunk in chunks:
+                    pipeline.rpush(namespace, *chunk)
+        elif self._data_type == self.STREAM_DATA_TYPE:
+            # XADD key MAXLEN ~ N * field value, trimmed approximately
+            # so that redis only drops whole nodes of the stream
+            if self._stream_entry == 'batch':
+                entries = [{self._stream_field: join_lines(lines), 'lines': len(lines)}]
+            else:
+                entries = [{self._stream_field: line} for line in lines]
+            for namespace in namespaces:
+                for entry in entries:
+                    pipeline.xadd(namespace, entry, maxlen=self._stream_maxlen, approximate=True)
+        else:
+            for namespace in namespaces:
+                for line in lines:
+                    pipeline.publish(namespace, line)
 
-    def _get_next_server(self):
-        """Returns a valid redis server or raises a TransportException"""
+        started = time.time()
+        pipeline.execute()
+        with self._lock:
+            server.observe(time.time() - started, len(lines))
 
-        current_try = 0
-        max_tries = len(self._servers)
+    def flush(self, timeout=None):
+        """Stops the threads running the pipelines of split batches"""
+        self._stop_workers(timeout)
+        return True
 
-        while current_try < max_tries:
+    def interrupt(self):
+        self._stop_workers(0)
 
-            server_index = self._raise_server_index()
-            server = self._servers[server_index]
-            down_until = server['down_until']
+    def _run(self, sending):
+        server = sending.data['server']
+        try:
+            self._push(**sending.data)
+        except SERVER_ERRORS as e:
+            self._logger.warn('Cannot push lines to redis server: ' + server.url)
+            server.breaker.failure(e)
+            sending.error = e
+        except Exception as e:
+            sending.error = TransportException('Error pushing lines to redis server {0}: {1}'.format(server.url, e))
+        else:
+            server.breaker.success()
+            self._incr('{0}.lines'.format(server.url), len(sending.data['lines']))
+        finally:
+            sending.done.set()
+
+    def _start_workers(self):
+        with self._lock:
+            if self._workers:
+                return
+
+            for n in range(len(self._servers)):
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def _stop_workers(self, timeout=None):
+        """Stops the worker threads once the pipelines queued before are
+        done, waiting for them for at most timeout seconds"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+
+        for worker in workers:
+            self._tasks.put(None)
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        for worker in workers:
+            worker.join(None if deadline is None else max(0, deadline - time.time()))
+
+    def _work(self):
+        while True:
+            sending = self._tasks.get()
+            if sending is None:
+                return
+            self._run(sending)
+
+    def _split(self, lines, servers):
+        """Splits lines into one slice per server, sized by the inverse of
+        the servers' latency, servers yet to be measured getting the
+        average share"""
+        if len(servers) == 1:
+            return [lines]
+
+        known = [server.latency for server in servers if server.latency]
+        default = sum(known) / len(known) if known else 1.0
+        weights = [1.0 / (server.latency or default) for server in servers]
+
+        total = sum(weights)
+        parts = []
+        start = 0
+        cumulative = 0.0
+        for weight in weights[:-1]:
+            cumulative += weight
+            end = int(round(len(lines) * cumulative / total))
+            parts.append(lines[start:end])
+            start = end
+        parts.append(lines[start:])
+        return parts
+
+    def _chunks(self, lines):
+        """Splits lines into the values of RPUSH commands, each of at most
+        redis_rpush_max_values values and redis_rpush_max_bytes bytes,
+        unless a single line is larger"""
+        chunk = []
+        size = 0
+        for line in lines:
+            if chunk and (len(chunk) >= self._rpush_max_values or size + len(line) > self._rpush_max_bytes):
+                yield chunk
+                chunk = []
+                size = 0
 
-            self._logger.debug('Checking server ' + str(current_try + 1) + '/' + str(max_tries) + ': ' + server['url'])
+            chunk.append(line)
+            size += len(line)
 
-            if down_until == 0:
-                self._logger.debug('Elected server: ' + server['url'])
-                return server
+        if chunk:
+            yield chunk
 
-            if down_until < time.time():
-                if self._is_reachable(server):
-                    server['down_until'] = 0
-                    self._logger.debug('Elected server: ' + server['url'])
+    def _get_servers(self):
+        """Returns the servers that are up, starting with the next one in
+        turn, or raises a TransportException"""
 
-                    return server
-                else:
-                    self._logger.debug('Server still unavailable: ' + server['url'])
-                    server['down_until'] = time.time() + 5
+        with self._lock:
+            start = self._raise_server_index()
 
-            current_try += 1
+        servers = self._servers[start:] + self._servers[:start]
+        servers = [server for server in servers if server.breaker.allow()]
+        if not servers:
+            raise TransportException('Cannot reach any redis server')
 
-        raise TransportException('Cannot reach any redis server')
+        return servers
 
     def _raise_server_index(self):
         """Round robin magic: Raises the current redis server index and returns it"""
@@ -150,13 +310,7 @@ class RedisTransport(BaseTransport):
 
         return self._current_server_index
 
-
     def valid(self):
         """Returns whether or not the transport can send data to any redis server"""
 
-        valid_servers = 0
-        for server in self._servers:
-            if server['down_until'] <= time.time():
-                valid_servers += 1
-
-        return valid_servers > 0
+        return any(server.breaker.allow() for server in self._servers)
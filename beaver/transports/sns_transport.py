@@ -39,9 +39,9 @@ class SnsTransport(BaseTransport):
         if kwargs.get('timestamp', False):
             del kwargs['timestamp']
 
-        for line in lines:
+        for line in self.format_batch(filename, lines, timestamp, **kwargs):
             try:
-                self._connection.publish(self._topic_arn, self.format(filename, line, timestamp, **kwargs))
+                self._connection.publish(self._topic_arn, line)
             except Exception, e:
                 self._logger.exception('Exception occurred sending to SNS topic')
                 raise TransportException(e.message)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from beaver.spool import Spool
+from beaver.transports.base_transport import BaseTransport
+from beaver.transports.exception import TransportException
+
+
+class SpoolTransport(BaseTransport):
+    """Stores batches in spool_path, to be replayed into another transport
+
+    Meant as the last member of a transport chain, see ChainTransport.
+    """
+
+    def __init__(self, beaver_config, logger=None):
+        super(SpoolTransport, self).__init__(beaver_config, logger=logger)
+
+        if not beaver_config.get('spool_path'):
+            raise TransportException('The spool transport requires spool_path')
+
+        self._spool = Spool(beaver_config.get('spool_path'), max_bytes=beaver_config.get('spool_max_bytes'), logger=logger)
+
+    def callback(self, filename, lines, **kwargs):
+        if not self._spool.has_room():
+            raise TransportException('Spool is full')
+
+        data = dict(kwargs)
+        data['filename'] = filename
+        data['lines'] = lines
+        self._spool.append(data)
+
+    def interrupt(self):
+        self._spool.close()
+
+    def pending(self):
+        """Returns whether there are batches to replay"""
+        return self._spool.pending()
+
+    def replay(self, send):
+        """Sends the spooled batches through send, oldest first"""
+        self._spool.replay(send)
+
+    def unhandled(self):
+        self._spool.close()
@@ -65,13 +65,13 @@ class SqsTransport(BaseTransport):
         message_batch_size = 0
         message_batch_size_max = 250000 # Max 256KiB but leave some headroom
 
-        for line in lines:
+        for line in self.format_batch(filename, lines, timestamp, **kwargs):
             if self._bulk_lines:
-               	m = self.format(filename, line, timestamp, **kwargs)
+               	m = line
                 message_size = getsizeof(m)
 	    else:
                 m = Message()
-                m.set_body(self.format(filename, line, timestamp, **kwargs))
+                m.set_body(line)
                 message_size = len(m)
 
             if (message_size > message_batch_size_max):
@@ -99,7 +99,7 @@ class SqsTransport(BaseTransport):
                 message_batch += '{0},'.format(m)
                 message_count += 1
             else:
-                message_batch.append((uuid.uuid4(), self.format(filename, line, timestamp, **kwargs), 0))
+                message_batch.append((uuid.uuid4(), line, 0))
 
         if len(message_batch) > 0:
             if self._bulk_lines:
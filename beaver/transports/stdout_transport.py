@@ -14,5 +14,5 @@ class StdoutTransport(BaseTransport):
         if kwargs.get('timestamp', False):
             del kwargs['timestamp']
 
-        for line in lines:
-            self._stdout.info(self.format(filename, line, timestamp, **kwargs))
+        for line in self.format_batch(filename, lines, timestamp, **kwargs):
+            self._stdout.info(line)
@@ -25,12 +25,12 @@ class StompTransport(BaseTransport):
             del kwargs['timestamp']
         
 
-        for line in lines:
+        for line in self.format_batch(filename, lines, timestamp, **kwargs):
             try:
                 import warnings
                 with warnings.catch_warnings():
                     warnings.simplefilter('error')
-                    m = self.format(filename, line, timestamp, **kwargs)
+                    m = line
                     self.logger.debug("Sending message " + m)
                     self.conn.send(destination=self.queue, body=m)    
 
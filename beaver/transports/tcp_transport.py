@@ -1,85 +1,223 @@
 # -*- coding: utf-8 -*-
-import socket
 import errno
+import socket
 import ssl
-import time
+import struct
+import threading
 
-from beaver.transports.base_transport import BaseTransport
+from beaver.transports.base_transport import BaseTransport, join_lines
+from beaver.transports.circuit_breaker import CircuitBreaker
 from beaver.transports.exception import TransportException
 
+try:
+    import fcntl
+    import termios
+    SIOCOUTQ = termios.TIOCOUTQ
+except (ImportError, AttributeError):
+    SIOCOUTQ = None
+
+
+class _Endpoint(object):
+    """Persistent connection to one of the hosts listed in tcp_host
+
+    The endpoint is what its circuit breaker invalidates and reconnects,
+    so a host going down is reconnected in the background while batches
+    go to the other hosts.
+    """
+
+    def __init__(self, transport, host, port):
+        self.host = host
+        self.port = port
+        self.name = '{0}:{1}'.format(host, port)
+        self.lock = threading.Lock()
+        self.sending = 0
+        self.sock = None
+        self._transport = transport
+
+    def connect(self):
+        self.sock = self._transport._connect(self.host, self.port)
+        return self.sock is not None
+
+    def invalidate(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def reconnect(self):
+        with self.lock:
+            self.invalidate()
+            if not self.connect():
+                raise TransportException('Cannot connect to {0}'.format(self.name))
+
+    def queued_bytes(self):
+        """Returns the bytes sent but not acknowledged by the host yet"""
+        if SIOCOUTQ is None or self.sock is None:
+            return 0
+
+        try:
+            return struct.unpack('I', fcntl.ioctl(self.sock.fileno(), SIOCOUTQ, struct.pack('I', 0)))[0]
+        except (IOError, ValueError):
+            return 0
+
 
 class TcpTransport(BaseTransport):
+    """Sends batches over TCP to one or more hosts
+
+    tcp_host is a comma separated list of host or host:port, with
+    tcp_port as the default port, and a connection is kept to each of
+    them. Batches are spread across the hosts that are up, either in
+    turn or to the one with the least data in flight. A host failing is
+    left out and reconnected in the background, and the batch is sent
+    to the next host.
+    """
 
     def __init__(self, beaver_config, logger=None):
         super(TcpTransport, self).__init__(beaver_config, logger=logger)
 
-        self._is_valid = False
         self._tcp_host = beaver_config.get('tcp_host')
         self._tcp_port = beaver_config.get('tcp_port')
+        self._tcp_balance = beaver_config.get('tcp_balance')
         self._tcp_ssl_enabled = beaver_config.get('tcp_ssl_enabled')
         self._tcp_ssl_verify = beaver_config.get('tcp_ssl_verify')
         self._tcp_ssl_cacert = beaver_config.get('tcp_ssl_cacert')
         self._tcp_ssl_cert = beaver_config.get('tcp_ssl_cert')
         self._tcp_ssl_key = beaver_config.get('tcp_ssl_key')
+        self._tcp_sndbuf = beaver_config.get('tcp_sndbuf')
 
-        self._connect()
+        self._lock = threading.Lock()
+        self._next = 0
 
-    def _connect(self):
-        wait = -1
-        self._logger.debug("SSL enabled for TCP transport? %s" % self._tcp_ssl_enabled)
-        while True:
-            wait += 1
-            time.sleep(wait)
+        self._endpoints = []
+        for address in self._tcp_host.split(','):
+            host, _, port = address.strip().partition(':')
+            endpoint = _Endpoint(self, host, int(port or self._tcp_port))
+            endpoint.breaker = CircuitBreaker(endpoint, beaver_config.get('respawn_delay'),
+                                              beaver_config.get('max_failure'), name=endpoint.name, logger=self._logger)
+            self._endpoints.append(endpoint)
 
-            if wait == 20:
-                return False
+        # hosts have a lock each, so batches can be sent to several at
+        # once. A single connection keeps batches in the order they came
+        self.concurrent_sends = len(self._endpoints) > 1
 
-            if wait > 0:
-                self._logger.info("Retrying connection, attempt {0}".format(wait + 1))
+        for endpoint in self._endpoints:
+            if not endpoint.connect():
+                endpoint.breaker.failure('Cannot connect to {0}'.format(endpoint.name))
 
-            try:
-                self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # TCP
-                self._sock.connect((self._tcp_host, int(self._tcp_port)))
-                if self._tcp_ssl_enabled:
-                    self._logger.debug("SSL wrapping")
-                    self._sock = ssl.wrap_socket(self._sock,
-                                                 keyfile=self._tcp_ssl_key,
-                                                 certfile=self._tcp_ssl_cert,
-                                                 ssl_version=ssl.PROTOCOL_TLSv1,
-                                                 ca_certs=self._tcp_ssl_cacert)
-
-            except Exception as e:
-                self._logger.error("Exception caught in socket connection: " + str(e))
-            else:
-                self._logger.info("Connected")
-                self._is_valid = True
-                return True
+    def _connect(self, host, port):
+        """Makes a single connection attempt, retries are left to the caller
+
+        Returns the connected socket, or None
+        """
+        self._logger.debug("SSL enabled for TCP transport? %s" % self._tcp_ssl_enabled)
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # TCP
+            # batches are written in one go, there is nothing to coalesce
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self._tcp_sndbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self._tcp_sndbuf)
+            sock.connect((host, port))
+            if self._tcp_ssl_enabled:
+                self._logger.debug("SSL wrapping")
+                sock = ssl.wrap_socket(sock,
+                                       keyfile=self._tcp_ssl_key,
+                                       certfile=self._tcp_ssl_cert,
+                                       ssl_version=ssl.PROTOCOL_TLSv1,
+                                       ca_certs=self._tcp_ssl_cacert)
+
+        except Exception as e:
+            self._logger.error("Exception caught in socket connection to {0}:{1}: {2}".format(host, port, e))
+            return None
+        else:
+            self._logger.info("Connected to {0}:{1}".format(host, port))
+            return sock
+
+    def valid(self):
+        return any(endpoint.breaker.allow() for endpoint in self._endpoints)
 
     def reconnect(self):
-        self._connect()
+        # endpoints reconnect on their own, this only waits for one of them
+        if not self.valid():
+            raise TransportException('Cannot connect to any of {0}'.format(self._tcp_host))
 
-    def invalidate(self):
-        """Invalidates the current transport"""
-        super(TcpTransport, self).invalidate()
-        self._sock.close()
+    def interrupt(self):
+        for endpoint in self._endpoints:
+            endpoint.invalidate()
 
     def callback(self, filename, lines, **kwargs):
         timestamp = self.get_timestamp(**kwargs)
         if kwargs.get('timestamp', False):
             del kwargs['timestamp']
 
-        try:
-            for line in lines:
-                self._sock.send(self.format(filename, line, timestamp, **kwargs) + "\n")
-        except socket.error, e:
-            self.invalidate()
+        lines = self.format_batch(filename, lines, timestamp, **kwargs)
+        if self._codec is not None:
+            payload = self.compress_batch(lines)
+        else:
+            payload = join_lines(lines)
 
-            if isinstance(e.args, tuple):
-                if e[0] == errno.EPIPE:
-                    raise TransportException('Connection appears to have been lost')
+        for endpoint in self._balance():
+            with self._lock:
+                endpoint.sending += 1
 
-            raise TransportException('Socket Error: %s', e.args)
-        except Exception:
-            self.invalidate()
+            try:
+                error = self._send_to(endpoint, payload)
+            finally:
+                with self._lock:
+                    endpoint.sending -= 1
 
-            raise TransportException('Unspecified exception encountered')  # TRAP ALL THE THINGS!
+            if error is None:
+                endpoint.breaker.success()
+                return
+
+            endpoint.breaker.failure(error)
+
+        raise TransportException('No TCP host could take the batch')
+
+    def send_batch(self, filename, lines, **kwargs):
+        """Sends a batch from one of several ConcurrentSender threads, when
+        there are several hosts"""
+        self.callback(filename, lines, **kwargs)
+
+    def _balance(self):
+        """Returns the endpoints to try for a batch, in order of preference"""
+        with self._lock:
+            if self._tcp_balance == 'least_in_flight':
+                endpoints = sorted(self._endpoints, key=lambda endpoint: (endpoint.sending, endpoint.queued_bytes()))
+            else:
+                start = self._next % len(self._endpoints)
+                self._next = start + 1
+                endpoints = self._endpoints[start:] + self._endpoints[:start]
+
+        return [endpoint for endpoint in endpoints if endpoint.breaker.allow()]
+
+    def _send_to(self, endpoint, payload):
+        """Sends a batch to an endpoint, returning the error if it failed"""
+        with endpoint.lock:
+            if endpoint.sock is None:
+                return 'Not connected'
+
+            try:
+                self._send(endpoint, payload)
+            except socket.error, e:
+                if isinstance(e.args, tuple) and e[0] == errno.EPIPE:
+                    return 'Connection appears to have been lost'
+                return 'Socket Error: {0}'.format(e.args)
+            except Exception, e:
+                return 'Unspecified exception encountered: {0}'.format(e)  # TRAP ALL THE THINGS!
+
+        return None
+
+    def _send(self, endpoint, payload):
+        """Writes a whole batch, resuming after short writes"""
+        sent = 0
+        while sent < len(payload):
+            written = endpoint.sock.send(buffer(payload, sent))
+            self._incr('syscalls')
+            if not written:
+                raise socket.error(errno.EPIPE, 'Connection closed')
+            sent += written
+
+        self._incr('batches')
+        self._incr('bytes', sent)
+        if len(self._endpoints) > 1:
+            self._incr('{0}.batches'.format(endpoint.name))
+        self._log_stats()
@@ -2,6 +2,14 @@
 import socket
 
 from beaver.transports.base_transport import BaseTransport
+from beaver.transports.exception import TransportException
+
+# uncompressed bytes per datagram, leaving room below the 65507 bytes
+# limit for the frame header and the overhead of incompressible data
+MAX_CHUNK_BYTES = 60000
+
+# max payload of an IPv4 UDP datagram
+MAX_DATAGRAM_BYTES = 65507
 
 
 class UdpTransport(BaseTransport):
@@ -18,5 +26,52 @@ class UdpTransport(BaseTransport):
         if kwargs.get('timestamp', False):
             del kwargs['timestamp']
 
+        lines = self.format_batch(filename, lines, timestamp, **kwargs)
+        try:
+            if self._codec is not None:
+                for chunk in self._chunks(filename, lines):
+                    self._sock.sendto(self.compress_batch(chunk), self._address)
+                return
+
+            for line in lines:
+                if _size(line) > MAX_DATAGRAM_BYTES:
+                    self._drop(filename, line, MAX_DATAGRAM_BYTES)
+                    continue
+                self._sock.sendto(line, self._address)
+        except socket.error as e:
+            raise TransportException('UDP error: {0}'.format(e))
+
+    def _chunks(self, filename, lines):
+        """Splits lines into chunks small enough to fit in a datagram once
+        compressed, even if they do not compress at all
+
+        Lines too long to fit in a chunk on their own are dropped
+        """
+        chunk = []
+        size = 0
         for line in lines:
-            self._sock.sendto(self.format(filename, line, timestamp, **kwargs), self._address)
+            line_size = _size(line) + 1
+            if line_size > MAX_CHUNK_BYTES:
+                self._drop(filename, line, MAX_CHUNK_BYTES)
+                continue
+
+            if chunk and size + line_size > MAX_CHUNK_BYTES:
+                yield chunk
+                chunk = []
+                size = 0
+
+            chunk.append(line)
+            size += line_size
+
+        if chunk:
+            yield chunk
+
+    def _drop(self, filename, line, limit):
+        self._logger.error('Dropping a line of {0} bytes from {1}, over the {2} bytes a datagram holds'.format(_size(line), filename, limit))
+
+
+def _size(line):
+    """Returns the length of a formatted line in utf-8 bytes"""
+    if isinstance(line, unicode):
+        return len(line.encode('utf-8'))
+    return len(line)
@@ -37,8 +37,13 @@ class ZmqTransport(BaseTransport):
         if kwargs.get('timestamp', False):
             del kwargs['timestamp']
 
+        lines = self.format_batch(filename, lines, timestamp, **kwargs)
+        if self._codec is not None:
+            self._pub.send(self.compress_batch(lines))
+            return
+
         for line in lines:
-            self._pub.send(self.format(filename, line, timestamp, **kwargs))
+            self._pub.send(line)
 
     def interrupt(self):
         self._pub.close()
@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import collections
-import datetime
 import errno
 import gzip
 import io
@@ -8,6 +7,7 @@ import os
 import sqlite3
 import time
 
+from beaver import timestamps
 from beaver.utils import IS_GZIPPED_FILE, REOPEN_FILES, multiline_merge
 from beaver.unicode_dammit import ENCODINGS
 from beaver.base_log import BaseLog
@@ -274,8 +274,7 @@ class Tail(BaseLog):
         self._sincedb_update_position()
 
     def _callback_wrapper(self, lines):
-        now = datetime.datetime.utcnow()
-        timestamp = now.strftime("%Y-%m-%dT%H:%M:%S") + ".%03d" % (now.microsecond / 1000) + "Z"
+        timestamp = timestamps.now()
         self._callback(('callback', {
             'fields': self._fields,
             'filename': self._filename,
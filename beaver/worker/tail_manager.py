@@ -13,16 +13,17 @@ from beaver.worker.tail import Tail
 
 class TailManager(BaseLog):
 
-    def __init__(self, beaver_config, queue_consumer_function, callback, logger=None):
+    def __init__(self, beaver_config, queue_consumer_function, callback, logger=None, number_of_consumers=None):
         super(TailManager, self).__init__(logger=logger)
         self._active = False
         self._beaver_config = beaver_config
         self._folder = self._beaver_config.get('path')
+        self._globbed = {}
         self._callback = callback
         self._create_queue_consumer = queue_consumer_function
         self._discover_interval = beaver_config.get('discover_interval', 15)
         self._log_template = "[TailManager] - {0}"
-        self._number_of_consumer_processes = int(self._beaver_config.get('number_of_consumer_processes'))
+        self._number_of_consumer_processes = number_of_consumers or int(self._beaver_config.get('number_of_consumer_processes'))
         self._proc = [None] * self._number_of_consumer_processes
         self._tails = {}
         self._update_time = None
@@ -56,7 +57,7 @@ class TailManager(BaseLog):
         for n in range(0,self._number_of_consumer_processes):
             if not (self._proc[n] and self._proc[n].is_alive()):
                 self._logger.debug("creating consumer process: " + str(n))
-                self._proc[n] = self._create_queue_consumer()
+                self._proc[n] = self._create_queue_consumer(n)
         timer = threading.Timer(interval, self.create_queue_consumer_if_required)
         timer.start()
 
@@ -100,8 +101,7 @@ class TailManager(BaseLog):
             for name, exclude in self._beaver_config.get('globs').items():
                 globbed = [os.path.realpath(filename) for filename in eglob(name, exclude)]
                 extend_files(globbed)
-                self._beaver_config.addglob(name, globbed)
-                self._callback(("addglob", (name, globbed)))
+                self._update_glob(name, globbed)
         else:
             append_files = files.append
             for name in self.listdir():
@@ -124,18 +124,41 @@ class TailManager(BaseLog):
         new_files = [fname for fid, fname in possible_files if fid not in self._tails]
         self.watch(new_files)
 
+    def _update_glob(self, name, globbed):
+        """Sends the files added to and removed from a glob since the last
+        discovery pass to the queue consumers"""
+        previous = self._globbed.get(name, set())
+        current = set(globbed)
+        self._globbed[name] = current
+
+        added = [filename for filename in globbed if filename not in previous]
+        removed = [filename for filename in previous if filename not in current]
+
+        if added:
+            self._beaver_config.addglob(name, added)
+            self._callback(("addglob", (name, added)))
+
+        if removed:
+            self._beaver_config.delglob(name, removed)
+            self._callback(("delglob", (name, removed)))
+
     def close(self, signalnum=None, frame=None):
         self._running = False
         """Closes all currently open Tail objects"""
         self._log_debug("Closing all tail objects")
         self._active = False
+        self._callback(("exit", ()))
         for fid in self._tails:
             self._tails[fid].close()
         for n in range(0,self._number_of_consumer_processes):
             if self._proc[n] is not None and self._proc[n].is_alive():
                 self._logger.debug("Terminate Process: " + str(n))
-                self._proc[n].terminate()
-                self._proc[n].join()
+                if hasattr(self._proc[n], 'terminate'):
+                    self._proc[n].terminate()
+                    self._proc[n].join()
+                else:
+                    # consumer threads stop on the exit command
+                    self._proc[n].join(self._beaver_config.get('wait_timeout'))
 
     @staticmethod
     def get_file_id(st):
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares the CPU cost and the bytes saved by each compression codec
+
+Compresses batches of json formatted access log lines with every codec
+available here, at several levels, and reports the CPU time spent per
+MB of input against the share of bytes saved.
+
+    python benchmarks/compression.py [--batch N] [--rounds N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from beaver.transports import compression
+from beaver.transports.base_transport import join_lines, json
+
+LEVELS = {
+    'zlib': [1, 6, 9],
+    'gzip': [1, 6, 9],
+    'lz4': [0, 9],
+    'zstd': [1, 3, 9, 19],
+}
+
+PATHS = ['/index.html', '/api/v1/orders', '/static/app.js', '/login', '/api/v1/cart']
+AGENTS = ['Mozilla/5.0 (X11; Linux x86_64)', 'curl/7.47.0', 'Mozilla/5.0 (iPhone; CPU iPhone OS 10_0 like Mac OS X)']
+
+
+def batch(size):
+    """Returns a batch of json events like the json format sends"""
+    lines = []
+    for n in range(size):
+        message = '10.0.{0}.{1} - - [10/Oct/2016:13:55:{2:02d} -0700] "GET {3} HTTP/1.1" 200 {4} "-" "{5}"'.format(
+            random.randint(0, 255), random.randint(0, 255), n % 60, random.choice(PATHS),
+            random.randint(100, 50000), random.choice(AGENTS))
+        lines.append(json.dumps({
+            'message': message,
+            '@timestamp': '2016-10-10T13:55:36.123Z',
+            '@version': 1,
+            'host': 'web-01.example.com',
+            'file': '/var/log/nginx/access.log',
+            'type': 'nginx',
+            'tags': ['web', 'prod'],
+        }))
+    return join_lines(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(0)
+    data = batch(args.batch)
+    megabytes = len(data) * args.rounds / 1024.0 / 1024.0
+
+    print('{0} byte batches of {1} lines\n'.format(len(data), args.batch))
+    print('{0:<6} {1:>5} {2:>12} {3:>8}  {4}'.format('codec', 'level', 'CPU ms/MB', 'saved', ''))
+    for name in ['zlib', 'gzip', 'lz4', 'zstd']:
+        if name not in compression.CODECS:
+            print('{0:<6} not available'.format(name))
+            continue
+
+        for level in LEVELS[name]:
+            codec = compression.get_codec(name, level)
+            start = time.clock()
+            for n in range(args.rounds):
+                compressed = compression.frame(codec, data)
+            cpu = (time.clock() - start) * 1000 / megabytes
+
+            saved = 1 - len(compressed) / float(len(data))
+            print('{0:<6} {1:>5} {2:>12.1f} {3:>7.1f}%  {4}'.format(name, level, cpu, saved * 100, '#' * int(saved * 50)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures how many lines per second transports format
+
+Formats batches of lines from a file section, line by line with
+BaseTransport.format and per batch with BaseTransport.format_batch,
+once per format and logstash_version.
+
+    python benchmarks/format.py [--lines N] [--batch N] [--format NAME ...]
+                                [--rawjson-passthrough]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from beaver.config import BeaverConfig
+from beaver.transports.base_transport import BaseTransport
+
+CONFIG = """[beaver]
+logstash_version: {version}
+format: {format}
+rawjson_passthrough: {passthrough}
+
+[{logfile}]
+type: benchmark
+tags: a,b
+add_field: app,beaver,env,benchmark
+"""
+
+LINE = '127.0.0.1 - - [10/Oct/2016:13:55:36 -0700] "GET /index.html HTTP/1.1" 200 2326 "-" "Mozilla/5.0"'
+RAWJSON_LINE = '{"level": "info", "msg": "GET /index.html", "status": 200, "bytes": 2326}'
+
+
+class Args(object):
+    mode = 'bind'
+    transport = 'stdout'
+
+    def __init__(self, config):
+        self.config = config
+
+
+def run(fmt, version, lines, batch, per_batch, passthrough=False):
+    tmpdir = tempfile.mkdtemp(prefix='beaver-benchmark-')
+    logfile = os.path.join(tmpdir, 'input.log')
+    config = os.path.join(tmpdir, 'beaver.ini')
+    open(logfile, 'w').close()
+    with open(config, 'w') as f:
+        f.write(CONFIG.format(version=version, format=fmt, logfile=logfile, passthrough=int(passthrough)))
+
+    beaver_config = BeaverConfig(Args(config))
+    transport = BaseTransport(beaver_config)
+    kwargs = {
+        'type': beaver_config.get_field('type', logfile),
+        'tags': beaver_config.get_field('tags', logfile),
+        'fields': beaver_config.get_field('fields', logfile),
+    }
+
+    line = RAWJSON_LINE if fmt == 'rawjson' else LINE
+    data = [line] * batch
+    timestamp = transport.get_timestamp()
+
+    start = time.time()
+    for n in range(lines // batch):
+        if per_batch:
+            transport.format_batch(logfile, data, timestamp, **kwargs)
+        else:
+            for line in data:
+                transport.format(logfile, line, timestamp, **kwargs)
+    elapsed = time.time() - start
+
+    os.unlink(logfile)
+    os.unlink(config)
+    os.rmdir(tmpdir)
+    return (lines // batch) * batch / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--format', nargs='+', default=['json', 'msgpack', 'string', 'raw', 'rawjson', 'gelf'])
+    parser.add_argument('--rawjson-passthrough', action='store_true')
+    args = parser.parse_args()
+
+    print('{0:<10} {1:>8} {2:>14} {3:>14}'.format('format', 'version', 'format lines/s', 'batch lines/s'))
+    for fmt in args.format:
+        for version in [0, 1]:
+            per_line = run(fmt, version, args.lines, args.batch, False, args.rawjson_passthrough)
+            per_batch = run(fmt, version, args.lines, args.batch, True, args.rawjson_passthrough)
+            print('{0:<10} {1:>8} {2:>14,.0f} {3:>14,.0f}'.format(fmt, version, per_line, per_batch))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares startup time and memory use of the pipeline modes
+
+Starts beaver once per pipeline_mode, tailing a temporary file with the
+stdout transport, and reports the time until the first line is shipped
+and the total RSS of the beaver process tree once it is running.
+
+Linux only, as memory use is read from /proc.
+
+    python benchmarks/pipeline_mode.py [--consumers N] [--transport NAME]
+"""
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CONFIG = """[beaver]
+logstash_version: 1
+transport: {transport}
+output: {output}
+pipeline_mode: {mode}
+number_of_consumer_processes: {consumers}
+discover_interval: 1
+
+[{logfile}]
+type: benchmark
+"""
+
+
+def process_tree(pid):
+    """Returns pid and the pids of all of its descendants"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{0}/stat'.format(entry)) as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (IOError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    pids = [pid]
+    for p in pids:
+        pids.extend(children.get(p, []))
+    return pids
+
+
+def rss_kb(pid):
+    try:
+        with open('/proc/{0}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return 0
+
+
+def run(mode, consumers, transport, timeout=60):
+    tmpdir = tempfile.mkdtemp(prefix='beaver-benchmark-')
+    try:
+        logfile = os.path.join(tmpdir, 'input.log')
+        output = os.path.join(tmpdir, 'output.log')
+        config = os.path.join(tmpdir, 'beaver.ini')
+        open(logfile, 'w').close()
+        open(output, 'w').close()
+        with open(config, 'w') as f:
+            f.write(CONFIG.format(transport=transport, output=output, mode=mode,
+                                  consumers=consumers, logfile=logfile))
+
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        devnull = open(os.devnull, 'w')
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bin', 'beaver'), '-c', config],
+                                env=env, stdout=devnull, stderr=devnull)
+
+        shipped = None
+        while time.time() - start < timeout:
+            with open(logfile, 'a') as f:
+                f.write('benchmark-marker\n')
+            time.sleep(0.05)
+            with open(output) as f:
+                if 'benchmark-marker' in f.read():
+                    shipped = time.time() - start
+                    break
+
+        # let every consumer finish starting before measuring memory
+        time.sleep(2)
+        pids = process_tree(proc.pid)
+        rss = sum(rss_kb(pid) for pid in pids)
+
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+        return shipped, len(pids), rss
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--consumers', type=int, default=1)
+    parser.add_argument('--transport', default='stdout')
+    args = parser.parse_args()
+
+    print('{0:<10} {1:>16} {2:>10} {3:>10}'.format('mode', 'first line (s)', 'processes', 'RSS (MB)'))
+    for mode in ['processes', 'threads']:
+        shipped, processes, rss = run(mode, args.consumers, args.transport)
+        shipped = '{0:.2f}'.format(shipped) if shipped is not None else 'timeout'
+        print('{0:<10} {1:>16} {2:>10} {3:>10.1f}'.format(mode, shipped, processes, rss / 1024.0))
+
+
+if __name__ == '__main__':
+    main()